@@ -0,0 +1,71 @@
+"""Compares full-resolution and coarse-to-fine pyramid board detection: time, boards found and corner error.
+
+usage:
+    benchmark_detection.py -f <image_folder_target> [-k <chessboard|charuco>] [-w <width_cols>]
+    [-r <height_rows>] [-s <square_size>] [-m <marker_size>] [-d <dictionary>] [-p <pyramid_levels>]
+"""
+
+import argparse
+import time
+import numpy as np
+
+from loci.data_collection.frame_io import iter_frames
+from loci.camera_calibration.detection import BoardParams, detect_gray, detect_raw_pyramid, frame_to_gray
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pyramid board detection against the full-resolution path",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, required=True, action="store", help="Path to image targets")
+    parser.add_argument("-k", "--kind", type=str, default="chessboard", choices=("chessboard", "charuco"), action="store", help="Board type")
+    parser.add_argument("-w", "--width_cols", type=int, default=11, action="store", help="Number of columns on board")
+    parser.add_argument("-r", "--height_rows", type=int, default=8, action="store", help="Number of rows on board")
+    parser.add_argument("-s", "--square_size", type=float, default=20., action="store", help="Square size in [units] on board")
+    parser.add_argument("-m", "--marker_size", type=float, default=15., action="store", help="Marker size in [units] on board")
+    parser.add_argument("-d", "--dictionary", type=int, default=15, action="store", help="Aruco dictionary id")
+    parser.add_argument("-p", "--pyramid", type=int, default=1, action="store", help="Pyramid levels for the coarse detection")
+    args = parser.parse_args()
+
+    params = BoardParams(args.kind, args.width_cols, args.height_rows, args.square_size,
+                         args.marker_size if args.kind == "charuco" else 0.,
+                         args.dictionary if args.kind == "charuco" else -1)
+
+    full_times, pyr_times, errors = [], [], []
+    found_full = found_pyr = 0
+    for fname, raw in iter_frames(args.file_target):
+        raw = np.asarray(raw)
+        start = time.perf_counter()
+        corners_f, ids_f = detect_gray(frame_to_gray(raw), params)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        corners_p, ids_p = detect_raw_pyramid(raw, params, levels=args.pyramid)
+        pyr_times.append(time.perf_counter() - start)
+
+        found_full += corners_f is not None
+        found_pyr += corners_p is not None
+        if corners_f is None or corners_p is None:
+            continue
+        # compare corners with matching ids
+        full = dict(zip(ids_f.ravel().tolist(), corners_f.reshape(-1, 2)))
+        for i, c in zip(ids_p.ravel().tolist(), corners_p.reshape(-1, 2)):
+            if i in full:
+                errors.append(np.linalg.norm(full[i] - c))
+
+    n = len(full_times)
+    if n == 0:
+        print("No frames found.")
+        return
+    full_ms = 1e3 * np.mean(full_times)
+    pyr_ms = 1e3 * np.mean(pyr_times)
+    print(f"{n} frames")
+    print(f"full resolution: {full_ms:8.1f} ms/image, {found_full} boards found")
+    print(f"pyramid ({args.pyramid}):    {pyr_ms:8.1f} ms/image, {found_pyr} boards found")
+    print(f"speedup: {full_ms / pyr_ms:.2f}x")
+    if len(errors) > 0:
+        errors = np.asarray(errors)
+        print(f"corner difference over {len(errors)} corners: rms {np.sqrt(np.mean(errors ** 2)):.3f} px, max {errors.max():.3f} px")
+
+
+if __name__ == "__main__":
+    main()
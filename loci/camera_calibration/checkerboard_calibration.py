@@ -9,6 +9,7 @@ The calibrated parameters can then be fed into localization schema or post-proce
 usage:
     checkerboard_calibration.py [-f <image_folder_target>] [-w <width_cols>] [-h <height_rows>]
     [-s <square_size>] [-m <marker_size>] [-d <dictionary_name>] [-v <verbose_show_image>]
+    [-c <detection_cache_folder>] [-j <workers>] [-n <num_views>] [-p <pyramid_levels>]
 
 default values:
     ${OUTPUT_DIR}/calib_images for image targets
@@ -18,6 +19,10 @@ default values:
     15 marker size
     DICT_7x7_1000
     verbose (show image) false
+    ${image_folder_target}/.detection_cache for detection cache
+    all cores for detection
+    all views
+    0 pyramid levels (full resolution detection)
 
 """
 
@@ -31,11 +36,16 @@ import matplotlib.pyplot as plt
 
 from cv2 import aruco
 
+from loci.data_collection.frame_io import load_named_frame
+from loci.camera_calibration.view_selection import select_views
+from loci.camera_calibration.detection import BoardParams, detect_all, make_charuco_board
+from loci.imaging.bayer import demosaic, to_uint8
+
 
 def main():
     parser = argparse.ArgumentParser(description="Process image folder target for calibration",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-f", "--file_target", type=str, default=os.path.join(os.getenv("OUTPUT_DIR"), "calib_images"), action="store", help="Path to image targets")
+    parser.add_argument("-f", "--file_target", type=str, default=os.path.join(os.getenv("OUTPUT_DIR"), "calib_images"), action="store", help="Path to image targets (folder of .npy frames or frame container)")
     parser.add_argument("-w", "--width_cols", type=int, default=11, action="store", help="Number of columns on Charuco board")
     parser.add_argument("-r", "--height_rows", type=int, default=8, action="store", help="Number of rows on Charuco board")
     parser.add_argument("-s", "--square_size", type=float, default=20., action="store", help="Square size in [units] on board")
@@ -45,6 +55,10 @@ def main():
                                                                           "DICT_6X6_100=9, DICT_6X6_250=10, DICT_6X6_1000=11, DICT_7X7_50=12, DICT_7X7_100=13," \
                                                                           "DICT_7X7_250=14, DICT_7X7_1000=15, DICT_ARUCO_ORIGINAL = 16")
     parser.add_argument("-v", "--verbose", type=bool, action="store", default=False, help="Whether to render images to screen.")
+    parser.add_argument("-c", "--cache", type=str, default="", action="store", help="Detection cache folder; defaults to .detection_cache in the image target folder")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), action="store", help="Number of detection processes")
+    parser.add_argument("-p", "--pyramid", type=int, default=0, action="store", help="Detect on the raw Bayer frame binned and downscaled this many levels, refining corners at full resolution (0 detects at full resolution)")
+    parser.add_argument("-n", "--num_views", type=int, default=0, action="store", help="Number of views to calibrate with, chosen for image coverage and pose diversity (0 uses all)")
 
 
     # Get the user arguments
@@ -58,37 +72,19 @@ def main():
     dictionary = args.dictionary
     verbose = args.verbose
 
-    # Set up the board object and detector
-    aruco_dict = aruco.getPredefinedDictionary(dictionary)
+    # Set up the board object
+    params = BoardParams("charuco", cols, rows, square_size, marker_size, dictionary)
+    board = make_charuco_board(params)
 
-    board_size = (cols, rows)
-    board = aruco.CharucoBoard(board_size, square_size, marker_size, aruco_dict)
-    board.setLegacyPattern(True)  # for use with calib.io targets and all other legacy generators
-    
-    char_params = aruco.CharucoParameters()
-    char_params.tryRefineMarkers = True
-    detect_params = aruco.DetectorParameters()
-    refine_params = aruco.RefineParameters()
-    detector = aruco.CharucoDetector(board, char_params, detect_params, refine_params)
+    # Detect the board in images in the target folder (cached, in parallel)
+    cache_dir = args.cache if args.cache != "" else os.path.join(target_path, ".detection_cache")
+    detections = detect_all(target_path, params, workers=args.workers, cache_dir=cache_dir, pyramid=args.pyramid)
 
-    # Parse images in the target folder
     all_objs = []
     all_pts = []
     fnames = []
-    for fname in os.listdir(target_path):
-        if ".npy" in fname:
-            # convert to an image
-            array_target = np.load(os.path.join(target_path, fname))
-            frame_transport = cv2.cvtColor(array_target, cv2.COLOR_BAYER_GR2RGB) # converts to an opencv color type that renders
-            img = cv2.normalize(frame_transport, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-        else:
-            img = None
-        if img is None:
-            print(f"No valid image at {fname}, skipping.")
-            continue
-
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        corners, ids, _, _ = detector.detectBoard(gray)
+    for detection in detections:
+        fname, corners, ids = detection.name, detection.corners, detection.ids
         if corners is None:
             print(f"No board found in image {fname}, skipping.")
             continue
@@ -99,19 +95,34 @@ def main():
         obj_pts, img_pts = board.matchImagePoints(corners, ids)
         all_objs.append(obj_pts)
         all_pts.append(img_pts)
+        image_size = detection.image_size
 
         # Show these steps for each image if verbose output wanted
         if verbose is True:
-            detections = aruco.drawDetectedCornersCharuco(img.copy(), corners, ids)
+            array_target = load_named_frame(target_path, fname)
+            img = to_uint8(demosaic(array_target)) # converts to an opencv color type that renders
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            drawn = aruco.drawDetectedCornersCharuco(img.copy(), corners, ids)
             cv2.imshow("Original Image", img)
             cv2.waitKey(0)
             cv2.imshow("Grayscale Image", gray)
             cv2.waitKey(0)
-            cv2.imshow("Detections", detections)
+            cv2.imshow("Detections", drawn)
             cv2.waitKey(0)
     
+    if len(all_pts) == 0:
+        print(f"No boards found in {target_path}, cannot calibrate.")
+        return
+
+    # Choose the subset of views that best covers the image and pose space
+    keep = select_views(all_objs, all_pts, image_size, target_count=args.num_views)
+    all_objs = [all_objs[i] for i in keep]
+    all_pts = [all_pts[i] for i in keep]
+    fnames = [fnames[i] for i in keep]
+    print(f"Calibrating with {len(keep)} views.")
+
     # Calibrate
-    rms, K, dist_coeffs, rvecs, tvecs, stdev_intr, stdev_extr, view_errors = cv2.calibrateCameraExtended(all_objs, all_pts, gray.shape[::-1], None, None)
+    rms, K, dist_coeffs, rvecs, tvecs, stdev_intr, stdev_extr, view_errors = cv2.calibrateCameraExtended(all_objs, all_pts, image_size, None, None)
     print(f"RMS: {rms}")
     print(f"Camera Matrix: {K}")
     print(f"Distortion Coeffs: {dist_coeffs.ravel()}")
@@ -0,0 +1,194 @@
+"""Parallel, cached calibration target detection shared by the calibration scripts."""
+
+import os
+import hashlib
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from cv2 import aruco
+
+from loci.data_collection.frame_io import list_frames, load_named_frame
+from loci.imaging.bayer import as_2d, bin_gray, demosaic, to_uint8
+
+
+class BoardParams(NamedTuple):
+    """Calibration target description; part of every cache key."""
+    kind: str  # "charuco" or "chessboard"
+    cols: int
+    rows: int
+    square_size: float
+    marker_size: float = 0.
+    dictionary: int = -1
+
+
+class Detection(NamedTuple):
+    """Board detection for one frame. corners is None if no board was found."""
+    name: str
+    corners: Optional[np.ndarray]
+    ids: Optional[np.ndarray]
+    image_size: tuple  # (width, height)
+
+
+def frame_to_gray(array_target: np.ndarray) -> np.ndarray:
+    """Demosaic and normalize a raw frame to the 8-bit gray image used for detection."""
+    img = to_uint8(demosaic(array_target))
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def make_charuco_board(params: BoardParams):
+    aruco_dict = aruco.getPredefinedDictionary(params.dictionary)
+    board = aruco.CharucoBoard((params.cols, params.rows), params.square_size, params.marker_size, aruco_dict)
+    board.setLegacyPattern(True)  # for use with calib.io targets and all other legacy generators
+    return board
+
+
+_detectors = {}  # per-process detector objects, keyed by board parameters
+
+
+def _charuco_detector(params: BoardParams):
+    if params not in _detectors:
+        char_params = aruco.CharucoParameters()
+        char_params.tryRefineMarkers = True
+        detect_params = aruco.DetectorParameters()
+        refine_params = aruco.RefineParameters()
+        _detectors[params] = aruco.CharucoDetector(make_charuco_board(params), char_params, detect_params, refine_params)
+    return _detectors[params]
+
+
+def detect_gray(gray: np.ndarray, params: BoardParams):
+    """Detects the board in a gray image. Returns (corners, ids), both None if not found."""
+    if params.kind == "charuco":
+        corners, ids, _, _ = _charuco_detector(params).detectBoard(gray)
+        if corners is None:
+            return None, None
+        return corners, ids
+
+    board_size = (params.cols, params.rows)
+    ret, corners = cv2.findChessboardCorners(gray, board_size, None)
+    if ret is not True:
+        return None, None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    corners = cv2.cornerSubPix(gray, corners, (11,11), (-1,-1), criteria)
+    return corners, np.arange(len(corners), dtype=np.int32).reshape(-1, 1)
+
+
+def refine_patches(raw: np.ndarray, corners: np.ndarray, win: int = 11) -> np.ndarray:
+    """Refines approximate full-resolution corners with cornerSubPix (half window win) on demosaiced patches."""
+    raw = as_2d(raw)
+    h, w = raw.shape
+    half = (win + 7) // 2 * 2  # even, so patches keep the Bayer phase of the full frame
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    refined = corners.reshape(-1, 2).copy()
+    for k, (x, y) in enumerate(corners.reshape(-1, 2)):
+        x0 = int(np.clip(int(x) // 2 * 2 - half, 0, w - 2 * half))
+        y0 = int(np.clip(int(y) // 2 * 2 - half, 0, h - 2 * half))
+        patch = demosaic(raw[y0:y0 + 2 * half, x0:x0 + 2 * half])
+        patch = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        pt = np.array([[[x - x0, y - y0]]], dtype=np.float32)
+        pt = cv2.cornerSubPix(patch, pt, (win, win), (-1,-1), criteria)
+        refined[k] = pt.reshape(2) + (x0, y0)
+    return refined.reshape(corners.shape)
+
+
+def detect_raw_pyramid(raw: np.ndarray, params: BoardParams, levels: int = 1):
+    """Coarse-to-fine detection from a raw Bayer frame. Returns (corners, ids) in full-resolution pixels."""
+    coarse = to_uint8(bin_gray(raw))
+    for _ in range(levels - 1):
+        coarse = cv2.pyrDown(coarse)
+
+    if params.kind == "charuco":
+        corners, ids, _, _ = _charuco_detector(params).detectBoard(coarse)
+    else:
+        ret, corners = cv2.findChessboardCorners(coarse, (params.cols, params.rows), None)
+        corners = corners if ret is True else None
+        ids = None if corners is None else np.arange(len(corners), dtype=np.int32).reshape(-1, 1)
+    if corners is None:
+        return None, None
+
+    # the 2x2 binning maps x_full = 2 * x + 0.5; each pyrDown is centred on 2 * x (no shift)
+    factor = 2 ** levels
+    corners = corners * factor + 0.5
+    return refine_patches(raw, corners.astype(np.float32)), ids
+
+
+##############
+# Cache
+##############
+
+
+def cache_key(array_target: np.ndarray, params: BoardParams, pyramid: int = 0) -> str:
+    """Hash of the frame content, the board parameters, and the detection path."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((array_target.shape, array_target.dtype.str, tuple(params))).encode("utf-8"))
+    if pyramid > 0:
+        h.update(f"pyramid{pyramid}".encode("utf-8"))
+    h.update(np.ascontiguousarray(array_target).data)
+    return h.hexdigest()
+
+
+def load_cached(cache_dir: str, key: str, name: str) -> Optional[Detection]:
+    fpath = os.path.join(cache_dir, key + ".npz")
+    if not os.path.exists(fpath):
+        return None
+    data = np.load(fpath)
+    image_size = tuple(int(v) for v in data["image_size"])
+    if bool(data["found"]) is False:
+        return Detection(name, None, None, image_size)
+    return Detection(name, data["corners"], data["ids"], image_size)
+
+
+def store_cached(cache_dir: str, key: str, detection: Detection):
+    found = detection.corners is not None
+    corners = detection.corners if found else np.zeros((0, 1, 2), np.float32)
+    ids = detection.ids if found else np.zeros((0, 1), np.int32)
+    tmp = os.path.join(cache_dir, f"{key}.{os.getpid()}.tmp.npz")
+    np.savez(tmp, corners=corners, ids=ids, found=found, image_size=np.asarray(detection.image_size))
+    os.replace(tmp, os.path.join(cache_dir, key + ".npz"))  # atomic, safe across worker processes
+
+
+##############
+# Detection stage
+##############
+
+
+def detect_frame(target_path: str, name: str, params: BoardParams, cache_dir: Optional[str] = None,
+                 pyramid: int = 0) -> Detection:
+    """Worker: loads one frame and detects the board, going through the cache if given."""
+    array_target = load_named_frame(target_path, name)
+    key = None
+    if cache_dir is not None:
+        key = cache_key(array_target, params, pyramid)
+        cached = load_cached(cache_dir, key, name)
+        if cached is not None:
+            return cached
+
+    corners, ids = None, None
+    if pyramid > 0:
+        corners, ids = detect_raw_pyramid(array_target, params, levels=pyramid)
+    if corners is None:
+        # full-resolution path, also the fallback when the coarse level misses the board
+        corners, ids = detect_gray(frame_to_gray(array_target), params)
+    detection = Detection(name, corners, ids, (array_target.shape[1], array_target.shape[0]))
+    if key is not None:
+        store_cached(cache_dir, key, detection)
+    return detection
+
+
+def detect_all(target_path: str, params: BoardParams, names: Optional[list] = None, workers: int = None,
+               cache_dir: Optional[str] = None, pyramid: int = 0) -> list:
+    """Detects the board in every (or every named) frame across a process pool. Returns a Detection per name."""
+    if names is None:
+        names = list_frames(target_path)
+    if workers is None:
+        workers = os.cpu_count()
+    if cache_dir is not None and os.path.exists(cache_dir) is False:
+        os.makedirs(cache_dir)
+
+    n = len(names)
+    if workers <= 1 or n < 2:
+        return [detect_frame(target_path, name, params, cache_dir, pyramid) for name in names]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(detect_frame, [target_path] * n, names, [params] * n, [cache_dir] * n, [pyramid] * n,
+                             chunksize=max(1, n // (workers * 4))))
@@ -8,7 +8,8 @@ The calibrated parameters can then be fed into localization schema or post-proce
 
 usage:
     flat_checkerboard_calibration.py [-f <image_folder_target>] [-w <width_cols>] [-r <height_rows>]
-    [-s <square_size>] [-v <verbose_show_image>]
+    [-s <square_size>] [-v <verbose_show_image>] [-c <detection_cache_folder>] [-j <workers>]
+    [-n <num_views>] [-p <pyramid_levels>]
 
 default values:
     ${OUTPUT_DIR}/calib_images for image targets
@@ -16,6 +17,10 @@ default values:
     8 rows
     20 square size
     verbose (show image) false
+    ${image_folder_target}/.detection_cache for detection cache
+    all cores for detection
+    30 views
+    0 pyramid levels (full resolution detection)
 
 """
 
@@ -29,15 +34,24 @@ import matplotlib.pyplot as plt
 
 from cv2 import aruco
 
+from loci.data_collection.frame_io import load_named_frame
+from loci.camera_calibration.view_selection import select_views
+from loci.camera_calibration.detection import BoardParams, detect_all
+from loci.imaging.bayer import demosaic, to_uint8
+
 
 def main():
     parser = argparse.ArgumentParser(description="Process image folder target for calibration",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-f", "--file_target", type=str, default=os.path.join(os.getenv("OUTPUT_DIR"), "calib_images"), action="store", help="Path to image targets")
+    parser.add_argument("-f", "--file_target", type=str, default=os.path.join(os.getenv("OUTPUT_DIR"), "calib_images"), action="store", help="Path to image targets (folder of .npy frames or frame container)")
     parser.add_argument("-w", "--width_cols", type=int, default=11, action="store", help="Number of columns on Charuco board")
     parser.add_argument("-r", "--height_rows", type=int, default=8, action="store", help="Number of rows on Charuco board")
     parser.add_argument("-s", "--square_size", type=float, default=20., action="store", help="Square size in [units] on board")
     parser.add_argument("-v", "--verbose", type=bool, action="store", default=False, help="Whether to render images to screen.")
+    parser.add_argument("-c", "--cache", type=str, default="", action="store", help="Detection cache folder; defaults to .detection_cache in the image target folder")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), action="store", help="Number of detection processes")
+    parser.add_argument("-p", "--pyramid", type=int, default=0, action="store", help="Detect on the raw Bayer frame binned and downscaled this many levels, refining corners at full resolution (0 detects at full resolution)")
+    parser.add_argument("-n", "--num_views", type=int, default=30, action="store", help="Number of views to calibrate with, chosen for image coverage and pose diversity (0 uses all)")
 
 
     # Get the user arguments
@@ -49,34 +63,23 @@ def main():
     square_size = args.square_size 
     verbose = args.verbose
 
-    # Set up the board object and detector
+    # Set up the board object
+    params = BoardParams("chessboard", cols, rows, square_size)
     board_size = (cols, rows)
     objp = np.zeros((board_size[0] * board_size[1], 3), np.float32)
     objp[:,:2] = np.mgrid[0:board_size[0], 0:board_size[1]].T.reshape(-1, 2)
     objp = objp * square_size
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
 
-    # Parse images in the target folder
+    # Detect the board in images in the target folder (cached, in parallel)
+    cache_dir = args.cache if args.cache != "" else os.path.join(target_path, ".detection_cache")
+    detections = detect_all(target_path, params, workers=args.workers, cache_dir=cache_dir, pyramid=args.pyramid)
+
     all_objs = []
     all_pts = []
     fnames = []
-    fpaths = os.listdir(target_path)
-    imgs_to_process = np.random.choice(fpaths, 50, replace=False)
-    for fname in imgs_to_process:
-        if ".npy" in fname:
-            # convert to an image
-            array_target = np.load(os.path.join(target_path, fname))
-            frame_transport = cv2.cvtColor(array_target, cv2.COLOR_BAYER_GR2RGB) # converts to an opencv color type that renders
-            img = cv2.normalize(frame_transport, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-        else:
-            img = None
-        if img is None:
-            print(f"No valid image at {fname}, skipping.")
-            continue
-
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        ret, corners = cv2.findChessboardCorners(gray, board_size, None)#, cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_FAST_CHECK + cv2.CALIB_CB_NORMALIZE_IMAGE)
-        if ret is not True:
+    for detection in detections:
+        fname, corners2 = detection.name, detection.corners
+        if corners2 is None:
             print(f"No board found in image {fname}, skipping.")
             continue
         else:
@@ -84,21 +87,35 @@ def main():
         
         fnames.append(fname)  # keep a record of the exact files, and order, processed
         all_objs.append(objp)
-        corners2 = cv2.cornerSubPix(gray, corners, (11,11), (-1,-1), criteria)
         all_pts.append(corners2)
+        image_size = detection.image_size
 
         # Show these steps for each image if verbose output wanted
         if verbose is True:
-            detections = cv2.drawChessboardCorners(img.copy(), board_size, corners2, ret)
+            array_target = load_named_frame(target_path, fname)
+            img = to_uint8(demosaic(array_target)) # converts to an opencv color type that renders
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            drawn = cv2.drawChessboardCorners(img.copy(), board_size, corners2, True)
             cv2.imshow("Original Image", img)
             cv2.waitKey(0)
             cv2.imshow("Grayscale Image", gray)
             cv2.waitKey(0)
-            cv2.imshow("Detections", detections)
+            cv2.imshow("Detections", drawn)
             cv2.waitKey(0)
     
+    if len(all_pts) == 0:
+        print(f"No boards found in {target_path}, cannot calibrate.")
+        return
+
+    # Choose the subset of views that best covers the image and pose space
+    keep = select_views(all_objs, all_pts, image_size, target_count=args.num_views)
+    all_objs = [all_objs[i] for i in keep]
+    all_pts = [all_pts[i] for i in keep]
+    fnames = [fnames[i] for i in keep]
+    print(f"Calibrating with {len(keep)} views.")
+
     # Calibrate
-    rms, K, dist_coeffs, rvecs, tvecs, stdev_intr, stdev_extr, view_errors = cv2.calibrateCameraExtended(all_objs, all_pts, gray.shape[::-1], None, None)
+    rms, K, dist_coeffs, rvecs, tvecs, stdev_intr, stdev_extr, view_errors = cv2.calibrateCameraExtended(all_objs, all_pts, image_size, None, None)
     print(f"RMS: {rms}")
     print(f"Camera Matrix: {K}")
     print(f"Distortion Coeffs: {dist_coeffs.ravel()}")
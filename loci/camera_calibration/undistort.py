@@ -0,0 +1,158 @@
+"""Batch undistortion of survey frames using a calibration_matrix.yaml.
+
+Raw frames are demosaiced and scaled like image_npy_to_png.py before remapping; existing
+uncropped .png/.jpg/.tif images are remapped as they are.
+
+usage:
+    undistort.py -c <calibration_yaml> -f <image_folder_target> -w <write_target>
+    [-a <alpha>] [-j <threads>] [--crop]
+"""
+
+import argparse
+import os
+import hashlib
+import time
+import threading
+import yaml
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Tuple
+
+from loci.data_collection.frame_io import list_frames, load_named_frame
+from loci.imaging.bayer import demosaic
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+OUTPUT_PREFIX = "undistorted_"
+
+
+def load_calibration(calib_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Camera matrix and distortion coefficients from a calibration_matrix.yaml."""
+    with open(calib_path, "r") as f:
+        data = yaml.safe_load(f)
+    return np.asarray(data["camera_matrix"], dtype=np.float64), np.asarray(data["dist_coeff"], dtype=np.float64)
+
+
+class UndistortMaps:
+    """Fixed-point remap tables for one calibration, frame size and alpha."""
+
+    def __init__(self, K: np.ndarray, dist: np.ndarray, size: Tuple[int, int], alpha: float = 0.,
+                 cache_dir: str = ""):
+        self.size = tuple(size)  # (width, height)
+        key = hashlib.blake2b(np.ascontiguousarray(K).tobytes() + np.ascontiguousarray(dist).tobytes() +
+                              repr((self.size, float(alpha))).encode("utf-8"), digest_size=16).hexdigest()
+        cache_file = os.path.join(cache_dir, f"undistort_{key}.npz") if cache_dir != "" else ""
+
+        if cache_file != "" and os.path.exists(cache_file):
+            data = np.load(cache_file)
+            self.map1, self.map2 = data["map1"], data["map2"]
+            self.new_K, self.roi = data["new_K"], tuple(int(v) for v in data["roi"])
+            return
+
+        self.new_K, roi = cv2.getOptimalNewCameraMatrix(K, dist, self.size, alpha, self.size)
+        self.roi = tuple(int(v) for v in roi)
+        self.map1, self.map2 = cv2.initUndistortRectifyMap(K, dist, None, self.new_K, self.size, cv2.CV_16SC2)
+        if cache_file != "":
+            if os.path.exists(cache_dir) is False:
+                os.makedirs(cache_dir)
+            np.savez(cache_file, map1=self.map1, map2=self.map2, new_K=self.new_K, roi=np.asarray(self.roi))
+
+    def apply(self, img: np.ndarray, crop: bool = False) -> np.ndarray:
+        out = cv2.remap(img, self.map1, self.map2, cv2.INTER_LINEAR)
+        if crop is True:
+            x, y, wr, hr = self.roi
+            out = out[y:y+hr, x:x+wr]
+        return out
+
+
+def list_names(target_path: str) -> list:
+    """Names of raw frames and plain image files at target_path (undistorted outputs excluded), without loading them."""
+    names = list_frames(target_path)
+    if os.path.isdir(target_path):
+        with os.scandir(target_path) as entries:
+            names += [entry.name for entry in entries if entry.is_file() and
+                      entry.name.lower().endswith(IMAGE_EXTENSIONS) and not entry.name.startswith(OUTPUT_PREFIX)]
+    return names
+
+
+def load_image(target_path: str, name: str) -> np.ndarray:
+    """Loads a frame by name: raw frames demosaiced and scaled to 16 bits, image files as they are."""
+    if name.lower().endswith(IMAGE_EXTENSIONS):
+        img = cv2.imread(os.path.join(target_path, name), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise IOError(f"Could not read {name}")
+        return img
+    img = demosaic(load_named_frame(target_path, name))
+    return np.left_shift(img, 4, out=img)  # 12 to 16 bits, in place
+
+
+def undistort_batch(calib_path: str, target_path: str, write_path: str, alpha: float = 0., crop: bool = False,
+                    threads: int = None, cache_dir: str = "") -> list:
+    """Undistorts every frame at target_path into write_path. Returns a list of (name, error) failures."""
+    if threads is None:
+        threads = os.cpu_count()
+    if cache_dir == "":
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(calib_path)), "undistort_maps")
+    if os.path.exists(write_path) is False:
+        os.makedirs(write_path)
+    K, dist = load_calibration(calib_path)
+    maps = {}  # one set of maps per frame size
+    maps_lock = threading.Lock()
+
+    def _work(name):
+        img = load_image(target_path, name)
+        size = (img.shape[1], img.shape[0])
+        with maps_lock:
+            if size not in maps:
+                maps[size] = UndistortMaps(K, dist, size, alpha=alpha, cache_dir=cache_dir)
+        out = maps[size].apply(img, crop=crop)
+        if not cv2.imwrite(os.path.join(write_path, f"{OUTPUT_PREFIX}{name.split('.')[0]}.png"), out):
+            raise IOError(f"Could not write undistorted {name}")
+
+    failures = []
+    count = 0
+
+    def _collect(future, name):
+        if future.exception() is not None:
+            failures.append((name, str(future.exception())))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        in_flight = {}
+        for name in list_names(target_path):  # listed up front, so frames written meanwhile are not picked up
+            count += 1
+            in_flight[pool.submit(_work, name)] = name
+            if len(in_flight) >= threads * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _collect(future, in_flight.pop(future))
+        for future, name in in_flight.items():
+            _collect(future, name)
+
+    elapsed = time.perf_counter() - start
+    done = count - len(failures)
+    print(f"Undistorted {done} frames in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.1f} frames/s).")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Undistort a folder or container of frames with a saved calibration",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-c", "--calibration", type=str, required=True, action="store", help="Path to calibration_matrix.yaml")
+    parser.add_argument("-f", "--file_target", type=str, required=True, action="store", help="Path to image targets (folder or frame container)")
+    parser.add_argument("-w", "--write_target", type=str, required=True, action="store", help="Folder to write undistorted png images to")
+    parser.add_argument("-a", "--alpha", type=float, default=0., action="store", help="Free scaling: 0 keeps only valid pixels, 1 keeps all source pixels")
+    parser.add_argument("-j", "--threads", type=int, default=os.cpu_count(), action="store", help="Number of remap threads")
+    parser.add_argument("-m", "--map_cache", type=str, default="", action="store", help="Folder for cached remap tables; defaults to undistort_maps next to the calibration")
+    parser.add_argument("--crop", action="store_true", help="Crop undistorted images to the valid pixel region")
+    args = parser.parse_args()
+
+    failures = undistort_batch(args.calibration, args.file_target, args.write_target, alpha=args.alpha, crop=args.crop,
+                               threads=args.threads, cache_dir=args.map_cache)
+    for name, error in failures:
+        print(f"Failed to undistort {name}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Coverage-driven selection of calibration views."""
+
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+
+def view_cells(img_pts: np.ndarray, image_size: Tuple[int, int], grid: Tuple[int, int]) -> np.ndarray:
+    """Flat indices of the occupancy grid cells touched by a view's corners."""
+    pts = img_pts.reshape(-1, 2)
+    cols = np.clip((pts[:, 0] * grid[0] / image_size[0]).astype(int), 0, grid[0] - 1)
+    rows = np.clip((pts[:, 1] * grid[1] / image_size[1]).astype(int), 0, grid[1] - 1)
+    return np.unique(rows * grid[0] + cols)
+
+
+def view_pose_bin(obj_pts: np.ndarray, img_pts: np.ndarray, image_size: Tuple[int, int],
+                  scale_bins: int = 3, tilt_threshold: float = 0.05) -> int:
+    """Coarse pose class of a view: scale bin x horizontal tilt x vertical tilt."""
+    obj = obj_pts.reshape(-1, 3)[:, :2].astype(np.float64)
+    pts = img_pts.reshape(-1, 2).astype(np.float64)
+
+    hull = cv2.convexHull(pts.astype(np.float32))
+    scale = np.sqrt(cv2.contourArea(hull) / float(image_size[0] * image_size[1]))
+    scale_bin = min(int(scale * scale_bins), scale_bins - 1)
+
+    if len(pts) < 4:
+        return scale_bin * 9 + 4  # too few corners (partial ChArUco) for a homography: untilted bin
+
+    # keystone terms of the homography from the centered board to the image
+    extent = np.ptp(obj, axis=0)
+    extent[extent == 0] = 1.
+    centered = (obj - obj.mean(axis=0)) / extent
+    H, _ = cv2.findHomography(centered, pts)
+    if H is None:
+        return scale_bin * 9 + 4
+    H = H / H[2, 2]
+    tilts = [0 if t < -tilt_threshold else (2 if t > tilt_threshold else 1) for t in (H[2, 0], H[2, 1])]
+    return scale_bin * 9 + tilts[0] * 3 + tilts[1]
+
+
+def select_views(obj_pts: List[np.ndarray], img_pts: List[np.ndarray], image_size: Tuple[int, int],
+                 target_count: int = 30, grid: Tuple[int, int] = (8, 6), pose_weight: float = 0.25) -> List[int]:
+    """Greedily chooses up to target_count views. Returns indices into the input lists, in pick order."""
+    n = len(img_pts)
+    if target_count <= 0 or target_count >= n:
+        return list(range(n))
+
+    cells = [view_cells(p, image_size, grid) for p in img_pts]
+    poses = np.array([view_pose_bin(o, p, image_size) for o, p in zip(obj_pts, img_pts)])
+    num_points = np.array([len(p.reshape(-1, 2)) for p in img_pts])
+
+    cell_hits = np.zeros(grid[0] * grid[1])
+    pose_hits = np.zeros(poses.max() + 1)
+    remaining = np.ones(n, dtype=bool)
+    chosen = []
+    for _ in range(target_count):
+        best, best_gain = -1, -1.
+        for i in np.flatnonzero(remaining):
+            # diminishing returns for cells and poses that are already covered
+            gain = np.sum(1. / (1. + cell_hits[cells[i]])) / len(cell_hits)
+            gain += pose_weight / (1. + pose_hits[poses[i]])
+            if gain > best_gain or (gain == best_gain and num_points[i] > num_points[best]):
+                best, best_gain = i, gain
+        chosen.append(int(best))
+        remaining[best] = False
+        cell_hits[cells[best]] += 1
+        pose_hits[poses[best]] += 1
+    return chosen
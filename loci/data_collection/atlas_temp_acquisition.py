@@ -1,7 +1,7 @@
 """Code to stream or log data from Atlas Scientific P1000 probe.
 
-Use: 
-python3 loci/data_collection/atlas_temp_acquisition.py  -r 5 -w ./output/test_temp_logging -n temp_test.txt
+Use:
+python3 loci/data_collection/atlas_temp_acquisition.py  -r 0.2 -w ./output/test_temp_logging -n temp_test.txt
 
 Adapted from Atlas Scientific Raspberry Pi Examples Code, uart.py
 """
@@ -15,109 +15,104 @@ import time
 import argparse
 from serial import SerialException
 
-def read_line():
-    """
-    taken from the ftdi library and modified to 
-    use the ezo line separator "\r"
-    """
-    lsl = len(b'\r')
-    line_buffer = []
-    while True:
-        next_char = ser.read(1)
-        if next_char == b'':
-            break
-        line_buffer.append(next_char)
-        if (len(line_buffer) >= lsl and
-                line_buffer[-lsl:] == [b'\r']):
-            break
-    return b''.join(line_buffer)
-    
-def read_lines():
-    """
-    also taken from ftdi lib to work with modified readline function
-    """
-    lines = []
-    try:
-        while True:
-            line = read_line()
-            if not line:
-                break
-                ser.flush_input()
-            lines.append(line)
-        return lines
-    
-    except SerialException as e:
-        print( "Error, ", e)
-        return None	
-
-def send_cmd(cmd):
-    """
-    Send command to the Atlas Sensor.
-    Before sending, add Carriage Return at the end of the command.
-    :param cmd:
-    :return:
-    """
-    buf = cmd + "\r"     	# add carriage return
-    try:
-        ser.write(buf.encode('utf-8'))
-        return True
-    except SerialException as e:
-        print ("Error, ", e)
-        return None
-            
+from loci.data_collection.ezo import EZOReader, DeadlineScheduler, TimingStats, BufferedSink, ProbeSimulator
+from loci.data_collection.ezo import RESPONSE_TIME, RESPONSE_TIMEOUT
+from loci.data_collection.timeseries_store import TimeSeriesWriter
+
+
+def print_stats(stats: TimingStats, scheduler: DeadlineScheduler):
+    report = stats.report()
+    print(f"{report['samples']} samples, cpu {report['cpu_percent']:.1f}%, "
+          f"jitter mean {report['jitter_mean_ms']:.2f} ms, p99 {report['jitter_p99_ms']:.2f} ms, "
+          f"max {report['jitter_max_ms']:.2f} ms, missed deadlines {scheduler.missed}")
+
+
+def log_probe(reader: EZOReader, sink: BufferedSink, rate: float, stats_interval: float = 60., duration: float = 0.,
+              store: TimeSeriesWriter = None, sensor_name: str = "temp", timeout: float = RESPONSE_TIMEOUT):
+    """Polls the probe at rate Hz and writes "<time_ns>,<reading>" lines until interrupted (or duration seconds)."""
+    period = 1. / rate
+    timeout = max(timeout, RESPONSE_TIME)  # a shorter wait would take each answer for the next query's
+    if period < RESPONSE_TIME:
+        print(f"The probe needs about {RESPONSE_TIME:g} s per reading; samples it cannot answer in time are skipped.")
+    reader.send_cmd("C,0") # turn off continuous mode
+    #clear all previous data
+    reader.drain(1.)
+    reader.ser.reset_input_buffer()
+
+    print("Polling sensor every %0.2f seconds, press ctrl-c to stop polling" % period)
+    scheduler = DeadlineScheduler(period)
+    stats = TimingStats()
+    last_report = time.monotonic()
+    while duration <= 0 or time.monotonic() - scheduler.start < duration:
+        stats.add(scheduler.wait())
+        data = reader.query("R", timeout=timeout)  # a slow answer overruns the next deadlines, which are skipped
+        response_time = time.time_ns()
+        if data is not None:
+            sink.write(str(response_time) + "," + data + "\n")
+            if store is not None:
+                store.add_reading(response_time, sensor_name, data)
+            print("Response at ", response_time, ": ", data)
+        if time.monotonic() - last_report >= stats_interval:
+            print_stats(stats, scheduler)
+            stats.reset()
+            last_report = time.monotonic()
+    print_stats(stats, scheduler)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Getting thermister recording information.")
     parser.add_argument("-w", "--write_path", type=str, action="store", default=os.getenv("OUTPUT_DIR"), help="Provide a target to write files")
     parser.add_argument("-n", "--file_name", type=str, action="store", default="temp_test.txt", help="Name of file to write temperature data")
-    parser.add_argument("-r", "--logging_rate", type=int, action="store", default=1, help="Rate at which to log temperature, Hz")
-    
+    parser.add_argument("-r", "--logging_rate", type=float, action="store", default=1., help="Rate at which to log temperature, Hz")
+    # to get a list of ports use the command:
+    # python -m serial.tools.list_ports
+    # in the terminal
+    parser.add_argument("-p", "--port", type=str, action="store", default="/dev/ttyUSB0", help="Serial port of the probe")
+    parser.add_argument("-b", "--baud", type=int, action="store", default=9600, help="Serial baud rate")
+    parser.add_argument("-f", "--flush_interval", type=float, action="store", default=5., help="Seconds between output file flushes")
+    parser.add_argument("-s", "--stats_interval", type=float, action="store", default=60., help="Seconds between timing/CPU reports")
+    parser.add_argument("-d", "--duration", type=float, action="store", default=0., help="Stop after this many seconds; 0 runs until ctrl-c")
+    parser.add_argument("-t", "--store", type=str, action="store", default="", help="Also append readings to this columnar time series store")
+    parser.add_argument("-sn", "--sensor_name", type=str, action="store", default="temp", help="Sensor name for readings in the store")
+    parser.add_argument("-rt", "--response_timeout", type=float, action="store", default=RESPONSE_TIMEOUT, help="Seconds to wait for each reading")
+    parser.add_argument("--simulate", action="store_true", help="Poll a simulated probe on a pseudo-terminal instead of the serial port")
+
     args = parser.parse_args()
     file_path = args.write_path
     file_target = os.path.join(file_path, args.file_name)
-    polling_rate = args.logging_rate
 
     # Make the write path target if it is not already in existence
     if os.path.exists(file_path) is False:
         os.makedirs(file_path)
 
-    # to get a list of ports use the command: 
-    # python -m serial.tools.list_ports
-    # in the terminal
-    usbport = '/dev/ttyUSB0' # change to match your pi's setup 
+    simulator = None
+    usbport = args.port
+    if args.simulate is True:
+        simulator = ProbeSimulator()
+        usbport = simulator.port
 
     print( "Opening serial port now...")
 
     try:
-        ser = serial.Serial(usbport, 9600, timeout=0)  # put in continuous mode
+        # a short timeout lets reads block in the kernel instead of spinning
+        ser = serial.Serial(usbport, args.baud, timeout=0.05)
     except serial.SerialException as e:
         print( "Error, ", e)
         sys.exit(0)
 
-    while True:
-        delaytime = float(polling_rate)
-    
-        send_cmd("C,0") # turn off continuous mode
-        #clear all previous data
-        time.sleep(1)
-        ser.flush()
-            
-        # get the information of the board you're polling
-        print("Polling sensor every %0.2f seconds, press ctrl-c to stop polling" % delaytime)
-    
-        try:
-            while True:
-                send_cmd("R")
-                lines = read_lines()
-                response_time = time.time_ns()
-                for i in range(len(lines)):
-                    # print lines[i]
-                    if lines[i][0] != b'*'[0]:
-                        data = str(lines[i].decode('utf-8')).strip("/n")
-                        with open(file_target, 'a') as f:
-                            data_string = str(response_time) + "," + str(data) + "\n"
-                            f.write(data_string)
-                        print("Response at ", response_time, ": ", data)
-                time.sleep(delaytime)
-
-        except KeyboardInterrupt: 		# catches the ctrl-c command, which breaks the loop above
-            print("Continuous polling stopped")
+    sink = BufferedSink(file_target, flush_interval=args.flush_interval)
+    store = TimeSeriesWriter(args.store, flush_interval=args.flush_interval) if args.store != "" else None
+    try:
+        log_probe(EZOReader(ser), sink, args.logging_rate, stats_interval=args.stats_interval, duration=args.duration,
+                  store=store, sensor_name=args.sensor_name, timeout=args.response_timeout)
+    except KeyboardInterrupt: 		# catches the ctrl-c command, which breaks the loop above
+        print("Continuous polling stopped")
+    except SerialException as e:
+        print("Error, ", e)
+    finally:
+        sink.close()
+        if store is not None:
+            store.close()
+        ser.close()
+        if simulator is not None:
+            simulator.close()
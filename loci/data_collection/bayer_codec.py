@@ -0,0 +1,140 @@
+"""Lossless storage codecs (.b12 files) for 12-bit Bayer frames."""
+
+import os
+import struct
+import zlib
+import numpy as np
+from typing import Callable, Tuple
+
+from loci.data_collection.frame_writer import FrameMeta, frame_basename, save_npy
+
+
+CODECS = ("npy", "pack12", "delta-zlib")  # plain uint16, 3 bytes per 2 pixels, row deltas + zlib
+CODEC_EXTENSION = ".b12"
+
+_MAGIC = b"LB12"
+_CODEC_IDS = {"pack12": 1, "delta-zlib": 2}
+_CODEC_NAMES = {v: k for k, v in _CODEC_IDS.items()}
+_MAX_12BIT = 4095
+
+
+##############
+# Bit packing
+##############
+
+
+def packed_size(num_pixels: int) -> int:
+    """Bytes needed to store num_pixels 12-bit values."""
+    return (num_pixels + 1) // 2 * 3
+
+
+def pack12(frame: np.ndarray) -> np.ndarray:
+    """Packs 12-bit values held in uint16 into a flat uint8 array, 3 bytes per 2 pixels."""
+    flat = np.ascontiguousarray(frame, dtype=np.uint16).reshape(-1)
+    if flat.size % 2 == 1:
+        flat = np.append(flat, np.uint16(0))
+    pairs = flat.reshape(-1, 2)
+    lo = pairs[:, 0]
+    hi = pairs[:, 1]
+    out = np.empty((pairs.shape[0], 3), dtype=np.uint8)
+    out[:, 0] = lo & 0xFF
+    out[:, 1] = (lo >> 8) | ((hi & 0x0F) << 4)
+    out[:, 2] = hi >> 4
+    return out.reshape(-1)
+
+
+def unpack12(packed: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """Inverse of pack12, returning a uint16 array of the given shape."""
+    num_pixels = int(np.prod(shape))
+    triples = np.frombuffer(packed, dtype=np.uint8, count=packed_size(num_pixels)).reshape(-1, 3).astype(np.uint16)
+    out = np.empty((triples.shape[0], 2), dtype=np.uint16)
+    out[:, 0] = triples[:, 0] | ((triples[:, 1] & 0x0F) << 8)
+    out[:, 1] = (triples[:, 1] >> 4) | (triples[:, 2] << 4)
+    return out.reshape(-1)[:num_pixels].reshape(shape)
+
+
+##############
+# Delta + entropy stage
+##############
+
+
+def delta_encode(frame: np.ndarray, level: int = 1) -> bytes:
+    """Row-wise delta against the previous pixel of the same Bayer colour, zigzagged and zlib compressed."""
+    img = np.asarray(frame, dtype=np.int32).reshape(frame.shape[0], -1)
+    delta = img.copy()
+    delta[:, 2:] -= img[:, :-2]
+    zigzag = ((delta << 1) ^ (delta >> 31)).astype(np.uint16)  # small magnitudes -> small codes
+    return zlib.compress(zigzag.tobytes(), level)
+
+
+def delta_decode(payload: bytes, shape: Tuple[int, ...]) -> np.ndarray:
+    """Inverse of delta_encode."""
+    rows = shape[0]
+    zigzag = np.frombuffer(zlib.decompress(payload), dtype=np.uint16).reshape(rows, -1).astype(np.int32)
+    delta = (zigzag >> 1) ^ -(zigzag & 1)
+    img = np.empty_like(delta)
+    img[:, 0::2] = np.cumsum(delta[:, 0::2], axis=1)
+    img[:, 1::2] = np.cumsum(delta[:, 1::2], axis=1)
+    return img.astype(np.uint16).reshape(shape)
+
+
+##############
+# Frame files
+##############
+
+
+def check_12bit(frame: np.ndarray):
+    """Packing is only lossless for values that fit in 12 bits."""
+    if frame.dtype != np.uint16 or int(frame.max()) > _MAX_12BIT:
+        raise ValueError("Frame does not hold 12-bit data in uint16, it cannot be packed losslessly.")
+
+
+def encode_frame(frame: np.ndarray, codec: str) -> bytes:
+    """Encodes a frame into a self-describing .b12 byte string."""
+    if codec not in _CODEC_IDS:
+        raise ValueError(f"Unknown codec {codec}, choose from {tuple(_CODEC_IDS)}")
+    check_12bit(frame)
+    header = struct.pack("<4sBB", _MAGIC, _CODEC_IDS[codec], frame.ndim) + struct.pack(f"<{frame.ndim}I", *frame.shape)
+    if codec == "pack12":
+        payload = pack12(frame).tobytes()
+    else:
+        payload = delta_encode(frame)
+    return header + payload
+
+
+def decode_frame(buf: bytes) -> np.ndarray:
+    """Decodes a .b12 byte string back into the original uint16 frame."""
+    magic, codec_id, ndim = struct.unpack_from("<4sBB", buf, 0)
+    if magic != _MAGIC:
+        raise ValueError("Not a packed Bayer frame.")
+    shape = struct.unpack_from(f"<{ndim}I", buf, 6)
+    payload = memoryview(buf)[6 + 4 * ndim:]
+    if _CODEC_NAMES[codec_id] == "pack12":
+        return unpack12(np.frombuffer(payload, dtype=np.uint8), shape)
+    return delta_decode(payload, shape)
+
+
+def load_frame(fpath: str) -> np.ndarray:
+    """Loads a frame saved as .npy or .b12."""
+    if fpath.endswith(CODEC_EXTENSION):
+        with open(fpath, "rb") as f:
+            return decode_frame(f.read())
+    return np.load(fpath)
+
+
+def is_frame_file(fname: str) -> bool:
+    """Whether fname is a saved raw frame in any supported format."""
+    return fname.endswith(".npy") or fname.endswith(CODEC_EXTENSION)
+
+
+def save_encoded(file_target: str, codec: str) -> Callable:
+    """Returns a FrameWriter save function that writes one encoded file per frame."""
+    if codec == "npy":
+        return save_npy(file_target)
+
+    def _save(frame_data: np.ndarray, meta: FrameMeta) -> str:
+        fname = frame_basename(meta) + CODEC_EXTENSION
+        with open(os.path.join(file_target, fname), "wb") as f:
+            f.write(encode_frame(frame_data, codec))
+        return fname
+    return _save
@@ -0,0 +1,89 @@
+"""Micro-benchmark of the color correction step, on frames from a target folder or synthetic square frames.
+
+usage:
+    benchmark_correction.py [-f <image_folder_target>] [-s <synthetic_size>] [-n <repeats>] [-j <threads>]
+"""
+
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+
+from loci.data_collection.frame_io import iter_frames
+from loci.data_collection.local_contrast import LocalContrastCorrector, reference_correction
+from loci.imaging.bayer import demosaic
+
+
+def legacy_correction(img: np.ndarray, f_avg: np.ndarray) -> np.ndarray:
+    """The per-frame correction as originally written in image_color_correction.py."""
+    rbar = img / f_avg
+    exp_convolve = cv2.filter2D(src=img, ddepth=-1, kernel=np.ones((7,7), np.float32))
+    std_convolve = np.linalg.norm(img - exp_convolve, ord=1, axis=1)
+    std_c = np.median(cv2.filter2D(src=std_convolve, ddepth=-1, kernel=np.ones((7,7), np.float32)) / exp_convolve)
+    img = rbar * std_c
+    return cv2.normalize(img, None,  0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+
+def synthetic_frames(size: int, count: int = 4, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size]
+    vignette = 1. - 0.5 * ((xx - size / 2) ** 2 + (yy - size / 2) ** 2) / (size / 2) ** 2
+    for i in range(count):
+        scene = 1500 + 800 * np.sin(xx / (40 + 5 * i)) * np.cos(yy / 60)
+        raw = (scene * vignette + rng.normal(0, 30, (size, size))).clip(0, 4095).astype(np.uint16)
+        yield f"synthetic_{i}", raw
+
+
+def timeit(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the color correction step",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, default="", action="store", help="Optional path to image targets")
+    parser.add_argument("-s", "--size", type=int, default=2048, action="store", help="Side length of synthetic frames")
+    parser.add_argument("-n", "--repeats", type=int, default=3, action="store", help="Timing repeats per method")
+    parser.add_argument("-j", "--threads", type=int, default=os.cpu_count(), action="store", help="Threads for the tiled engine")
+    args = parser.parse_args()
+
+    source = iter_frames(args.file_target) if args.file_target != "" else synthetic_frames(args.size)
+    imgs = [demosaic(raw) for _, raw in source]
+    f_avg = np.mean(imgs, axis=0).astype(np.float32)
+    img = imgs[0]
+    print(f"{len(imgs)} frames of shape {img.shape}")
+
+    engines = {"engine (1 thread)": LocalContrastCorrector(img.shape, workers=1),
+               f"engine ({args.threads} threads)": LocalContrastCorrector(img.shape, workers=args.threads)}
+
+    timings = {}
+    if img.shape[0] == img.shape[1]:
+        timings["original loop"] = timeit(lambda: legacy_correction(img, f_avg), args.repeats)
+    timings["float64 reference"] = timeit(lambda: reference_correction(img, f_avg), args.repeats)
+    for name, engine in engines.items():
+        timings[name] = timeit(lambda: engine.correct(img, f_avg, with_std=True), args.repeats)
+    timings["engine (image only)"] = timeit(lambda: engines["engine (1 thread)"].correct(img, f_avg), args.repeats)
+    for name, seconds in timings.items():
+        print(f"{name:>22}: {seconds * 1e3:8.1f} ms/frame")
+
+    # agreement with the float64 reference, across all frames
+    engine = engines["engine (1 thread)"]
+    worst_rel = 0.
+    worst_lsb = 0
+    for frame in imgs:
+        ref_out, ref_c = reference_correction(frame, f_avg)
+        out, std_c = engine.correct(frame, f_avg, with_std=True)
+        worst_rel = max(worst_rel, abs(std_c - ref_c) / abs(ref_c))
+        worst_lsb = max(worst_lsb, int(np.abs(out.astype(np.int16) - ref_out.astype(np.int16)).max()))
+    print(f"max relative std_c error vs reference: {worst_rel:.4%}")
+    print(f"max corrected image difference vs reference: {worst_lsb} LSB")
+    for engine in engines.values():
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Maps camera timestamps to host time, to take callback jitter out of frame times.
+
+usage (offline, over a folder or container; writes corrected times into its manifest):
+    clock_model.py -f <image_folder_target> [-n <window_frames>] [-o <csv_file>]
+"""
+
+import argparse
+import collections
+import threading
+import time
+import numpy as np
+from typing import NamedTuple, Optional
+
+from loci.data_collection.frame_io import RAW_FORMATS
+from loci.data_collection.frame_manifest import FrameManifest
+
+
+class ClockFit(NamedTuple):
+    cam0: int  # reference camera timestamp
+    host0: int  # reference host time, ns
+    slope: float  # host ns per camera tick
+    intercept: float  # ns, relative to host0
+
+
+def fit_lower_envelope(camera_ts: np.ndarray, host_ns: np.ndarray, quantile: float = 0.1,
+                       iterations: int = 3) -> Optional[ClockFit]:
+    """Robust line through the least-delayed samples. None if the samples cannot define a slope."""
+    camera_ts = np.asarray(camera_ts, dtype=np.int64)
+    host_ns = np.asarray(host_ns, dtype=np.int64)
+    if len(camera_ts) < 2:
+        return None
+    cam0, host0 = int(camera_ts[0]), int(host_ns[0])
+    x = (camera_ts - cam0).astype(np.float64)  # relative values keep float64 precision
+    y = (host_ns - host0).astype(np.float64)
+    if np.ptp(x) == 0:
+        return None
+    keep = np.ones(len(x), dtype=bool)
+    for _ in range(iterations + 1):
+        if np.ptp(x[keep]) == 0:
+            break
+        slope, intercept = np.polyfit(x[keep], y[keep], 1)
+        residual = y - (slope * x + intercept)
+        keep = residual <= np.quantile(residual, quantile)
+    return ClockFit(cam0, host0, float(slope), float(intercept))
+
+
+def predict(fit: ClockFit, camera_ts) -> np.ndarray:
+    """Corrected host time (ns) for camera timestamps under one fit."""
+    x = (np.asarray(camera_ts, dtype=np.int64) - fit.cam0).astype(np.float64)
+    return fit.host0 + np.round(fit.slope * x + fit.intercept).astype(np.int64)
+
+
+class ClockModel:
+    """Online sliding-window fit, refit on its own thread; update() returns the corrected host time of each frame."""
+
+    def __init__(self, window: int = 600, refit_every: int = 10, quantile: float = 0.1, min_samples: int = 10):
+        self.window = window
+        self.refit_every = refit_every
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.resets = 0
+        self.refits = 0
+        self._lock = threading.Lock()
+        self._due = threading.Event()
+        self._stop = threading.Event()
+        self.reset()
+        self._thread = threading.Thread(target=self._run, name="clock-model", daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        with self._lock:
+            self._cam = collections.deque(maxlen=self.window)
+            self._host = collections.deque(maxlen=self.window)
+            self._since_fit = 0
+            self.fit = None
+
+    def update(self, camera_ts: int, host_ns: int) -> int:
+        """Adds one frame and returns its corrected host time (the raw host time until the fit is ready)."""
+        if len(self._cam) > 0 and camera_ts < self._cam[-1]:
+            self.resets += 1  # camera clock reset
+            self.reset()
+        with self._lock:
+            self._cam.append(camera_ts)
+            self._host.append(host_ns)
+            self._since_fit += 1
+            if len(self._cam) >= self.min_samples and (self.fit is None or self._since_fit >= self.refit_every):
+                self._since_fit = 0
+                self._due.set()
+            fit = self.fit
+        if fit is None:
+            return host_ns
+        x = float(camera_ts - fit.cam0)  # predict() for one sample, without numpy overhead
+        return fit.host0 + round(fit.slope * x + fit.intercept)
+
+    def _snapshot(self):
+        with self._lock:
+            return self._cam, np.array(self._cam), np.array(self._host)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._due.wait(timeout=0.5):
+                continue
+            self._due.clear()
+            window, cam, host = self._snapshot()
+            fit = fit_lower_envelope(cam, host, self.quantile)
+            with self._lock:
+                if fit is not None and window is self._cam:  # not reset while fitting
+                    self.fit = fit
+                    self.refits += 1
+
+    def stats(self) -> dict:
+        """Current slope and how late the callbacks in the window ran relative to the fit."""
+        _, cam, host = self._snapshot()
+        fit = self.fit
+        if fit is None:
+            return dict(frames=len(cam), resets=self.resets, refits=self.refits)
+        delay = (host - predict(fit, cam)) / 1e6
+        return dict(frames=len(cam), resets=self.resets, refits=self.refits, ns_per_tick=fit.slope,
+                    delay_median_ms=float(np.median(delay)), delay_p99_ms=float(np.percentile(delay, 99)))
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2.)
+
+
+def correct_times(camera_ts: np.ndarray, host_ns: np.ndarray, window: int = 600,
+                  quantile: float = 0.1) -> np.ndarray:
+    """Offline correction of every frame (in capture order), blending the two window fits that bracket it."""
+    camera_ts = np.asarray(camera_ts, dtype=np.int64)
+    host_ns = np.asarray(host_ns, dtype=np.int64)
+    corrected = host_ns.copy()
+    if len(camera_ts) == 0:
+        return corrected
+    resets = np.flatnonzero(np.diff(camera_ts) < 0) + 1
+    for lo, hi in zip(np.r_[0, resets], np.r_[resets, len(camera_ts)]):
+        cam, host = camera_ts[lo:hi], host_ns[lo:hi]
+        n = len(cam)
+        step = max(window // 2, 1)
+        starts = list(range(0, max(n - window, 0) + 1, step))
+        if starts[-1] + window < n:
+            starts.append(n - window)
+        fits, centers = [], []
+        for s in starts:
+            fit = fit_lower_envelope(cam[s:s + window], host[s:s + window], quantile)
+            if fit is not None:
+                fits.append(fit)
+                centers.append(np.median(cam[s:s + window]))
+        if len(fits) == 0:
+            continue
+        centers = np.asarray(centers)
+        cam0, host0, slope, intercept = (np.array(v) for v in zip(*fits))
+        right = np.clip(np.searchsorted(centers, cam), 0, len(fits) - 1)
+        left = np.clip(right - 1, 0, len(fits) - 1)
+        span = centers[right] - centers[left]
+        w = np.clip((cam - centers[left]) / np.where(span > 0, span, 1.), 0., 1.)
+        w[span == 0] = 0.
+
+        def _predict(k):
+            x = (cam - cam0[k]).astype(np.float64)
+            return host0[k] + np.round(slope[k] * x + intercept[k]).astype(np.int64)
+
+        p_left, p_right = _predict(left), _predict(right)
+        corrected[lo:hi] = p_left + np.round(w * (p_right - p_left)).astype(np.int64)
+    return corrected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the camera-to-host clock and correct frame times",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, required=True, action="store", help="Path to image targets")
+    parser.add_argument("-n", "--window", type=int, default=600, action="store", help="Frames per fitting window")
+    parser.add_argument("-o", "--output", type=str, default="", action="store", help="Also write name,capture_ns,camera_ts,corrected_ns to this csv")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = FrameManifest(args.file_target)
+    manifest.refresh()
+    rows = manifest.frames(formats=RAW_FORMATS + ["container"])
+    if len(rows) == 0:
+        rows = manifest.frames(formats=["png"])  # e.g. a folder of converted pngs
+    if len(rows) == 0:
+        manifest.close()
+        print(f"No frames found at {args.file_target}.")
+        return
+    names = [r[0] for r in rows]
+    host_ns = np.array([r[2] for r in rows], dtype=np.int64)
+    camera_ts = np.array([r[3] for r in rows], dtype=np.int64)
+    corrected = correct_times(camera_ts, host_ns, window=args.window)
+    manifest.set_corrected(names, corrected)
+    manifest.close()
+
+    delay = (host_ns - corrected) / 1e6
+    print(f"Corrected {len(names)} frame times in {time.perf_counter() - start:.2f}s; "
+          f"host minus corrected: median {np.median(delay):.2f} ms, p99 {np.percentile(delay, 99):.2f} ms")
+    if args.output != "":
+        with open(args.output, "w") as f:
+            f.write("name,capture_ns,camera_ts,corrected_ns\n")
+            f.writelines(f"{n},{h},{c},{t}\n" for n, h, c, t in zip(names, host_ns, camera_ts, corrected))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Serial helpers (line framing, reads, scheduling, stats, output, simulation) for Atlas Scientific EZO probes."""
+
+import os
+import time
+import random
+import threading
+import numpy as np
+from typing import List, Optional
+
+
+LINE_END = b"\r"
+RESPONSE_TIME = 0.6  # seconds an EZO circuit takes to answer "R"
+RESPONSE_TIMEOUT = 1.  # how long to wait for that answer before giving up on a sample
+
+
+class LineFramer:
+    """Accumulates bytes and returns complete "\\r"-terminated lines (without the terminator)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buffer += data
+        if LINE_END not in data:
+            return []
+        *lines, rest = self._buffer.split(LINE_END)
+        self._buffer = bytearray(rest)
+        return [bytes(line) for line in lines]
+
+
+def is_data_line(line: bytes) -> bool:
+    """Data lines carry readings; response codes (*OK, *ER, ...) and blanks do not."""
+    line = line.strip()
+    return len(line) > 0 and line[:1] != b"*"
+
+
+class EZOReader:
+    """Command/response helper over a serial port opened with a small positive timeout."""
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.framer = LineFramer()
+        self._lines = []
+
+    def send_cmd(self, cmd: str):
+        """Send command to the Atlas Sensor, adding the carriage return."""
+        self.ser.write((cmd + "\r").encode("utf-8"))
+
+    def read_lines(self, timeout: float) -> List[bytes]:
+        """Returns complete lines, waiting up to timeout seconds for at least one."""
+        deadline = time.monotonic() + timeout
+        while len(self._lines) == 0 and time.monotonic() < deadline:
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            if chunk:
+                self._lines.extend(self.framer.feed(chunk))
+        lines, self._lines = self._lines, []
+        return lines
+
+    def discard_input(self):
+        """Drops everything received but not read, e.g. the late answer to a timed-out query."""
+        self.ser.reset_input_buffer()
+        self.framer = LineFramer()
+        self._lines = []
+
+    def query(self, cmd: str, timeout: float = RESPONSE_TIMEOUT) -> Optional[str]:
+        """Sends cmd and returns the first data line of the response, or None on timeout."""
+        self.discard_input()  # a late answer to an earlier, timed out query
+        self.send_cmd(cmd)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            for line in self.read_lines(remaining):
+                if is_data_line(line):
+                    return line.decode("utf-8", errors="replace").strip()
+
+    def drain(self, duration: float = 0.2):
+        """Discards anything the probe sends for duration seconds (e.g. continuous-mode leftovers)."""
+        self.read_lines(duration)
+        self._lines = []
+
+
+class DeadlineScheduler:
+    """Yields sample times on a fixed grid start + k * period of the monotonic clock; missed slots are skipped."""
+
+    def __init__(self, period: float):
+        self.period = period
+        self.start = time.monotonic()
+        self.k = 0
+        self.missed = 0
+
+    def next_deadline(self) -> float:
+        """Claims the next deadline (monotonic seconds), skipping any that have already fully passed."""
+        deadline = self.start + self.k * self.period
+        late = time.monotonic() - deadline
+        if late >= self.period:
+            skipped = int(late // self.period)
+            self.missed += skipped
+            self.k += skipped
+            deadline = self.start + self.k * self.period
+        self.k += 1
+        return deadline
+
+    def wait(self) -> float:
+        """Sleeps until the next deadline; returns the lateness (jitter) in seconds."""
+        deadline = self.next_deadline()
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return time.monotonic() - deadline
+
+
+class TimingStats:
+    """Per-sample jitter and process CPU use since construction or the last report."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.jitter = []
+        self._wall = time.monotonic()
+        self._cpu = time.process_time()
+
+    def add(self, jitter: float):
+        self.jitter.append(jitter)
+
+    def report(self) -> dict:
+        wall = time.monotonic() - self._wall
+        cpu = time.process_time() - self._cpu
+        jitter_ms = np.asarray(self.jitter) * 1e3 if len(self.jitter) > 0 else np.zeros(1)
+        return dict(samples=len(self.jitter),
+                    cpu_percent=100. * cpu / wall if wall > 0 else 0.,
+                    jitter_mean_ms=float(np.mean(jitter_ms)),
+                    jitter_p99_ms=float(np.percentile(jitter_ms, 99)),
+                    jitter_max_ms=float(np.max(jitter_ms)))
+
+
+class BufferedSink:
+    """Keeps one output file open and flushes it at most every flush_interval seconds."""
+
+    def __init__(self, file_target: str, flush_interval: float = 5.):
+        self.file_target = file_target
+        self.flush_interval = flush_interval
+        self._f = open(file_target, "a", buffering=1 << 16)
+        self._last_flush = time.monotonic()
+
+    def write(self, line: str):
+        self._f.write(line)
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._f.flush()
+            self._last_flush = now
+
+    def close(self):
+        self._f.flush()
+        self._f.close()
+
+
+class ProbeSimulator:
+    """Answers EZO commands on a pseudo-terminal (self.port), standing in for a probe."""
+
+    def __init__(self, value: float = 25., noise: float = 0.05, latency: float = RESPONSE_TIME, step: float = 0.):
+        self.value = value
+        self.noise = noise
+        self.latency = latency  # simulated conversion time before answering
+        self.step = step  # drift per reading, so tests can tell readings apart
+        self.readings = 0
+        self._master, self._slave = os.openpty()
+        self.port = os.ttyname(self._slave)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        framer = LineFramer()
+        while not self._closed.is_set():
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                return
+            for line in framer.feed(data):
+                cmd = line.decode("utf-8", errors="replace").strip()
+                if self.latency > 0:
+                    time.sleep(self.latency)
+                if cmd.upper() == "R":
+                    reading = self.value + self.step * self.readings + random.gauss(0., self.noise)
+                    self.readings += 1
+                    os.write(self._master, f"{reading:.3f}\r*OK\r".encode("utf-8"))
+                else:
+                    os.write(self._master, b"*OK\r")
+
+    def close(self):
+        self._closed.set()
+        os.close(self._slave)
+        os.close(self._master)
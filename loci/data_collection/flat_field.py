@@ -0,0 +1,119 @@
+"""Streaming, mergeable per-pixel flat-field statistics (mean and std) for color correction."""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+from loci.data_collection.frame_io import iter_frames, list_frames
+from loci.imaging.bayer import demosaic
+
+
+class FlatFieldModel:
+    """Running per-pixel mean and variance of a set of frames."""
+
+    def __init__(self, shape: Optional[tuple] = None):
+        self.count = 0
+        self.mean = None
+        self.m2 = None  # running sum of squared deviations from the mean
+        self._delta = None  # scratch buffers, reused across updates
+        self._sample = None
+        if shape is not None:
+            self._allocate(tuple(shape))
+
+    def _allocate(self, shape: tuple):
+        self.mean = np.zeros(shape, dtype=np.float32)
+        self.m2 = np.zeros(shape, dtype=np.float32)
+
+    def __getstate__(self):
+        # scratch buffers are not worth shipping between processes
+        state = self.__dict__.copy()
+        state["_delta"] = None
+        state["_sample"] = None
+        return state
+
+    @property
+    def shape(self) -> Optional[tuple]:
+        return None if self.mean is None else self.mean.shape
+
+    def update(self, img: np.ndarray):
+        """Adds one frame to the running statistics."""
+        if self.mean is None:
+            self._allocate(img.shape)
+        elif img.shape != self.mean.shape:
+            raise ValueError(f"Frame shape {img.shape} does not match model shape {self.mean.shape}")
+        if self._delta is None:
+            self._delta = np.empty(self.mean.shape, dtype=np.float32)
+            self._sample = np.empty(self.mean.shape, dtype=np.float32)
+        self.count += 1
+        np.copyto(self._sample, img, casting="unsafe")
+        np.subtract(self._sample, self.mean, out=self._delta)
+        self.mean += self._delta / self.count
+        # m2 += delta * (x - new_mean), reusing the sample buffer for (x - new_mean)
+        np.subtract(self._sample, self.mean, out=self._sample)
+        self._sample *= self._delta
+        self.m2 += self._sample
+
+    def merge(self, other: "FlatFieldModel") -> "FlatFieldModel":
+        """Folds another partial model into this one (Chan et al. parallel variance)."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self._allocate(other.shape)
+            self.mean[:] = other.mean
+            self.m2[:] = other.m2
+            self.count = other.count
+            return self
+        if other.shape != self.shape:
+            raise ValueError(f"Cannot merge models of shape {self.shape} and {other.shape}")
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * (self.count * other.count / total)
+        self.mean += delta * (other.count / total)
+        self.count = total
+        return self
+
+    @property
+    def variance(self) -> np.ndarray:
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    def save(self, fpath: str):
+        np.savez(fpath, mean=self.mean, m2=self.m2, std=self.std, count=self.count, shape=np.asarray(self.shape))
+
+    @classmethod
+    def load(cls, fpath: str) -> "FlatFieldModel":
+        data = np.load(fpath)
+        model = cls(tuple(data["shape"]))
+        model.mean[:] = data["mean"]
+        model.m2[:] = data["m2"]
+        model.count = int(data["count"])
+        return model
+
+
+def fit_frames(target_path: str, select: Optional[Iterable[str]] = None) -> FlatFieldModel:
+    """Fits a model over the (optionally selected) frames at target_path in one pass."""
+    model = FlatFieldModel()
+    for fname, array_target in iter_frames(target_path, select=select):
+        model.update(demosaic(array_target))
+    return model
+
+
+def fit_parallel(target_path: str, workers: int = None) -> FlatFieldModel:
+    """Splits the frames into chunks, fits each in its own process, and merges the results."""
+    if workers is None:
+        workers = os.cpu_count()
+    names = list_frames(target_path)
+    if workers <= 1 or len(names) < 2 * workers:
+        return fit_frames(target_path)
+    chunks = [names[i::workers] for i in range(workers)]
+    model = FlatFieldModel()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for partial in pool.map(fit_frames, [target_path] * workers, chunks):
+            model.merge(partial)
+    return model
@@ -0,0 +1,214 @@
+"""Append-only chunked container (rolling segment files) for raw camera frames."""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Optional
+
+from loci.data_collection.frame_writer import FrameMeta, frame_basename
+from loci.data_collection.bayer_codec import check_12bit, pack12, unpack12, packed_size
+
+
+CONTAINER_FILE = "container.json"
+CONTAINER_VERSION = 1
+
+INDEX_DTYPE = np.dtype([("frame_id", "<i8"),
+                        ("capture_time_ns", "<i8"),
+                        ("frame_time", "<i8"),
+                        ("offset", "<i8"),
+                        ("status", "<i4")])
+STATUS_EMPTY = 0  # slot reserved but never written (e.g. power loss mid-write)
+STATUS_COMPLETE = 1
+
+
+def is_container(path: str) -> bool:
+    """Whether path is a frame container directory."""
+    return os.path.isfile(os.path.join(path, CONTAINER_FILE))
+
+
+class FrameContainerWriter:
+    """Appends frames to rolling, preallocated segment files. append() can be used as a FrameWriter save function."""
+
+    def __init__(self, path: str, segment_frames: int = 2000, segment_seconds: float = 3600., codec: str = "npy"):
+        if codec not in ("npy", "pack12"):
+            raise ValueError(f"Containers hold fixed-size frames, codec {codec} is not supported")
+        self.path = path
+        self.codec = codec
+        self.segment_frames = segment_frames
+        self.segment_seconds = segment_seconds
+        self._lock = threading.Lock()
+        self._data = None  # open data file of the current segment
+        self._index = None  # open index file of the current segment
+        self._header = None
+        self._slot = 0
+        self._segment_start = 0.
+
+        if os.path.exists(path) is False:
+            os.makedirs(path)
+        meta_file = os.path.join(path, CONTAINER_FILE)
+        if not os.path.isfile(meta_file):
+            with open(meta_file, "w") as f:
+                json.dump({"version": CONTAINER_VERSION}, f)
+
+    def _open_segment(self, frame_data: np.ndarray, meta: FrameMeta):
+        self._close_segment()
+        stem = os.path.join(self.path, f"segment_{meta.capture_time}")
+        if self.codec == "pack12":
+            frame_bytes = packed_size(frame_data.size)
+        else:
+            frame_bytes = frame_data.nbytes
+        self._header = {"shape": list(frame_data.shape),
+                        "dtype": frame_data.dtype.str,
+                        "codec": self.codec,
+                        "frame_bytes": frame_bytes,
+                        "capacity": self.segment_frames}
+        with open(stem + ".json", "w") as f:
+            json.dump(self._header, f)
+        self._data = open(stem + ".frames", "wb+")
+        self._data.truncate(frame_bytes * self.segment_frames)  # preallocate (sparse on most filesystems)
+        self._index = open(stem + ".idx", "ab")
+        self._slot = 0
+        self._segment_start = time.monotonic()
+
+    def _close_segment(self):
+        if self._data is not None:
+            # give back the unused tail of the preallocated segment
+            self._data.truncate(self._slot * self._header["frame_bytes"])
+            self._data.close()
+            self._index.close()
+        self._data = None
+        self._index = None
+
+    def _needs_rollover(self, frame_data: np.ndarray) -> bool:
+        if self._data is None:
+            return True
+        if self._slot >= self.segment_frames:
+            return True
+        if time.monotonic() - self._segment_start >= self.segment_seconds:
+            return True
+        return list(frame_data.shape) != self._header["shape"] or frame_data.dtype.str != self._header["dtype"]
+
+    def append(self, frame_data: np.ndarray, meta: FrameMeta) -> str:
+        """Write one frame into the current segment, then commit its index record. Returns the frame name."""
+        if self.codec == "pack12":
+            check_12bit(frame_data)
+            payload = pack12(frame_data)  # pack outside of the lock, writers can do this in parallel
+        else:
+            payload = np.ascontiguousarray(frame_data)
+        with self._lock:
+            if self._needs_rollover(frame_data):
+                self._open_segment(frame_data, meta)
+            offset = self._slot * self._header["frame_bytes"]
+            os.pwrite(self._data.fileno(), payload.data, offset)
+            record = np.array([(meta.frame_id, meta.capture_time, meta.frame_time, offset, STATUS_COMPLETE)],
+                              dtype=INDEX_DTYPE)
+            # the index record is written after the data, so a listed frame is always whole
+            self._index.write(record.tobytes())
+            self._index.flush()
+            self._slot += 1
+        return frame_basename(meta)
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+
+class FrameContainer:
+    """Read-only view over a frame container, ordered by host capture time. Call refresh() to see new frames."""
+
+    def __init__(self, path: str):
+        if not is_container(path):
+            raise ValueError(f"{path} is not a frame container")
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the segment headers and indices."""
+        self._segments = []  # (stem, header)
+        self._maps = {}
+        self._positions = None
+        indices = []
+        segment_ids = []
+        stems = sorted(f[:-len(".idx")] for f in os.listdir(self.path) if f.endswith(".idx"))
+        for stem in stems:
+            with open(os.path.join(self.path, stem + ".json"), "r") as f:
+                header = json.load(f)
+            index = np.fromfile(os.path.join(self.path, stem + ".idx"), dtype=INDEX_DTYPE)
+            index = index[index["status"] == STATUS_COMPLETE]
+            indices.append(index)
+            segment_ids.append(np.full(len(index), len(self._segments), dtype=np.int32))
+            self._segments.append((stem, header))
+
+        if len(indices) > 0:
+            index = np.concatenate(indices)
+            segment_ids = np.concatenate(segment_ids)
+        else:
+            index = np.zeros(0, dtype=INDEX_DTYPE)
+            segment_ids = np.zeros(0, dtype=np.int32)
+        order = np.argsort(index["capture_time_ns"], kind="stable")
+        self.index = index[order]
+        self._segment_ids = segment_ids[order]
+
+    def _segment_map(self, segment: int) -> np.memmap:
+        if segment not in self._maps:
+            stem, header = self._segments[segment]
+            fpath = os.path.join(self.path, stem + ".frames")
+            nframes = os.path.getsize(fpath) // header["frame_bytes"]
+            if header.get("codec", "npy") == "pack12":
+                shape = (nframes, header["frame_bytes"])
+                dtype = np.uint8
+            else:
+                shape = (nframes, *header["shape"])
+                dtype = np.dtype(header["dtype"])
+            self._maps[segment] = np.memmap(fpath, dtype=dtype, mode="r", shape=shape)
+        return self._maps[segment]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        record = self.index[i]
+        segment = self._segment_ids[i]
+        header = self._segments[segment][1]
+        frame = self._segment_map(segment)[record["offset"] // header["frame_bytes"]]
+        if header.get("codec", "npy") == "pack12":
+            return unpack12(frame, tuple(header["shape"]))
+        return frame
+
+    def header(self, i: int) -> dict:
+        """Segment header (shape, dtype, codec, ...) of the frame at position i."""
+        return self._segments[self._segment_ids[i]][1]
+
+    def meta(self, i: int) -> FrameMeta:
+        record = self.index[i]
+        return FrameMeta(int(record["frame_id"]), int(record["capture_time_ns"]), int(record["frame_time"]))
+
+    def name(self, i: int) -> str:
+        """Frame name matching the per-file naming scheme (without an extension)."""
+        return frame_basename(self.meta(i))
+
+    def names(self) -> list:
+        return [self.name(i) for i in range(len(self))]
+
+    def find(self, name: str) -> int:
+        """Position of the frame with the given name."""
+        if self._positions is None:
+            self._positions = {n: i for i, n in enumerate(self.names())}
+        return self._positions[name]
+
+    def range_indices(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> np.ndarray:
+        """Positions of frames with start_ns <= capture_time_ns < end_ns."""
+        times = self.index["capture_time_ns"]
+        lo = 0 if start_ns is None else np.searchsorted(times, start_ns, side="left")
+        hi = len(times) if end_ns is None else np.searchsorted(times, end_ns, side="left")
+        return np.arange(lo, hi)
+
+    def time_range(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None):
+        """Yields (meta, frame) for frames captured in [start_ns, end_ns)."""
+        for i in self.range_indices(start_ns, end_ns):
+            yield self.meta(i), self[i]
+
+    def __iter__(self):
+        return self.time_range()
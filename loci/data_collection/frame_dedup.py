@@ -0,0 +1,134 @@
+"""Finds runs of near-identical frames from a stationary camera and keeps one frame per run.
+
+usage:
+    frame_dedup.py -f <image_folder_target> [-t <threshold_bits>] [-i <max_interval_s>] [-j <workers>]
+    [--rehash] [--move_to <folder>] [-o <csv_file>]
+"""
+
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from loci.data_collection.frame_io import RAW_FORMATS, load_named_frame
+from loci.data_collection.frame_container import is_container
+from loci.data_collection.frame_manifest import FrameManifest
+from loci.imaging.phash import dhash, hamming
+
+
+class TemporalDeduplicator:
+    """Online near-duplicate test against the last kept frame."""
+
+    def __init__(self, threshold: int = 6, max_interval_ns: Optional[int] = None):
+        self.threshold = threshold
+        self.max_interval_ns = max_interval_ns
+        self.anchor = None  # hash of the last kept frame
+        self.anchor_ns = 0
+        self.kept = 0
+        self.dropped = 0
+
+    def keep(self, h: int, time_ns: int) -> bool:
+        """Whether a frame with hash h captured at time_ns starts a new run (and becomes the anchor)."""
+        if (self.anchor is None or hamming(self.anchor, h) > self.threshold or
+                (self.max_interval_ns is not None and time_ns - self.anchor_ns >= self.max_interval_ns)):
+            self.anchor = h
+            self.anchor_ns = time_ns
+            self.kept += 1
+            return True
+        self.dropped += 1
+        return False
+
+    def stats(self) -> dict:
+        return dict(kept=self.kept, dropped=self.dropped)
+
+
+def find_duplicates(names: List[str], capture_ns: List[int], hashes: List[int], threshold: int = 6,
+                    max_interval_ns: Optional[int] = None) -> List[Optional[str]]:
+    """For frames in capture order, the kept frame each one duplicates (None for kept frames)."""
+    dedup = TemporalDeduplicator(threshold, max_interval_ns)
+    duplicate_of = []
+    kept_name = None
+    for name, t, h in zip(names, capture_ns, hashes):
+        if dedup.keep(h, t):
+            kept_name = name
+            duplicate_of.append(None)
+        else:
+            duplicate_of.append(kept_name)
+    return duplicate_of
+
+
+def hash_frames(target_path: str, names: List[str]) -> List[int]:
+    """Worker: hashes a batch of frames, in the order of names."""
+    return [dhash(load_named_frame(target_path, name)) for name in names]
+
+
+def hash_all(manifest: FrameManifest, workers: int = None, batch_size: int = 64, rehash: bool = False) -> int:
+    """Hashes every (unhashed) frame of a manifest across a process pool. Returns the number hashed."""
+    if workers is None:
+        workers = os.cpu_count()
+    names = manifest.names(formats=RAW_FORMATS + ["container"])
+    if not rehash:
+        hashed = set(manifest.hashes()[0])
+        names = [n for n in names if n not in hashed]
+    batches = [names[i:i + batch_size] for i in range(0, len(names), batch_size)]
+    if workers <= 1 or len(batches) < 2:
+        for batch in batches:
+            manifest.set_hashes(batch, hash_frames(manifest.target_path, batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch, hashes in zip(batches, pool.map(hash_frames, [manifest.target_path] * len(batches), batches)):
+                manifest.set_hashes(batch, hashes)
+    return len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark (and optionally move out) near-duplicate frames",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, required=True, action="store", help="Path to image targets (folder of frames or frame container)")
+    parser.add_argument("-t", "--threshold", type=int, default=6, action="store", help="Frames within this many differing hash bits (of 64) of the last kept frame are duplicates")
+    parser.add_argument("-i", "--max_interval", type=float, default=600., action="store", help="Keep at least one frame every this many seconds; 0 disables")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), action="store", help="Number of hashing processes")
+    parser.add_argument("-b", "--batch_size", type=int, default=64, action="store", help="Frames hashed per task")
+    parser.add_argument("--rehash", action="store_true", help="Hash every frame, even if it already has a hash")
+    parser.add_argument("--move_to", type=str, default="", action="store", help="Move duplicate frame files into this folder (frame folders only)")
+    parser.add_argument("-o", "--output", type=str, default="", action="store", help="Also write name,capture_ns,dhash,duplicate_of to this csv")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = FrameManifest(args.file_target)
+    manifest.refresh()
+    hashed = hash_all(manifest, workers=args.workers, batch_size=args.batch_size, rehash=args.rehash)
+    names, capture_ns, hashes = manifest.hashes(formats=RAW_FORMATS + ["container"])
+    max_interval_ns = int(args.max_interval * 1e9) if args.max_interval > 0 else None
+    duplicate_of = find_duplicates(names, capture_ns, hashes, threshold=args.threshold, max_interval_ns=max_interval_ns)
+    manifest.set_duplicates(names, duplicate_of)
+    duplicates = [n for n, d in zip(names, duplicate_of) if d is not None]
+    print(f"Hashed {hashed} frames; {len(duplicates)} of {len(names)} frames are near-duplicates "
+          f"({len(names) - len(duplicates)} kept) in {time.perf_counter() - start:.1f}s.")
+
+    if args.output != "":
+        with open(args.output, "w") as f:
+            f.write("name,capture_ns,dhash,duplicate_of\n")
+            f.writelines(f"{n},{t},{h:016x},{d or ''}\n" for n, t, h, d in zip(names, capture_ns, hashes, duplicate_of))
+
+    if args.move_to != "":
+        if is_container(args.file_target):
+            print("Frames cannot be moved out of a frame container; duplicates are only marked.")
+        else:
+            if os.path.exists(args.move_to) is False:
+                os.makedirs(args.move_to)
+            moved = 0
+            for name in duplicates:
+                source = os.path.join(args.file_target, name)
+                if os.path.exists(source):
+                    shutil.move(source, os.path.join(args.move_to, name))
+                    moved += 1
+            manifest.refresh(force=True)
+            print(f"Moved {moved} duplicate frames to {args.move_to}.")
+    manifest.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Helpers for locating and loading saved frames, whatever way they were stored.
+
+Frames are either one file per frame in a folder (.npy, or .b12 from bayer_codec.py),
+or a frame container (see frame_container.py). Scripts that consume frames should go
+through iter_frames so they work with both. Folders with a frame manifest (see
+frame_manifest.py) are listed from the manifest instead of the directory.
+"""
+
+import os
+import threading
+from typing import Iterable, Optional
+
+from loci.data_collection.frame_container import FrameContainer, is_container
+from loci.data_collection.bayer_codec import load_frame, is_frame_file
+from loci.data_collection.frame_manifest import open_manifest, parse_frame_name
+from loci.imaging.quality import QualityThresholds
+
+
+RAW_FORMATS = ["npy", "b12"]
+
+
+def list_frames(target_path: str, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                quality: Optional[QualityThresholds] = None, unique: bool = False) -> list:
+    """Names of the frames at target_path (optionally captured in [start_ns, end_ns)), as iter_frames yields them."""
+    manifest = open_manifest(target_path)
+    if (quality is not None or unique) and manifest is None:
+        raise ValueError(f"{target_path} has no frame manifest to read quality scores or duplicates from; "
+                         f"run frame_quality.py / frame_dedup.py first")
+    if is_container(target_path):
+        frames = FrameContainer(target_path)
+        names = [frames.name(i) for i in frames.range_indices(start_ns, end_ns)]
+        if quality is not None or unique:
+            passing = set(manifest.names(quality=quality, unique=unique))
+            names = [n for n in names if n in passing]
+        if manifest is not None:
+            manifest.close()
+        return names
+    if manifest is not None:
+        names = manifest.names(start_ns=start_ns, end_ns=end_ns, formats=RAW_FORMATS, quality=quality, unique=unique)
+        manifest.close()
+        return names
+    names = [fname for fname in os.listdir(target_path) if is_frame_file(fname)]
+    if start_ns is not None or end_ns is not None:
+        lo = start_ns if start_ns is not None else -float("inf")
+        hi = end_ns if end_ns is not None else float("inf")
+        names = [n for n in names if parse_frame_name(n) is not None and lo <= parse_frame_name(n)[1] < hi]
+    return names
+
+
+def iter_frames(target_path: str, select: Optional[Iterable[str]] = None, quality: Optional[QualityThresholds] = None,
+                unique: bool = False):
+    """Yields (name, frame) for every (selected) frame at target_path, filtered like list_frames."""
+    if quality is not None or unique:
+        passing = list_frames(target_path, quality=quality, unique=unique)
+        select = passing if select is None else set(select).intersection(passing)
+    if select is not None:
+        select = set(select)
+
+    if is_container(target_path):
+        frames = FrameContainer(target_path)
+        for i in range(len(frames)):
+            name = frames.name(i)
+            if select is None or name in select:
+                yield name, frames[i]
+    else:
+        for fname in list_frames(target_path):
+            if select is None or fname in select:
+                yield fname, load_frame(os.path.join(target_path, fname))
+
+
+_containers = {}  # containers opened by load_named_frame, kept open per process
+_containers_lock = threading.Lock()  # load_named_frame is also called from worker threads
+
+
+def load_named_frame(target_path: str, name: str):
+    """Loads a single frame by the name list_frames gave it (e.g. inside a worker process)."""
+    if is_container(target_path):
+        with _containers_lock:
+            if target_path not in _containers:
+                _containers[target_path] = FrameContainer(target_path)
+            frames = _containers[target_path]
+            i = frames.find(name)  # builds the name index on first use
+        return frames[i]
+    return load_frame(os.path.join(target_path, name))
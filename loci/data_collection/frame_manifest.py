@@ -0,0 +1,337 @@
+"""Persistent SQLite index of the frames in a survey folder or frame container.
+
+usage (build or update the manifest of a folder or container, and summarize it):
+    frame_manifest.py -f <image_folder_target> [--rescan]
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+
+from loci.data_collection.frame_writer import FrameMeta
+from loci.data_collection.frame_container import FrameContainer, is_container
+from loci.imaging.quality import QualityScore, QualityThresholds
+from loci.imaging.phash import from_signed, to_signed
+
+
+# kept in a subfolder: sqlite's journal files would otherwise touch the folder's mtime on every open
+MANIFEST_FILE = os.path.join(".manifest", "frames.sqlite")
+FRAME_FORMATS = {".npy": "npy", ".b12": "b12", ".png": "png", ".jpg": "jpg", ".jpeg": "jpg", ".tif": "tif", ".tiff": "tif"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    name TEXT PRIMARY KEY,
+    frame_id INTEGER,
+    capture_ns INTEGER,
+    camera_ts INTEGER,
+    size INTEGER,
+    format TEXT,
+    corrected_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS frames_capture ON frames (capture_ns);
+CREATE INDEX IF NOT EXISTS frames_id ON frames (frame_id);
+CREATE TABLE IF NOT EXISTS products (
+    name TEXT,
+    product TEXT,
+    path TEXT,
+    PRIMARY KEY (name, product)
+);
+CREATE TABLE IF NOT EXISTS quality (
+    name TEXT PRIMARY KEY,
+    sharpness REAL,
+    tenengrad REAL,
+    clip_low REAL,
+    clip_high REAL,
+    contrast REAL,
+    dynamic_range REAL,
+    mean REAL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    name TEXT PRIMARY KEY,
+    dhash INTEGER,
+    duplicate_of TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+
+
+def has_manifest(target_path: str) -> bool:
+    return os.path.isfile(os.path.join(target_path, MANIFEST_FILE))
+
+
+def parse_frame_name(name: str) -> Optional[Tuple[int, int, int]]:
+    """(frame id, capture ns, camera timestamp) from a <prefix>_<id>_<capture>_<camera>.<ext> name."""
+    parts = name.split(".")[0].split("_")
+    if len(parts) < 4:
+        return None
+    try:
+        return int(parts[-3]), int(parts[-2]), int(parts[-1])
+    except ValueError:
+        return None
+
+
+def frame_format(name: str) -> Optional[str]:
+    return FRAME_FORMATS.get(os.path.splitext(name)[1].lower())
+
+
+class FrameManifest:
+    """Frame index for one folder or container. Safe to record into from several writer threads."""
+
+    def __init__(self, target_path: str, commit_every: int = 50):
+        self.target_path = target_path
+        self.commit_every = commit_every
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_hashes = []
+        if os.path.exists(os.path.dirname(os.path.join(target_path, MANIFEST_FILE))) is False:
+            os.makedirs(os.path.dirname(os.path.join(target_path, MANIFEST_FILE)))
+        self._db = sqlite3.connect(os.path.join(target_path, MANIFEST_FILE), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # readers do not block the acquisition writer
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(frames)")]
+        if "corrected_ns" not in columns:  # manifests written before clock correction existed
+            self._db.execute("ALTER TABLE frames ADD COLUMN corrected_ns INTEGER")
+
+    ##############
+    # Updates
+    ##############
+
+    def record(self, name: str, meta: FrameMeta, size: int, fmt: str):
+        """Adds (or replaces) one frame, and its perceptual hash if it was hashed at capture."""
+        with self._lock:
+            corrected = meta.corrected_time if meta.corrected_time != 0 else None
+            self._pending.append((name, meta.frame_id, meta.capture_time, meta.frame_time, size, fmt, corrected))
+            if meta.dhash is not None:
+                self._pending_hashes.append((name, to_signed(meta.dhash), None))
+            if len(self._pending) >= self.commit_every:
+                self._commit()
+
+    def _commit(self):
+        if len(self._pending) > 0:
+            self._db.executemany("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+        if len(self._pending_hashes) > 0:
+            self._db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)", self._pending_hashes)
+            self._pending_hashes = []
+        self._db.commit()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def recorder(self, save_fn: Callable) -> Callable:
+        """Wraps a FrameWriter save function (which returns the saved frame's name) to record each frame."""
+        container = is_container(self.target_path)
+
+        def _save(frame_data, meta):
+            name = save_fn(frame_data, meta)
+            if container:
+                self.record(name, meta, frame_data.nbytes, "container")
+            else:
+                self.record(name, meta, os.path.getsize(os.path.join(self.target_path, name)), frame_format(name))
+            return name
+        return _save
+
+    def set_corrected(self, names: List[str], corrected_ns):
+        """Stores clock-corrected capture times (see clock_model.py) for the named frames."""
+        with self._lock:
+            self._commit()
+            self._db.executemany("UPDATE frames SET corrected_ns = ? WHERE name = ?",
+                                 [(int(t), n) for n, t in zip(names, corrected_ns)])
+            self._db.commit()
+
+    def set_quality(self, names: List[str], scores: List[QualityScore]):
+        """Stores image-quality scores (see frame_quality.py) for the named frames."""
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO quality VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(n, *(float(v) for v in s)) for n, s in zip(names, scores)])
+            self._db.commit()
+
+    def set_hashes(self, names: List[str], hashes: List[int]):
+        """Stores perceptual hashes (see loci/imaging/phash.py), keeping any recorded duplicate runs."""
+        with self._lock:
+            self._commit()
+            self._db.executemany("INSERT INTO hashes VALUES (?, ?, NULL) ON CONFLICT (name) DO UPDATE SET dhash = excluded.dhash",
+                                 [(n, to_signed(int(h))) for n, h in zip(names, hashes)])
+            self._db.commit()
+
+    def set_duplicates(self, names: List[str], duplicate_of: List[Optional[str]]):
+        """Marks frames as near-duplicates of a kept frame (None for kept frames)."""
+        with self._lock:
+            self._commit()
+            self._db.executemany("UPDATE hashes SET duplicate_of = ? WHERE name = ?", list(zip(duplicate_of, names)))
+            self._db.commit()
+
+    def add_product(self, name: str, product: str, path: str):
+        """Records a file derived from frame name (e.g. product "png")."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO products VALUES (?, ?, ?)", (name, product, path))
+            self._db.commit()
+
+    def _state(self, key: str) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def refresh(self, force: bool = False) -> int:
+        """Brings the manifest up to date with the disk. Returns the number of frames added."""
+        with self._lock:
+            self._commit()
+            if is_container(self.target_path):
+                return self._refresh_container()
+
+            scan_start = time.time_ns()
+            dir_mtime = os.stat(self.target_path).st_mtime_ns
+            if not force and self._state("dir_mtime_ns") == dir_mtime:
+                return 0
+            known = {row[0] for row in self._db.execute("SELECT name FROM frames")}
+            seen = set()
+            rows = []
+            with os.scandir(self.target_path) as entries:
+                for entry in entries:
+                    fmt = frame_format(entry.name)
+                    if fmt is None or not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+                    if entry.name in known:
+                        continue
+                    parsed = parse_frame_name(entry.name)
+                    if parsed is None:
+                        continue
+                    rows.append((entry.name, *parsed, entry.stat().st_size, fmt, None))
+            self._db.executemany("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._forget([(name,) for name in known - seen])
+            # a change within the same mtime tick as the scan could be missed, so only trust settled folders
+            if scan_start - dir_mtime > 2 * 10**9:
+                self._db.execute("INSERT OR REPLACE INTO state VALUES ('dir_mtime_ns', ?)", (dir_mtime,))
+            self._db.commit()
+            return len(rows)
+
+    def _forget(self, names: List[Tuple[str]]):
+        """Deletes vanished frames with their products, scores and hashes (committed by the caller)."""
+        for table in ("frames", "products", "quality", "hashes"):
+            self._db.executemany(f"DELETE FROM {table} WHERE name = ?", names)
+        # duplicates of a vanished kept frame are no longer covered by it
+        self._db.executemany("UPDATE hashes SET duplicate_of = NULL WHERE duplicate_of = ?", names)
+
+    def _refresh_container(self) -> int:
+        frames = FrameContainer(self.target_path)
+        if self._state("container_frames") == len(frames):
+            return 0
+        known = {row[0] for row in self._db.execute("SELECT name FROM frames")}
+        rows = []
+        for i in range(len(frames)):
+            name = frames.name(i)
+            if name not in known:
+                meta = frames.meta(i)
+                header = frames.header(i)
+                nbytes = int(np.prod(header["shape"])) * np.dtype(header["dtype"]).itemsize
+                rows.append((name, meta.frame_id, meta.capture_time, meta.frame_time, nbytes, "container", None))
+        self._db.executemany("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._db.execute("INSERT OR REPLACE INTO state VALUES ('container_frames', ?)", (len(frames),))
+        self._db.commit()
+        return len(rows)
+
+    ##############
+    # Queries
+    ##############
+
+    def frames(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None, first_id: Optional[int] = None,
+               last_id: Optional[int] = None, formats: Optional[List[str]] = None,
+               quality: Optional[QualityThresholds] = None, unique: bool = False) -> List[Tuple[str, int, int, int, int]]:
+        """(name, frame_id, capture_ns, camera_ts, corrected_ns) of matching frames, ordered by capture time."""
+        clauses, params = [], []
+        for clause, value in (("capture_ns >= ?", start_ns), ("capture_ns < ?", end_ns),
+                              ("frame_id >= ?", first_id), ("frame_id <= ?", last_id)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(int(value))
+        if formats is not None:
+            clauses.append(f"format IN ({','.join('?' * len(formats))})")
+            params.extend(formats)
+        if quality is not None:
+            limits = [(f"{column} {op} ?", value) for column, op, value in
+                      (("sharpness", ">=", quality.min_sharpness), ("clip_low", "<=", quality.max_clip_low),
+                       ("clip_high", "<=", quality.max_clip_high), ("contrast", ">=", quality.min_contrast))
+                      if value is not None]
+            clauses.append("name IN (SELECT name FROM quality" +
+                           (f" WHERE {' AND '.join(c for c, _ in limits)})" if len(limits) > 0 else ")"))
+            params.extend(float(v) for _, v in limits)
+        if unique:
+            clauses.append("name NOT IN (SELECT name FROM hashes WHERE duplicate_of IS NOT NULL)")
+        where = f"WHERE {' AND '.join(clauses)}" if len(clauses) > 0 else ""
+        with self._lock:
+            self._commit()
+            return self._db.execute(f"SELECT name, frame_id, capture_ns, camera_ts, corrected_ns FROM frames {where} "
+                                    f"ORDER BY capture_ns, name", params).fetchall()
+
+    def names(self, **kwargs) -> List[str]:
+        """Names of matching frames (same filters as frames()), ordered by capture time."""
+        return [row[0] for row in self.frames(**kwargs)]
+
+    def products(self, product: str) -> dict:
+        """Frame name to path of every recorded product of one kind."""
+        with self._lock:
+            return dict(self._db.execute("SELECT name, path FROM products WHERE product = ?", (product,)).fetchall())
+
+    def quality(self) -> dict:
+        """Frame name to QualityScore of every scored frame."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM quality").fetchall()
+        return {row[0]: QualityScore(*row[1:]) for row in rows}
+
+    def hashes(self, formats: Optional[List[str]] = None) -> Tuple[List[str], List[int], List[int]]:
+        """(names, capture_ns, dhash) of every hashed frame, ordered by capture time."""
+        where = f"WHERE f.format IN ({','.join('?' * len(formats))})" if formats is not None else ""
+        with self._lock:
+            self._commit()
+            rows = self._db.execute(f"SELECT f.name, f.capture_ns, h.dhash FROM frames f JOIN hashes h ON f.name = h.name "
+                                    f"{where} ORDER BY f.capture_ns, f.name", formats or []).fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows], [from_signed(r[2]) for r in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            self._commit()
+            return self._db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+
+def open_manifest(target_path: str, create: bool = False) -> Optional[FrameManifest]:
+    """The refreshed manifest of target_path, or None if it has none (and create is False)."""
+    if not create and not has_manifest(target_path):
+        return None
+    manifest = FrameManifest(target_path)
+    manifest.refresh()
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the frame manifest of a folder or frame container",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, required=True, action="store", help="Path to image targets")
+    parser.add_argument("--rescan", action="store_true", help="Scan the folder even if it looks unchanged")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = FrameManifest(args.file_target)
+    added = manifest.refresh(force=args.rescan)
+    frames = manifest.frames()
+    print(f"Added {added} frames in {time.perf_counter() - start:.2f}s; manifest holds {len(frames)} frames.")
+    if len(frames) > 0:
+        print(f"ids {min(f[1] for f in frames)} - {max(f[1] for f in frames)}, capture time {frames[0][2]} - {frames[-1][2]} ns")
+    manifest.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Scores the image quality of raw frames and stores the scores in the frame manifest.
+
+usage:
+    frame_quality.py -f <image_folder_target> [-j <workers>] [-b <batch_size>] [--rescore] [-o <csv_file>]
+    [--min_sharpness <value>] [--max_clip_low <fraction>] [--max_clip_high <fraction>] [--min_contrast <value>]
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from loci.data_collection.frame_io import RAW_FORMATS, load_named_frame
+from loci.data_collection.frame_manifest import FrameManifest
+from loci.imaging.quality import QualityScore, QualityThresholds, score_raw
+
+
+def score_frames(target_path: str, names: List[str]) -> List[QualityScore]:
+    """Worker: scores a batch of frames, in the order of names."""
+    return [score_raw(load_named_frame(target_path, name)) for name in names]
+
+
+def score_all(target_path: str, workers: int = None, batch_size: int = 32, rescore: bool = False) -> int:
+    """Scores every (unscored) frame at target_path into its manifest. Returns the number scored."""
+    if workers is None:
+        workers = os.cpu_count()
+    manifest = FrameManifest(target_path)
+    manifest.refresh()
+    names = manifest.names(formats=RAW_FORMATS + ["container"])
+    if not rescore:
+        scored = manifest.quality()
+        names = [n for n in names if n not in scored]
+    batches = [names[i:i + batch_size] for i in range(0, len(names), batch_size)]
+
+    if workers <= 1 or len(batches) < 2:
+        for batch in batches:
+            manifest.set_quality(batch, score_frames(target_path, batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch, scores in zip(batches, pool.map(score_frames, [target_path] * len(batches), batches)):
+                manifest.set_quality(batch, scores)
+    manifest.close()
+    return len(names)
+
+
+##############
+# Command line thresholds
+##############
+
+def add_quality_arguments(parser: argparse.ArgumentParser):
+    """Adds the frame-quality threshold options shared by the processing scripts."""
+    parser.add_argument("--min_sharpness", type=float, default=None, action="store", help="Skip frames whose variance of Laplacian is below this (needs frame_quality.py scores)")
+    parser.add_argument("--max_clip_low", type=float, default=None, action="store", help="Skip frames with a larger fraction of near-black pixels")
+    parser.add_argument("--max_clip_high", type=float, default=None, action="store", help="Skip frames with a larger fraction of near-saturated pixels")
+    parser.add_argument("--min_contrast", type=float, default=None, action="store", help="Skip frames whose RMS contrast (std / mean) is below this")
+
+
+def quality_from_args(args) -> Optional[QualityThresholds]:
+    """The thresholds given on the command line, or None if none were."""
+    thresholds = QualityThresholds(args.min_sharpness, args.max_clip_low, args.max_clip_high, args.min_contrast)
+    if all(value is None for value in thresholds):
+        return None
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the image quality of raw frames into the frame manifest",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, required=True, action="store", help="Path to image targets (folder of frames or frame container)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), action="store", help="Number of scoring processes")
+    parser.add_argument("-b", "--batch_size", type=int, default=32, action="store", help="Frames scored per task")
+    parser.add_argument("--rescore", action="store_true", help="Score every frame, even if it already has scores")
+    parser.add_argument("-o", "--output", type=str, default="", action="store", help="Also write every frame's scores to this csv")
+    add_quality_arguments(parser)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    scored = score_all(args.file_target, workers=args.workers, batch_size=args.batch_size, rescore=args.rescore)
+    elapsed = time.perf_counter() - start
+    rate = scored / elapsed if elapsed > 0 else 0.
+    print(f"Scored {scored} frames in {elapsed:.1f}s ({rate:.1f} frames/s).")
+
+    manifest = FrameManifest(args.file_target)
+    scores = manifest.quality()
+    if len(scores) > 0:
+        values = np.array(list(scores.values()))
+        for i, field in enumerate(QualityScore._fields):
+            p5, p50, p95 = np.percentile(values[:, i], [5, 50, 95])
+            print(f"{field:>14}: p5 {p5:.4g}, median {p50:.4g}, p95 {p95:.4g}")
+    thresholds = quality_from_args(args)
+    if thresholds is not None:
+        passing = manifest.names(quality=thresholds)
+        print(f"{len(passing)} of {len(scores)} scored frames meet the thresholds.")
+    if args.output != "":
+        with open(args.output, "w") as f:
+            f.write("name," + ",".join(QualityScore._fields) + "\n")
+            f.writelines(f"{name}," + ",".join(f"{v:.6g}" for v in score) + "\n" for name, score in scores.items())
+    manifest.close()
+
+
+if __name__ == "__main__":
+    main()
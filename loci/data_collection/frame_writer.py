@@ -0,0 +1,243 @@
+"""Asynchronous frame persistence (buffer pool, bounded queue, writer threads) for the camera streaming callback."""
+
+import os
+import threading
+import collections
+import numpy as np
+from typing import Callable, NamedTuple, Optional
+
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "drop-newest")
+
+
+class FrameMeta(NamedTuple):
+    """Identifying information recorded for every captured frame."""
+    frame_id: int
+    capture_time: int  # host time.time_ns() at callback
+    frame_time: int  # camera timestamp
+    corrected_time: int = 0  # host time estimated from the camera timestamp (clock_model.py), 0 if none
+    dhash: Optional[int] = None  # perceptual hash (phash.py), if hashed at capture
+
+
+def frame_basename(meta: FrameMeta, prefix: str = "array") -> str:
+    """Standard file stem used for saved frames."""
+    return f"{prefix}_{meta.frame_id}_{meta.capture_time}_{meta.frame_time}"
+
+
+def save_npy(file_target: str) -> Callable:
+    """Returns a save function that writes one .npy per frame into file_target and returns its name."""
+    def _save(frame_data: np.ndarray, meta: FrameMeta) -> str:
+        fname = frame_basename(meta) + ".npy"
+        np.save(os.path.join(file_target, fname), frame_data)
+        return fname
+    return _save
+
+
+class WriterStream:
+    """One camera's share of a FrameWriter: its own save function, buffer pool and queue quota."""
+
+    def __init__(self, writer: "FrameWriter", save_fn: Callable, pool_size: int, queue_depth: int, writers: int,
+                 name: str):
+        if pool_size < queue_depth + writers:
+            # every queued frame plus every frame being written holds a buffer
+            pool_size = queue_depth + writers
+        self.writer = writer
+        self.save_fn = save_fn
+        self.pool_size = pool_size
+        self.queue_depth = queue_depth
+        self.writers = writers
+        self.name = name
+
+        self._free = []  # buffers available for the callback to fill
+        self._pending = collections.deque()  # (buffer, meta) waiting for a writer
+        self._in_flight = 0  # frames being saved by a writer thread
+        self._shape = None
+        self._dtype = None
+
+        # statistics, guarded by the writer's lock
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def _allocate(self, shape, dtype):
+        """Preallocate the buffer pool on the first frame, once its geometry is known."""
+        self._shape = shape
+        self._dtype = dtype
+        self._free = [np.empty(shape, dtype=dtype) for _ in range(self.pool_size)]
+
+    def _has_room(self) -> bool:
+        return len(self._free) > 0 and len(self._pending) < self.queue_depth
+
+    def submit(self, frame_data: np.ndarray, meta: FrameMeta) -> bool:
+        """Copy frame_data into the pool and queue it for writing. Returns False if dropped."""
+        writer = self.writer
+        with writer._lock:
+            if writer._closed:
+                return False
+            if self._shape is None:
+                self._allocate(frame_data.shape, frame_data.dtype)
+            elif frame_data.shape != self._shape or frame_data.dtype != self._dtype:
+                raise ValueError(f"Frame geometry changed from {self._shape} {self._dtype} "
+                                 f"to {frame_data.shape} {frame_data.dtype}")
+
+            self.submitted += 1
+            if not self._has_room():
+                if writer.overflow == "drop-newest":
+                    self.dropped += 1
+                    return False
+                elif writer.overflow == "drop-oldest" and len(self._pending) > 0:
+                    buf, _ = self._pending.popleft()
+                    self._free.append(buf)
+                    self.dropped += 1
+                while not self._has_room() and not writer._closed:
+                    # block policy, or drop-oldest with every buffer held by writers
+                    writer._not_full.wait()
+                if writer._closed:
+                    return False
+
+            buf = self._free.pop()
+        # copy outside of the lock so writers are not held up by the memcpy
+        np.copyto(buf, frame_data)
+        with writer._lock:
+            self._pending.append((buf, meta))
+            self.max_depth = max(self.max_depth, len(self._pending))
+            writer._not_empty.notify()
+        return True
+
+    @property
+    def depth(self) -> int:
+        """Number of frames currently waiting for a writer."""
+        with self.writer._lock:
+            return len(self._pending)
+
+    def _stats(self) -> dict:
+        return dict(submitted=self.submitted, written=self.written, dropped=self.dropped,
+                    errors=self.errors, depth=len(self._pending), max_depth=self.max_depth)
+
+    def stats(self) -> dict:
+        """Snapshot of stream counters."""
+        with self.writer._lock:
+            return self._stats()
+
+    def close(self, timeout: Optional[float] = None):
+        """Waits until everything this stream queued is written. The shared writer keeps running."""
+        with self.writer._lock:
+            self.writer._not_full.wait_for(lambda: len(self._pending) == 0 and self._in_flight == 0, timeout)
+
+
+class FrameWriter:
+    """Bounded, multi-threaded writer fed from the camera callback; submit() never touches the disk."""
+
+    def __init__(self, save_fn: Optional[Callable], pool_size: int = 16, queue_depth: int = 8,
+                 num_writers: int = 2, overflow: str = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow}, choose from {OVERFLOW_POLICIES}")
+        self.pool_size = pool_size
+        self.queue_depth = queue_depth
+        self.num_writers = num_writers
+        self.overflow = overflow
+
+        self._streams = []
+        self._next_stream = 0  # round-robin position of the writer threads
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        # FrameWriter(save_fn) writes a single default stream; FrameWriter(None) only serves stream()s
+        self._default = self.stream(save_fn, name="default") if save_fn is not None else None
+
+        self._threads = [threading.Thread(target=self._run, name=f"frame-writer-{i}", daemon=True)
+                         for i in range(num_writers)]
+        for t in self._threads:
+            t.start()
+
+    def stream(self, save_fn: Callable, name: str = "", pool_size: Optional[int] = None,
+               queue_depth: Optional[int] = None, writers: Optional[int] = None) -> WriterStream:
+        """Adds a stream with its own save function; unset sizes default to the writer's."""
+        writers = self.num_writers if writers is None else min(writers, self.num_writers)
+        stream = WriterStream(self, save_fn, pool_size if pool_size is not None else self.pool_size,
+                              queue_depth if queue_depth is not None else self.queue_depth, writers,
+                              name if name != "" else f"stream-{len(self._streams)}")
+        with self._lock:
+            self._streams.append(stream)
+        return stream
+
+    @property
+    def streams(self) -> list:
+        return list(self._streams)
+
+    @property
+    def save_fn(self) -> Callable:
+        return self._default.save_fn
+
+    @save_fn.setter
+    def save_fn(self, save_fn: Callable):
+        self._default.save_fn = save_fn
+
+    def submit(self, frame_data: np.ndarray, meta: FrameMeta) -> bool:
+        """Copy frame_data into the pool and queue it for writing. Returns False if dropped."""
+        return self._default.submit(frame_data, meta)
+
+    def _take(self):
+        """Next stream (round robin) with work queued and a writer thread to spare, or None."""
+        n = len(self._streams)
+        for k in range(n):
+            stream = self._streams[(self._next_stream + k) % n]
+            if len(stream._pending) > 0 and stream._in_flight < stream.writers:
+                self._next_stream = (self._next_stream + k + 1) % n
+                return stream
+        return None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                stream = self._take()
+                while stream is None and not self._closed:
+                    self._not_empty.wait()
+                    stream = self._take()
+                if stream is None:
+                    return  # closed and drained
+                buf, meta = stream._pending.popleft()
+                stream._in_flight += 1
+                self._not_full.notify_all()
+            try:
+                stream.save_fn(buf, meta)
+                ok = True
+            except Exception as e:
+                print(f"Failed to write frame {meta.frame_id}: {e}", flush=True)
+                ok = False
+            with self._lock:
+                if ok:
+                    stream.written += 1
+                else:
+                    stream.errors += 1
+                stream._in_flight -= 1
+                stream._free.append(buf)
+                self._not_full.notify_all()
+                self._not_empty.notify()  # the stream may have work that was waiting for a thread
+
+    @property
+    def depth(self) -> int:
+        """Number of frames currently waiting for a writer, across streams."""
+        with self._lock:
+            return sum(len(stream._pending) for stream in self._streams)
+
+    def stats(self) -> dict:
+        """Snapshot of writer counters, summed across streams."""
+        with self._lock:
+            totals = dict(submitted=0, written=0, dropped=0, errors=0, depth=0, max_depth=0)
+            for stream in self._streams:
+                for key, value in stream._stats().items():
+                    totals[key] = max(totals[key], value) if key == "max_depth" else totals[key] + value
+            return totals
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting frames, drain everything queued, and join the writer threads."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        for t in self._threads:
+            t.join(timeout)
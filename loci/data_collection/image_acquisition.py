@@ -1,32 +1,135 @@
-"""Collects images from a Prosilica GC Allied Vision Camera.
+"""Collects images from one or more Prosilica GC Allied Vision Cameras.
+
+With several --camera_ids, every camera streams concurrently into its own subfolder of the
+write path.
 
 Adapted from VimbaPython/Examples/asynchronous_grab_opencv.py
 """
 import os
+import re
+import time
 import argparse
+import contextlib
+import threading
 from vimba import *
 
-from loci.data_collection.utils import get_camera, setup_camera, FrameHandler
+from loci.data_collection.utils import get_camera, get_cameras, setup_camera, set_frame_rate, FrameHandler
+from loci.data_collection.frame_writer import FrameWriter, OVERFLOW_POLICIES
+from loci.data_collection.bayer_codec import CODECS, save_encoded
+from loci.data_collection.frame_container import FrameContainerWriter
+from loci.data_collection.frame_manifest import FrameManifest
+from loci.data_collection.clock_model import ClockModel
+from loci.data_collection.frame_dedup import TemporalDeduplicator
+from loci.data_collection.telemetry import METRIC_FORMATS, MetricsReporter, Telemetry
+from loci.data_collection.rate_controller import RateController
+from loci.data_collection.live_preview import LivePreview, window_title
+
+
+def camera_label(cam) -> str:
+    """Camera id made safe for use as a folder name."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", cam.get_id())
+
+
+def open_recording(cam, label: str, cam_path: str, writer: FrameWriter, shutdown_event: threading.Event, args,
+                   preview: LivePreview = None):
+    """Handler, container, metrics reporter and rate controller for one camera's frames in cam_path."""
+    if os.path.exists(cam_path) is False:
+        os.makedirs(cam_path)
+    if args.container is True:
+        container = FrameContainerWriter(cam_path, segment_frames=args.segment_frames, segment_seconds=args.segment_seconds, codec=args.codec)
+        save_fn = container.append
+    else:
+        container = None
+        save_fn = save_encoded(cam_path, args.codec)
+    stream = writer.stream(save_fn, name=label, writers=args.num_writers)
+    manifest = FrameManifest(cam_path) if args.no_manifest is False else None
+    clock = ClockModel(window=args.clock_window) if args.clock_window > 0 else None  # every camera has its own clock
+    dedup_interval_ns = int(args.dedup_interval * 1e9) if args.dedup_interval > 0 else None
+    dedup = TemporalDeduplicator(args.dedup_threshold, dedup_interval_ns) if args.dedup is True else None
+    telemetry = Telemetry() if args.no_metrics is False or args.adaptive is True else None
+    handler = FrameHandler(verbose=args.verbose, file_target=cam_path, writer=stream, manifest=manifest, clock=clock,
+                           dedup=dedup, preview_rate=args.preview_rate, preview_width=args.preview_width,
+                           save_png=args.save_png, telemetry=telemetry, shutdown_event=shutdown_event, name=label,
+                           preview=preview.stream(window_title(label)) if preview is not None else None)
+    reporter = None
+    if args.no_metrics is False:
+        # kept in a subfolder so rewriting it does not touch the frame folder's mtime (see frame_manifest.py)
+        metrics_path = os.path.join(cam_path, "metrics", f"metrics.{args.metrics_format}")
+        if args.metrics_path != "":
+            root, ext = os.path.splitext(args.metrics_path)
+            metrics_path = args.metrics_path if len(args.camera_ids) < 2 else f"{root}_{label}{ext}"
+        reporter = MetricsReporter(telemetry, metrics_path, interval=args.metrics_interval, fmt=args.metrics_format)
+    controller = None
+    if args.adaptive is True:
+        end_time = time.time() + args.deploy_days * 86400 if args.deploy_days > 0 else None
+        controller = RateController(handler, lambda fps: set_frame_rate(cam, fps), args.frames_per_second,
+                                    args.min_fps, args.max_fps if args.max_fps > 0 else args.frames_per_second,
+                                    interval=args.adapt_interval, reserve_gb=args.reserve_gb, end_time=end_time,
+                                    max_decimation=args.max_decimation, name=label,
+                                    log_path=os.path.join(cam_path, "metrics", "rate_changes.csv"))
+    return handler, container, reporter, controller
+
+
+def print_throughput(handlers: dict, elapsed: float, last_written: dict):
+    """Per-camera and aggregate frames written per second since the last report."""
+    parts = []
+    total = 0
+    for label, handler in handlers.items():
+        stats = handler.writer.stats()
+        written = stats["written"] - last_written.get(label, 0)
+        last_written[label] = stats["written"]
+        total += written
+        parts.append(f"{label} {written / elapsed:.2f} fps (queued {stats['depth']}, dropped {stats['dropped']})")
+    print(" | ".join(parts + [f"total {total / elapsed:.2f} fps"]), flush=True)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Data acquisition and recording protocol.")
     parser.add_argument("-w", "--write_path", type=str, action="store", default=os.getenv("OUTPUT_DIR"), help="Provide a target to write files")
+    parser.add_argument("-id", "--camera_ids", type=str, nargs="*", default=[], help="Ids of the cameras to stream concurrently; defaults to the first camera found.")
     parser.add_argument("-fps", "--frames_per_second", type=int, action="store", default=1, help="Frames per second to record (1, 2, 3 or 4)")
     parser.add_argument("-b", "--buffer", type=int, action="store", default=10, help="Number of frames to buffer when streaming.")
-    parser.add_argument("-v", "--verbose", type=bool, action="store", default=False, help="Whether to print to screen or render images.")
+    parser.add_argument("-v", "--verbose", type=bool, action="store", default=False, help="Whether to print to screen and show a live preview (press <Enter> in it to stop).")
     parser.add_argument("-xml", "--xml_settings", type=str, action="store", default="", help="Provide a target for user settings files" )
     parser.add_argument("-e", "--exposure", type=int, action="store", default=4000, help="Set MAX absolute exposure time.")
     parser.add_argument("-g", "--gain", type=int, action="store", default=20, help="Set the gain of the camera.")
+    parser.add_argument("-p", "--pool_size", type=int, action="store", default=16, help="Number of preallocated frame buffers for the writer, per camera.")
+    parser.add_argument("-q", "--queue_depth", type=int, action="store", default=8, help="Maximum number of frames waiting to be written, per camera.")
+    parser.add_argument("-nw", "--num_writers", type=int, action="store", default=2, help="Number of writer threads per camera.")
+    parser.add_argument("-o", "--overflow", type=str, action="store", default="block", choices=OVERFLOW_POLICIES,
+                        help="What to do when the writer falls behind: block the callback, drop the oldest or the newest frame.")
+    parser.add_argument("-c", "--container", action="store_true", help="Write frames into a chunked frame container instead of one .npy per frame.")
+    parser.add_argument("-k", "--codec", type=str, action="store", default="npy", choices=CODECS,
+                        help="On-disk frame codec; pack12 and delta-zlib store 12-bit frames losslessly in fewer bytes.")
+    parser.add_argument("-sf", "--segment_frames", type=int, action="store", default=2000, help="Frames per container segment before rolling over.")
+    parser.add_argument("-ss", "--segment_seconds", type=float, action="store", default=3600., help="Seconds per container segment before rolling over.")
+    parser.add_argument("--no_manifest", action="store_true", help="Do not record saved frames in the frame manifest.")
+    parser.add_argument("-cw", "--clock_window", type=int, action="store", default=600,
+                        help="Frames in the sliding camera-to-host clock fit whose corrected times go to the manifest; 0 disables.")
+    parser.add_argument("-pr", "--preview_rate", type=float, action="store", default=2., help="Live preview frames per second in verbose mode; 0 disables the preview.")
+    parser.add_argument("-pw", "--preview_width", type=int, action="store", default=680, help="Live preview width in pixels.")
+    parser.add_argument("--save_png", action="store_true", help="Also write a full-resolution rendered png of every frame.")
+    parser.add_argument("--no_metrics", action="store_true", help="Do not collect acquisition telemetry.")
+    parser.add_argument("-mf", "--metrics_format", type=str, action="store", default="csv", choices=METRIC_FORMATS,
+                        help="Telemetry snapshot format: rotating csv rows, or a Prometheus textfile.")
+    parser.add_argument("-mi", "--metrics_interval", type=float, action="store", default=10., help="Seconds between telemetry snapshots.")
+    parser.add_argument("-mp", "--metrics_path", type=str, action="store", default="",
+                        help="Telemetry file; defaults to metrics/metrics.<format> under each camera's write path.")
+    parser.add_argument("-st", "--status_interval", type=float, action="store", default=60., help="Seconds between throughput reports.")
+    parser.add_argument("--adaptive", action="store_true", help="Adapt the frame rate to what the writer, network and disk sustain.")
+    parser.add_argument("-fmin", "--min_fps", type=float, action="store", default=0.25, help="Lowest frame rate the adaptive controller may set.")
+    parser.add_argument("-fmax", "--max_fps", type=float, action="store", default=0., help="Highest frame rate the adaptive controller may set; defaults to --frames_per_second.")
+    parser.add_argument("-ai", "--adapt_interval", type=float, action="store", default=30., help="Seconds between adaptive frame rate decisions.")
+    parser.add_argument("-md", "--max_decimation", type=int, action="store", default=1, help="At the lowest frame rate, save as few as one in this many frames when overloaded.")
+    parser.add_argument("-rg", "--reserve_gb", type=float, action="store", default=5., help="Free disk space (GB) the adaptive controller keeps in reserve.")
+    parser.add_argument("-dd", "--deploy_days", type=float, action="store", default=0.,
+                        help="Days the deployment must last; the adaptive controller keeps the saved rate within the disk space left. 0 disables.")
+    parser.add_argument("--dedup", action="store_true", help="Hash frames at capture and drop near-duplicates of the last saved frame.")
+    parser.add_argument("-dt", "--dedup_threshold", type=int, action="store", default=6, help="Differing hash bits (of 64) below which a frame is a duplicate.")
+    parser.add_argument("-di", "--dedup_interval", type=float, action="store", default=600., help="Save at least one frame every this many seconds when deduplicating; 0 disables.")
 
     args = parser.parse_args()
-    fps = args.frames_per_second
     write_path = args.write_path
-    stream_buffer = args.buffer
-    verbose = args.verbose
-    settings_xml = args.xml_settings
-    exposure_time = args.exposure
-    gain_db = args.gain
 
     # Make the write path target if it is not already in existence
     if os.path.exists(write_path) is False:
@@ -34,16 +137,60 @@ if __name__ == '__main__':
 
     # Create the camera image acquisition
     with Vimba.get_instance():
-        with get_camera(None) as cam:
+        cams = get_cameras(args.camera_ids) if len(args.camera_ids) > 0 else [get_camera(None)]
+        with contextlib.ExitStack() as stack:
+            for cam in cams:
+                stack.enter_context(cam)
 
-            # Start streaming at the frame rate specified
-            setup_camera(cam, fps=fps, exposure_time=exposure_time, gain_setting=gain_db, settings_file=settings_xml)
-            handler = FrameHandler(verbose=verbose, file_target=write_path)
+            # One writer backend for all cameras, sized per camera
+            writer = FrameWriter(None, pool_size=args.pool_size, queue_depth=args.queue_depth,
+                                 num_writers=args.num_writers * len(cams), overflow=args.overflow)
+            shutdown_event = threading.Event()
+            # HighGUI is not thread-safe: one preview thread renders every camera's window
+            preview = None
+            if args.verbose is True and args.preview_rate > 0:
+                preview = LivePreview(shutdown_event, rate=args.preview_rate, width=args.preview_width)
+            handlers, containers, reporters, controllers = {}, [], [], []
+            for cam in cams:
+                # Start streaming at the frame rate specified
+                setup_camera(cam, fps=args.frames_per_second, exposure_time=args.exposure, gain_setting=args.gain, settings_file=args.xml_settings)
+                label = camera_label(cam)
+                cam_path = write_path if len(cams) == 1 else os.path.join(write_path, label)
+                handler, container, reporter, controller = open_recording(cam, label, cam_path, writer, shutdown_event, args, preview)
+                handlers[label] = handler
+                containers.append(container)
+                reporters.append(reporter)
+                controllers.append(controller)
 
+            start = time.monotonic()
+            streaming = []
             try:
                 # Start Streaming with a custom a buffer of 10 Frames (defaults to 5)
-                cam.start_streaming(handler=handler, buffer_count=stream_buffer, allocation_mode=AllocationMode.AnnounceFrame)
-                handler.shutdown_event.wait()
+                for cam, handler in zip(cams, handlers.values()):
+                    cam.start_streaming(handler=handler, buffer_count=args.buffer, allocation_mode=AllocationMode.AnnounceFrame)
+                    streaming.append(cam)
+                last_report, last_written = start, {}
+                while not shutdown_event.wait(args.status_interval):
+                    now = time.monotonic()
+                    print_throughput(handlers, now - last_report, last_written)
+                    last_report = now
 
             finally:
-                cam.stop_streaming()
+                for label, controller in zip(handlers, controllers):
+                    if controller is not None:
+                        controller.close()
+                        print(f"{label} frame rate control: {controller.stats()}", flush=True)
+                for cam in streaming:
+                    cam.stop_streaming()
+                for handler in handlers.values():
+                    handler.close()
+                if preview is not None:
+                    preview.close()
+                writer.close()
+                for reporter in reporters:
+                    if reporter is not None:
+                        reporter.close()
+                for container in containers:
+                    if container is not None:
+                        container.close()
+                print_throughput(handlers, time.monotonic() - start, {})
@@ -1,67 +1,79 @@
-"""Takes array targets and converts to png images with color correction."""
+"""Takes array targets and converts to png images with color correction.
+
+The flat-field model is fit once and saved alongside the data (flat_field.npz by default);
+later runs load it and only apply the correction. Use --refit to rebuild the model.
+"""
 
 import argparse
 import os
 import cv2
-import numpy as np
 import matplotlib.pyplot as plt
 
+from loci.data_collection.frame_io import iter_frames
+from loci.data_collection.frame_manifest import open_manifest
+from loci.data_collection.frame_quality import add_quality_arguments, quality_from_args
+from loci.data_collection.flat_field import FlatFieldModel, fit_parallel
+from loci.data_collection.local_contrast import LocalContrastCorrector
+from loci.imaging.bayer import DECODE_MODES, decode, decode_scale
+
 
 def main():
     parser = argparse.ArgumentParser(description="Process image folder target for debug visualization",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-f", "--file_target", type=str, default=os.path.join(os.getenv("OUTPUT_DIR"), "dockwater_test"), action="store", help="Path to image targets")
+    parser.add_argument("-f", "--file_target", type=str, default=os.path.join(os.getenv("OUTPUT_DIR"), "dockwater_test"), action="store", help="Path to image targets (folder of .npy frames or frame container)")
+    parser.add_argument("-m", "--model", type=str, default="", action="store", help="Flat-field model file; defaults to flat_field.npz in the image target folder")
+    parser.add_argument("-w", "--write_target", type=str, default="", action="store", help="Folder to write corrected png images to; if empty, images are shown on screen")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), action="store", help="Number of processes used to fit the model")
+    parser.add_argument("--refit", action="store_true", help="Refit the flat-field model even if a saved one exists")
+    parser.add_argument("-d", "--decode", type=str, default="full", choices=DECODE_MODES, action="store", help="Full-resolution demosaic, or fast half-resolution 2x2 superpixels")
+    add_quality_arguments(parser)
 
     # Get the user arguments
     args = parser.parse_args()
     target_path = args.file_target
+    model_path = args.model if args.model != "" else os.path.join(target_path, "flat_field.npz")
+    write_path = args.write_target
 
-    summer = np.zeros((2048, 2048, 3))
-    std_summer = np.zeros((2048, 2048, 3))
-    count = 0
-
-    # Compute average frame
-    for fname in os.listdir(target_path):
-        if ".npy" in fname:
-            # convert to an image
-            array_target = np.load(os.path.join(target_path, fname))
-            img = cv2.cvtColor(array_target, cv2.COLOR_BAYER_GR2RGB)
-            summer += img
-            count += 1
-        else:
-            continue
-    f_avg = summer / count
+    # Compute (or load) the average frame
+    if args.refit or not os.path.exists(model_path):
+        model = fit_parallel(target_path, workers=args.workers)
+        if model.count == 0:
+            print(f"No frames found at {target_path}.")
+            return
+        model.save(model_path)
+        print(f"Flat-field model of {model.count} frames written to {model_path}.")
+    else:
+        model = FlatFieldModel.load(model_path)
+    f_avg = model.mean
+    scale = decode_scale(args.decode)
+    if scale > 1:
+        # the model is fit on full demosaics; an area average over each 2x2 cell matches a superpixel
+        f_avg = cv2.resize(f_avg, (f_avg.shape[1] // scale, f_avg.shape[0] // scale), interpolation=cv2.INTER_AREA)
+    # f_std = model.std
 
-    # # Compute stdev frame
-    # for fname in os.listdir(target_path):
-    #     if ".npy" in fname:
-    #         # convert to an image
-    #         array_target = np.load(os.path.join(target_path, fname))
-    #         img = cv2.cvtColor(array_target, cv2.COLOR_BAYER_GR2RGB)
-    #         std_summer += (img - f_avg) ** 2
-    #     else:
-    #         continue
-    # f_std = np.sqrt(std_summer / (count - 1))
+    if write_path != "" and os.path.exists(write_path) is False:
+        os.makedirs(write_path)
 
     # Adjust image
-    for fname in os.listdir(target_path):
-        if ".npy" in fname:
-            # convert to an image
-            array_target = np.load(os.path.join(target_path, fname))
-            img = cv2.cvtColor(array_target, cv2.COLOR_BAYER_GR2RGB)
-            rbar = img / f_avg
-            # sigmabar = np.mean(np.mean(f_std / f_avg, axis=0), axis=0)
-            exp_convolve = cv2.filter2D(src=img, ddepth=-1, kernel=np.ones((7,7), np.float32))
-            std_convolve = np.linalg.norm(img - exp_convolve, ord=1, axis=1)
-            std_c = np.median(cv2.filter2D(src=std_convolve, ddepth=-1, kernel=np.ones((7,7), np.float32)) / exp_convolve)
-            img = rbar * std_c
-            img = cv2.normalize(img, None,  0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-            cv2.namedWindow("image", cv2.WINDOW_NORMAL)
-            cv2.imshow("image", img)
-            cv2.resizeWindow("image", 1000, 1000)
-            cv2.waitKey(-1)
-        else:
+    manifest = open_manifest(target_path) if write_path != "" else None
+    corrector = LocalContrastCorrector(f_avg.shape)
+    for fname, array_target in iter_frames(target_path, quality=quality_from_args(args)):
+        # convert to an image
+        img = decode(array_target, args.decode)
+        img, _ = corrector.correct(img, f_avg)
+        if write_path != "":
+            out_path = os.path.join(write_path, f"corrected_{fname.split('.')[0]}.png")
+            cv2.imwrite(out_path, img)
+            if manifest is not None:
+                manifest.add_product(fname, "corrected", out_path)
             continue
+        cv2.namedWindow("image", cv2.WINDOW_NORMAL)
+        cv2.imshow("image", img)
+        cv2.resizeWindow("image", 1000, 1000)
+        cv2.waitKey(-1)
+    corrector.close()
+    if manifest is not None:
+        manifest.close()
 
 if __name__ == "__main__":
     main()
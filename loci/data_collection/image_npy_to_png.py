@@ -1,52 +1,212 @@
-"""Takes array targets and converts to png images."""
+"""Takes array targets (a folder of .npy frames or a frame container) and converts to png images.
+
+With a write target and no verbose rendering, frames are converted in batch and frames whose
+png is already up to date are skipped (use --force to redo all).
+"""
 
 import argparse
 import os
+import time
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional
+
+from loci.data_collection.frame_io import iter_frames, list_frames
+from loci.data_collection.frame_container import FrameContainer, is_container
+from loci.data_collection.bayer_codec import load_frame, is_frame_file
+from loci.data_collection.frame_manifest import FrameManifest, open_manifest
+from loci.data_collection.frame_io import RAW_FORMATS
+from loci.data_collection.frame_quality import add_quality_arguments, quality_from_args
+from loci.imaging.quality import QualityThresholds
+from loci.imaging.bayer import DECODE_MODES, decode, decode_scale, scale_to_uint8
+
+
+HOUSING_CROP = (220, 210, 110, 60)  # top, bottom, left, right margins in full-resolution pixels
+
+
+def frame_to_png(array_target: np.ndarray, decode_mode: str = "full", eight_bit: bool = False) -> np.ndarray:
+    """Decode, crop the housing from view, and scale 12-bit data to the 16-bit (or 8-bit) range."""
+    img = decode(array_target, decode_mode)
+    top, bottom, left, right = (m // decode_scale(decode_mode) for m in HOUSING_CROP)
+    img = img[top:-bottom, left:-right, :]  # crop first, so only the kept pixels are scaled
+    # img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    if eight_bit is True:
+        return scale_to_uint8(img)
+    return np.left_shift(img, 4, out=img)  # x16 in place; img is our own decoded buffer
+
+
+def render_mode(decode_mode: str = "full", eight_bit: bool = False) -> str:
+    """Tag of a non-default rendering ("fast", "8bit", "fast_8bit"); "" for full 16-bit pngs."""
+    parts = (["fast"] if decode_mode == "fast" else []) + (["8bit"] if eight_bit is True else [])
+    return "_".join(parts)
+
+
+def png_product(render: str = "") -> str:
+    """Manifest product name of pngs rendered in a mode."""
+    return "png" if render == "" else f"png_{render}"
+
+
+def png_name(write_path: str, fname: str, render: str = "") -> str:
+    target_strip = fname.split(".")[0]
+    return os.path.join(write_path, f"{png_product(render)}_{target_strip}.png")
+
+
+def png_is_current(out_path: str, source_mtime: float) -> bool:
+    """Whether the png at out_path exists and is not older than its source."""
+    try:
+        return os.stat(out_path).st_mtime >= source_mtime
+    except FileNotFoundError:
+        return False
+
+
+def iter_tasks(target_path: str, write_path: str, force: bool = False, manifest: FrameManifest = None,
+               quality: Optional[QualityThresholds] = None, unique: bool = False, render: str = ""):
+    """Streams (source, key, fname, out_path) for every frame whose png (in render mode) is missing or stale."""
+    if is_container(target_path):
+        frames = FrameContainer(target_path)
+        passing = set(list_frames(target_path, quality=quality, unique=unique)) if quality is not None or unique else None
+        for i in range(len(frames)):
+            fname = frames.name(i)
+            out_path = png_name(write_path, fname, render)
+            if passing is not None and fname not in passing:
+                continue
+            if force or not os.path.exists(out_path):  # container frames never change once written
+                yield target_path, i, fname, out_path
+        return
+
+    if (quality is not None or unique) and manifest is None:
+        raise ValueError(f"{target_path} has no frame manifest to read quality scores or duplicates from; "
+                         f"run frame_quality.py / frame_dedup.py first")
+    if manifest is not None:
+        done = {} if force else manifest.products(png_product(render))
+        for fname in manifest.names(formats=RAW_FORMATS, quality=quality, unique=unique):
+            out_path = png_name(write_path, fname, render)
+            source = os.path.join(target_path, fname)
+            if not force and os.path.exists(source) and png_is_current(out_path, os.stat(source).st_mtime):
+                if done.get(fname) != out_path:
+                    manifest.add_product(fname, png_product(render), out_path)  # written before the manifest knew it
+                continue  # up to date; a missing source is left to fail in the conversion
+            yield target_path, source, fname, out_path
+        return
+
+    with os.scandir(target_path) as entries:
+        for entry in entries:
+            if not entry.is_file() or not is_frame_file(entry.name):
+                continue
+            out_path = png_name(write_path, entry.name, render)
+            if not force and png_is_current(out_path, entry.stat().st_mtime):
+                continue  # up to date
+            yield target_path, entry.path, entry.name, out_path
+
+
+_containers = {}  # per-process cache of opened containers
+
+
+def convert_task(task, decode_mode: str = "full", eight_bit: bool = False) -> str:
+    """Worker: load, decode, crop, and encode one frame. Returns the frame name."""
+    source, key, fname, out_path = task
+    if isinstance(key, str):
+        array_target = load_frame(key)
+    else:
+        if source not in _containers:
+            _containers[source] = FrameContainer(source)
+        array_target = _containers[source][key]
+    if not cv2.imwrite(out_path, frame_to_png(array_target, decode_mode, eight_bit)):
+        raise IOError(f"Could not write {out_path}")
+    return fname
+
+
+def convert_batch(target_path: str, write_path: str, workers: int = None, force: bool = False,
+                  quality: Optional[QualityThresholds] = None, unique: bool = False, decode_mode: str = "full",
+                  eight_bit: bool = False) -> list:
+    """Converts every out-of-date frame using a process pool. Returns (frame name, error message) of failures."""
+    if workers is None:
+        workers = os.cpu_count()
+    if os.path.exists(write_path) is False:
+        os.makedirs(write_path)
+
+    manifest = open_manifest(target_path) if not is_container(target_path) else None
+    render = render_mode(decode_mode, eight_bit)
+    failures = []
+    converted = 0
+    max_in_flight = workers * 4  # bound the number of submitted tasks so the work list streams
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        tasks = iter_tasks(target_path, write_path, force=force, manifest=manifest, quality=quality, unique=unique,
+                           render=render)
+        exhausted = False
+        while not exhausted or len(in_flight) > 0:
+            while not exhausted and len(in_flight) < max_in_flight:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                in_flight[pool.submit(convert_task, task, decode_mode, eight_bit)] = task
+            if len(in_flight) == 0:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                _, _, fname, out_path = in_flight.pop(future)
+                try:
+                    future.result()
+                    converted += 1
+                    if manifest is not None:
+                        manifest.add_product(fname, png_product(render), out_path)
+                except Exception as e:
+                    failures.append((fname, str(e)))
+
+    if manifest is not None:
+        manifest.close()
+    elapsed = time.perf_counter() - start
+    rate = converted / elapsed if elapsed > 0 else 0.
+    print(f"Converted {converted} frames in {elapsed:.1f}s ({rate:.1f} frames/s), {len(failures)} failures.")
+    return failures
 
 
 def main():
     parser = argparse.ArgumentParser(description="Process image folder target for debug visualization",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-f", "--file_target", type=str, default="./output", action="store", help="Path to image targets")
+    parser.add_argument("-f", "--file_target", type=str, default="./output", action="store", help="Path to image targets (folder of .npy frames or frame container)")
     parser.add_argument("-w", "--write_target", type=str, default="")
     parser.add_argument("-v", "--verbose", type=bool, default=False)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), action="store", help="Number of conversion processes for batch mode.")
+    parser.add_argument("--force", action="store_true", help="Convert every frame, even if its png is up to date.")
+    add_quality_arguments(parser)
+    parser.add_argument("--unique", action="store_true", help="Skip frames marked as near-duplicates by frame_dedup.py.")
+    parser.add_argument("-d", "--decode", type=str, default="full", choices=DECODE_MODES, action="store", help="Full-resolution demosaic, or fast half-resolution 2x2 superpixels.")
+    parser.add_argument("--eight_bit", action="store_true", help="Write 8-bit pngs instead of 16-bit.")
 
     # Get the user arguments
     args = parser.parse_args()
     target_path = args.file_target
     write_path = args.write_target
     verbose = args.verbose
+    quality = quality_from_args(args)
+
+    if verbose is not True:
+        if write_path != "":
+            failures = convert_batch(target_path, write_path, workers=args.workers, force=args.force, quality=quality,
+                                     unique=args.unique, decode_mode=args.decode, eight_bit=args.eight_bit)
+            for fname, error in failures:
+                print(f"Failed to convert {fname}: {error}")
+        return
+
+    for fname, array_target in iter_frames(target_path, quality=quality, unique=args.unique):
+        # convert to an image
+        try:
+            img = frame_to_png(array_target, args.decode, args.eight_bit)
+            cv2.namedWindow("image", cv2.WINDOW_NORMAL)
+            cv2.imshow("image", img)
+            cv2.resizeWindow("image", 1000, 1000)
+            cv2.waitKey(-1)
 
-    for fname in os.listdir(target_path):
-        if ".npy" in fname:
-            # convert to an image
-            try:
-                array_target = np.load(os.path.join(target_path, fname))
-                img = cv2.cvtColor(array_target, cv2.COLOR_BAYER_GR2RGB)
-                img = img*16
-                # img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-                img = img[220:-210, 110:-60, :]
-                if verbose is True:
-                    cv2.namedWindow("image", cv2.WINDOW_NORMAL)
-                    cv2.imshow("image", img)
-                    cv2.resizeWindow("image", 1000, 1000)
-                    cv2.waitKey(-1)
-                else:
-                    pass
-
-                if write_path != "":
-                    target_strip = fname.split(".")[0]
-                    filename = os.path.join(write_path, f"png_{target_strip}.png")
-                    cv2.imwrite(filename, img)
-            except:
-                pass
-
-        else:
-            print(f"No valid image at {fname}, skipping.")
-            continue
+            if write_path != "":
+                cv2.imwrite(png_name(write_path, fname, render_mode(args.decode, args.eight_bit)), img)
+        except Exception as e:
+            print(f"Failed to convert {fname}: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+"""Logs any number of Atlas Scientific EZO probes from one asyncio process.
+
+Every probe writes "<time_ns>,<probe name>,<reading>" lines into one shared output file.
+
+usage:
+    insitu_logger.py -c <config_yaml> [-w <write_path>] [-n <file_name>] [-t <store_path>] [--simulate]
+
+Config file:
+    probes:
+      - name: temp            # written with every reading
+        port: /dev/ttyUSB0
+        baud: 9600            # optional, default 9600
+        command: R            # optional, default R
+        rate: 1               # optional, Hz, default 1
+        timeout: 1            # optional, seconds to wait for each reading, default 1
+      - name: ph
+        port: /dev/ttyUSB1
+        rate: 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import yaml
+import serial
+from typing import List, NamedTuple, Optional
+
+from loci.data_collection.ezo import LineFramer, DeadlineScheduler, TimingStats, ProbeSimulator, is_data_line
+from loci.data_collection.ezo import RESPONSE_TIME, RESPONSE_TIMEOUT
+from loci.data_collection.timeseries_store import TimeSeriesWriter
+
+
+class ProbeConfig(NamedTuple):
+    name: str
+    port: str
+    baud: int = 9600
+    command: str = "R"
+    rate: float = 1.  # Hz
+    timeout: float = RESPONSE_TIMEOUT  # seconds to wait for each reading
+
+
+def load_config(config_path: str) -> List[ProbeConfig]:
+    """Probe descriptions from a YAML config file."""
+    with open(config_path, "r") as f:
+        data = yaml.safe_load(f)
+    probes = [ProbeConfig(**probe) for probe in data["probes"]]
+    names = [p.name for p in probes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Probe names must be unique, got {names}")
+    return probes
+
+
+class AsyncProbe:
+    """One EZO probe on a serial port, read through the event loop without blocking."""
+
+    def __init__(self, config: ProbeConfig):
+        self.config = config
+        self.ser = serial.Serial(config.port, config.baud, timeout=0)
+        self.framer = LineFramer()
+        self.lines = asyncio.Queue()
+        try:
+            asyncio.get_running_loop().add_reader(self.ser.fileno(), self._on_readable)
+        except Exception:
+            self.ser.close()
+            raise
+
+    def _on_readable(self):
+        for line in self.framer.feed(self.ser.read(max(1, self.ser.in_waiting))):
+            self.lines.put_nowait(line)
+
+    def send_cmd(self, cmd: str):
+        self.ser.write((cmd + "\r").encode("utf-8"))
+
+    def drain(self):
+        """Drops everything received but not read, e.g. the late answer to a timed-out query."""
+        self.ser.reset_input_buffer()
+        self.framer = LineFramer()
+        while not self.lines.empty():
+            self.lines.get_nowait()
+
+    async def query(self, cmd: str, timeout: float) -> str:
+        """Sends cmd and returns the first data line of the response, or None on timeout."""
+        self.drain()  # a late answer to an earlier, timed out query
+        self.send_cmd(cmd)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = await asyncio.wait_for(self.lines.get(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                return None
+            if is_data_line(line):
+                return line.decode("utf-8", errors="replace").strip()
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.ser.fileno())
+        self.ser.close()
+
+
+class BatchedSink:
+    """Shared output for all probes. Lines are batched in memory and written every flush_interval seconds."""
+
+    def __init__(self, file_target: str, flush_interval: float = 5., store: Optional[TimeSeriesWriter] = None):
+        self.file_target = file_target
+        self.flush_interval = flush_interval
+        self.store = store
+        self._batch = []
+        self._f = open(file_target, "a")
+        self.written = 0
+
+    def add(self, time_ns: int, name: str, value: str):
+        self._batch.append(f"{time_ns},{name},{value}\n")
+        if self.store is not None:
+            self.store.add_reading(time_ns, name, value)
+
+    def flush(self):
+        if len(self._batch) > 0:
+            self._f.writelines(self._batch)
+            self._f.flush()
+            self.written += len(self._batch)
+            self._batch = []
+        if self.store is not None:
+            self.store.flush()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self._f.close()
+        if self.store is not None:
+            self.store.close()
+
+
+async def poll_probe(probe: AsyncProbe, sink: BatchedSink, stats: TimingStats, verbose: bool = False):
+    """Polls one probe on its own fixed schedule until cancelled."""
+    period = 1. / probe.config.rate
+    timeout = max(probe.config.timeout, RESPONSE_TIME)  # a shorter wait would take each answer for the next query's
+    probe.send_cmd("C,0") # turn off continuous mode
+    await asyncio.sleep(1.)
+    probe.drain()
+
+    scheduler = DeadlineScheduler(period)
+    while True:
+        deadline = scheduler.next_deadline()
+        await asyncio.sleep(max(0., deadline - time.monotonic()))
+        stats.add(time.monotonic() - deadline)
+        # a slow answer overruns the next deadlines, which next_deadline skips
+        data = await probe.query(probe.config.command, timeout=timeout)
+        response_time = time.time_ns()
+        if data is not None:
+            sink.add(response_time, probe.config.name, data)
+            if verbose is True:
+                print("Response from", probe.config.name, "at", response_time, ":", data)
+
+
+def print_stats(name: str, stats: TimingStats):
+    report = stats.report()
+    print(f"{name}: {report['samples']} samples, jitter mean {report['jitter_mean_ms']:.2f} ms, "
+          f"p99 {report['jitter_p99_ms']:.2f} ms, max {report['jitter_max_ms']:.2f} ms, "
+          f"process cpu {report['cpu_percent']:.1f}%")
+
+
+async def run_logger(configs: List[ProbeConfig], file_target: str, flush_interval: float = 5.,
+                     stats_interval: float = 60., duration: float = 0., verbose: bool = False, store_path: str = ""):
+    """Polls every configured probe until cancelled (or for duration seconds)."""
+    store, sink, probes, stats, tasks = None, None, [], {}, []
+
+    async def _report():
+        while True:
+            await asyncio.sleep(stats_interval)
+            for name, s in stats.items():
+                print_stats(name, s)
+                s.reset()
+
+    try:
+        # the sink decides when to flush, so the store never flushes on its own
+        store = TimeSeriesWriter(store_path, flush_interval=float("inf")) if store_path != "" else None
+        sink = BatchedSink(file_target, flush_interval=flush_interval, store=store)
+        for config in configs:
+            probes.append(AsyncProbe(config))  # appended one by one, so a port that fails to open closes the rest
+        stats = {p.config.name: TimingStats() for p in probes}
+        tasks = [asyncio.create_task(poll_probe(p, sink, stats[p.config.name], verbose)) for p in probes]
+        tasks.append(asyncio.create_task(sink.run()))
+        tasks.append(asyncio.create_task(_report()))
+        if duration > 0:
+            await asyncio.sleep(duration)
+        else:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for name, s in stats.items():
+            print_stats(name, s)
+        for probe in probes:
+            probe.close()
+        if sink is not None:
+            sink.close()
+            print(f"Wrote {sink.written} readings to {file_target}")
+        elif store is not None:
+            store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log several in situ probes from one process.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-c", "--config", type=str, required=True, action="store", help="YAML file describing the probes")
+    parser.add_argument("-w", "--write_path", type=str, action="store", default=os.getenv("OUTPUT_DIR"), help="Provide a target to write files")
+    parser.add_argument("-n", "--file_name", type=str, action="store", default="insitu_log.txt", help="Name of file to write probe data")
+    parser.add_argument("-f", "--flush_interval", type=float, action="store", default=5., help="Seconds between batched writes")
+    parser.add_argument("-s", "--stats_interval", type=float, action="store", default=60., help="Seconds between timing reports")
+    parser.add_argument("-d", "--duration", type=float, action="store", default=0., help="Stop after this many seconds; 0 runs until ctrl-c")
+    parser.add_argument("-t", "--store", type=str, action="store", default="", help="Also append readings to this columnar time series store")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every reading")
+    parser.add_argument("--simulate", action="store_true", help="Poll simulated probes on pseudo-terminals instead of the serial ports")
+    args = parser.parse_args()
+
+    # Make the write path target if it is not already in existence
+    if os.path.exists(args.write_path) is False:
+        os.makedirs(args.write_path)
+
+    configs = load_config(args.config)
+    simulators = []
+    if args.simulate is True:
+        simulators = [ProbeSimulator() for _ in configs]
+        configs = [c._replace(port=s.port) for c, s in zip(configs, simulators)]
+
+    try:
+        asyncio.run(run_logger(configs, os.path.join(args.write_path, args.file_name), args.flush_interval,
+                               args.stats_interval, args.duration, args.verbose, args.store))
+    except KeyboardInterrupt:
+        print("Polling stopped")
+    finally:
+        for s in simulators:
+            s.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Decimated, latest-wins live preview of one or more camera streams, rendered off the streaming thread."""
+
+import threading
+import time
+import cv2
+import numpy as np
+
+from loci.imaging.bayer import bin_color, scale_to_uint8
+
+
+ENTER_KEY_CODE = 13
+
+
+def window_title(name: str = "") -> str:
+    """Preview window name for a camera label ("" for a single unnamed camera)."""
+    title = f"Stream from '{name}'" if name != "" else "Stream"
+    return f"{title}. Press <Enter> to stop stream."
+
+
+def preview_image(raw: np.ndarray, width: int = 680) -> np.ndarray:
+    """Small uint8 colour rendering of a raw 12-bit Bayer frame."""
+    img = bin_color(raw)
+    if img.shape[1] > width:
+        height = max(1, round(img.shape[0] * width / img.shape[1]))
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    return scale_to_uint8(img)
+
+
+class PreviewStream:
+    """One camera's window of a LivePreview, with its own rate limit and latest-wins slot."""
+
+    def __init__(self, preview: "LivePreview", window_name: str):
+        self.preview = preview
+        self.window_name = window_name
+        self._slot = None  # latest frame not yet rendered, guarded by the preview's lock
+        self._next_due = 0.
+        self._closed = False
+        self.offered = 0
+        self.accepted = 0
+        self.replaced = 0  # accepted frames overwritten before they were rendered
+        self.rendered = 0
+
+    def offer(self, frame_data: np.ndarray) -> bool:
+        """Called from the camera callback. Copies the frame only if a preview frame is due."""
+        self.offered += 1
+        now = time.monotonic()
+        if now < self._next_due or self._closed or self.preview._stop.is_set():
+            return False
+        self._next_due = now + self.preview.period
+        frame_copy = frame_data.copy()  # the camera reuses frame_data once the callback returns
+        with self.preview._lock:
+            if self._slot is not None:
+                self.replaced += 1
+            self._slot = frame_copy
+        self.accepted += 1
+        self.preview._ready.set()
+        return True
+
+    def stats(self) -> dict:
+        return dict(offered=self.offered, accepted=self.accepted, replaced=self.replaced, rendered=self.rendered)
+
+    def close(self):
+        """Stops accepting frames; the window stays until the LivePreview is closed."""
+        self._closed = True
+
+
+class LivePreview:
+    """Latest-wins preview windows, all rendered on one thread."""
+
+    def __init__(self, shutdown_event: threading.Event, rate: float = 2., width: int = 680,
+                 window_name: str = window_title(), key_poll: float = 0.05):
+        self.shutdown_event = shutdown_event  # set when Enter is pressed in any window
+        self.period = 1. / rate if rate > 0 else 0.
+        self.width = width
+        self.key_poll = key_poll
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._streams = []
+        self._default = self.stream(window_name)  # used by offer(); its window opens on its first frame
+        self._thread = threading.Thread(target=self._run, name="live-preview", daemon=True)
+        self._thread.start()
+
+    def stream(self, window_name: str) -> PreviewStream:
+        """Adds a window (e.g. one per camera) rendered by this preview's thread."""
+        stream = PreviewStream(self, window_name)
+        with self._lock:
+            self._streams.append(stream)
+        return stream
+
+    def offer(self, frame_data: np.ndarray) -> bool:
+        """Offers a frame to the default window (see PreviewStream.offer)."""
+        return self._default.offer(frame_data)
+
+    def _take(self) -> list:
+        """(stream, frame) for every stream with a frame waiting."""
+        with self._lock:
+            taken = [(stream, stream._slot) for stream in self._streams if stream._slot is not None]
+            for stream, _ in taken:
+                stream._slot = None
+            self._ready.clear()
+        return taken
+
+    def _run(self):
+        opened = []
+        try:
+            while not self._stop.is_set():
+                if self._ready.wait(timeout=self.key_poll):
+                    for stream, frame in self._take():
+                        if stream.window_name not in opened:
+                            cv2.namedWindow(stream.window_name, cv2.WINDOW_NORMAL)
+                            opened.append(stream.window_name)
+                        cv2.imshow(stream.window_name, preview_image(frame, self.width))
+                        stream.rendered += 1
+                if len(opened) > 0 and cv2.waitKey(1) == ENTER_KEY_CODE:
+                    self.shutdown_event.set()
+            for window_name in opened:
+                cv2.destroyWindow(window_name)
+        except cv2.error as e:
+            self._stop.set()
+            print(f"Live preview disabled: {e}", flush=True)  # e.g. no display
+
+    def stats(self) -> dict:
+        """Totals over every window."""
+        totals = dict(offered=0, accepted=0, replaced=0, rendered=0)
+        for stream in self._streams:
+            for key, value in stream.stats().items():
+                totals[key] += value
+        return totals
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2.)
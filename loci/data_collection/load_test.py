@@ -0,0 +1,144 @@
+"""Load test of the acquisition pipeline with a simulated camera (no Vimba needed).
+
+Comma-separated --fps, --buffers and --num_writers values are swept as a grid.
+
+usage:
+    load_test.py [-r <replay_folder>] [-fps <rates>] [-b <buffer_counts>] [-nw <writer_counts>] [-d <seconds>]
+    [-q <queue_depth>] [-o <overflow>] [-k <codec>] [-c] [--manifest] [-w <write_path>] [--keep] [--csv <file>]
+    [--metrics <csv|prom>] [--adaptive [-fmin <fps>] [-ai <seconds>] [-md <decimation>]]
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+from loci.data_collection.utils import FrameHandler, set_frame_rate
+from loci.data_collection.frame_writer import FrameWriter, OVERFLOW_POLICIES
+from loci.data_collection.bayer_codec import CODECS, save_encoded
+from loci.data_collection.frame_container import FrameContainerWriter
+from loci.data_collection.frame_manifest import FrameManifest
+from loci.data_collection.sim_camera import SimulatedCamera, replay_frames, synthetic_frames
+from loci.data_collection.telemetry import METRIC_FORMATS, MetricsReporter, Telemetry
+from loci.data_collection.rate_controller import RateController
+
+
+def run_once(frames, write_path: str, fps: float, buffers: int, num_writers: int, duration: float, args) -> dict:
+    """One streaming run; returns the camera, writer and throughput figures."""
+    if os.path.exists(write_path) is False:
+        os.makedirs(write_path)
+    if args.container is True:
+        container = FrameContainerWriter(write_path, codec=args.codec)
+        save_fn = container.append
+    else:
+        container = None
+        save_fn = save_encoded(write_path, args.codec)
+    writer = FrameWriter(save_fn, pool_size=args.pool_size, queue_depth=args.queue_depth,
+                         num_writers=num_writers, overflow=args.overflow)
+    manifest = FrameManifest(write_path) if args.manifest is True else None
+    telemetry = Telemetry()
+    handler = FrameHandler(file_target=write_path, writer=writer, manifest=manifest, telemetry=telemetry)
+    reporter = None
+    if args.metrics != "":
+        reporter = MetricsReporter(telemetry, os.path.join(write_path, "metrics", f"metrics.{args.metrics}"),
+                                   interval=1., fmt=args.metrics)
+    cam = SimulatedCamera(frames, fps=fps, incomplete_rate=args.incomplete_rate)
+    controller = None
+    if args.adaptive is True:
+        controller = RateController(handler, lambda v: set_frame_rate(cam, v), fps, min(args.min_fps, fps), fps,
+                                    interval=args.adapt_interval, sample_period=args.adapt_interval / 10,
+                                    reserve_gb=0., settle=2, max_decimation=args.max_decimation,
+                                    log_path=os.path.join(write_path, "metrics", "rate_changes.csv"))
+
+    start = time.perf_counter()
+    with cam:
+        cam.start_streaming(handler=handler, buffer_count=buffers)
+        handler.shutdown_event.wait(duration)
+        if controller is not None:
+            controller.close()
+        cam.stop_streaming()
+    handler.close()  # drains the writer
+    if reporter is not None:
+        reporter.close()
+    if container is not None:
+        container.close()
+    elapsed = time.perf_counter() - start
+
+    report = dict(fps_target=fps, buffers=buffers, num_writers=num_writers)
+    report.update(cam.stats())
+    writer_stats = writer.stats()
+    report.update(written=writer_stats["written"], wr_drop=writer_stats["dropped"], max_depth=writer_stats["max_depth"],
+                  fps=writer_stats["written"] / elapsed)
+    save = telemetry.histogram("save")
+    report["save_p50_ms"], report["save_p99_ms"] = (v / 1e6 for v in save.quantiles(save.snapshot()[0], [0.5, 0.99]))
+    if controller is not None:
+        report.update(fps_final=controller.fps, decimation=handler.decimation, changes=controller.changes)
+    return report
+
+
+def print_report(r: dict):
+    print(f"fps {r['fps_target']:>6g} buf {r['buffers']:>3} wr {r['num_writers']:>2} | "
+          f"fps {r['fps']:7.1f} starved {r['starved']:>5} wr_drop {r['wr_drop']:>5} | "
+          f"queue {r.get('queue_p50_ms', 0):6.2f}/{r.get('queue_p99_ms', 0):7.2f} ms  "
+          f"callback {r.get('callback_p50_ms', 0):6.2f}/{r.get('callback_p99_ms', 0):7.2f}/{r.get('callback_max_ms', 0):7.2f} ms  "
+          f"max_depth {r['max_depth']}  save {r['save_p50_ms']:6.2f}/{r['save_p99_ms']:7.2f} ms"
+          + (f" | fps_final {r['fps_final']:g} (every {r['decimation']}) changes {r['changes']}" if "fps_final" in r else ""),
+          flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test acquisition with a simulated camera",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-r", "--replay", type=str, default="", action="store", help="Replay frames from this folder or container instead of synthetic frames")
+    parser.add_argument("-sh", "--shape", type=str, default="1024x1360", action="store", help="Synthetic frame size, HxW")
+    parser.add_argument("-fps", "--fps", type=str, default="4,20,60", action="store", help="Comma-separated frame rates to test")
+    parser.add_argument("-b", "--buffers", type=str, default="5,10", action="store", help="Comma-separated camera buffer counts to test")
+    parser.add_argument("-nw", "--num_writers", type=str, default="1,2", action="store", help="Comma-separated writer thread counts to test")
+    parser.add_argument("-d", "--duration", type=float, default=10., action="store", help="Seconds per run")
+    parser.add_argument("-p", "--pool_size", type=int, default=16, action="store", help="Number of preallocated frame buffers for the writer")
+    parser.add_argument("-q", "--queue_depth", type=int, default=8, action="store", help="Maximum number of frames waiting to be written")
+    parser.add_argument("-o", "--overflow", type=str, default="block", choices=OVERFLOW_POLICIES, action="store", help="Writer overflow policy")
+    parser.add_argument("-k", "--codec", type=str, default="npy", choices=CODECS, action="store", help="On-disk frame codec")
+    parser.add_argument("-c", "--container", action="store_true", help="Write into a frame container instead of one file per frame")
+    parser.add_argument("-i", "--incomplete_rate", type=float, default=0., action="store", help="Fraction of frames delivered incomplete")
+    parser.add_argument("--manifest", action="store_true", help="Record frames in a frame manifest, as image_acquisition.py does by default")
+    parser.add_argument("-w", "--write_path", type=str, default="", action="store", help="Where to write test frames; defaults to a temporary folder")
+    parser.add_argument("--keep", action="store_true", help="Keep the written frames")
+    parser.add_argument("--metrics", type=str, default="", choices=("",) + METRIC_FORMATS, action="store", help="Also write telemetry snapshots every second under each run folder")
+    parser.add_argument("--adaptive", action="store_true", help="Let a RateController lower the frame rate when the pipeline falls behind")
+    parser.add_argument("-fmin", "--min_fps", type=float, default=1., action="store", help="Lowest frame rate the controller may set")
+    parser.add_argument("-ai", "--adapt_interval", type=float, default=1., action="store", help="Seconds between frame rate decisions")
+    parser.add_argument("-md", "--max_decimation", type=int, default=1, action="store", help="Largest save decimation the controller may set")
+    parser.add_argument("--csv", type=str, default="", action="store", help="Also write every run's figures to this csv")
+    args = parser.parse_args()
+
+    if args.replay != "":
+        frames = replay_frames(args.replay)
+    else:
+        frames = synthetic_frames(tuple(int(v) for v in args.shape.split("x")))
+    print(f"{len(frames)} source frames of shape {frames[0].shape}, {args.duration:g} s per run")
+
+    base_path = args.write_path if args.write_path != "" else tempfile.mkdtemp(prefix="loci_load_test_")
+    reports = []
+    grid = itertools.product([float(v) for v in args.fps.split(",")], [int(v) for v in args.buffers.split(",")],
+                             [int(v) for v in args.num_writers.split(",")])
+    for k, (fps, buffers, num_writers) in enumerate(grid):
+        run_path = os.path.join(base_path, f"run_{k}")
+        reports.append(run_once(frames, run_path, fps, buffers, num_writers, args.duration, args))
+        print_report(reports[-1])
+        if args.keep is False:
+            shutil.rmtree(run_path)
+    if args.keep is False and args.write_path == "":
+        shutil.rmtree(base_path)
+
+    if args.csv != "":
+        columns = sorted({key for r in reports for key in r})
+        with open(args.csv, "w") as f:
+            f.write(",".join(columns) + "\n")
+            f.writelines(",".join(str(r.get(c, "")) for c in columns) + "\n" for r in reports)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Flat-field and local-contrast correction engine for demosaiced frames."""
+
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+
+class LocalContrastCorrector:
+    """Reusable correction engine for frames of one shape."""
+
+    def __init__(self, shape: Tuple[int, int, int], ksize: int = 7, tile_rows: int = 256,
+                 workers: int = 1, median_samples: int = 65536, seed: int = 0):
+        self.shape = tuple(shape)
+        self.ksize = ksize
+        self.workers = workers
+        rows, cols, channels = self.shape
+        self._halo = ksize // 2
+
+        # full-frame work buffers
+        self._img = np.empty(self.shape, dtype=np.float32)
+        self._box = np.empty(self.shape, dtype=np.float32)
+        self._rbar = np.empty(self.shape, dtype=np.float32)
+        self._profile = np.empty((rows, channels), dtype=np.float32)
+        self._out = np.empty(self.shape, dtype=np.uint8)
+        self._f_avg = None
+
+        # row tiles, each with its own scratch including the filter halo
+        self._tiles = []
+        for r0 in range(0, rows, tile_rows):
+            r1 = min(r0 + tile_rows, rows)
+            h0 = max(r0 - self._halo, 0)
+            h1 = min(r1 + self._halo, rows)
+            scratch = np.empty((h1 - h0, cols, channels), dtype=np.float32)
+            self._tiles.append((r0, r1, h0, h1, scratch))
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        # fixed pixel sample for the median estimate
+        rng = np.random.default_rng(seed)
+        num = min(median_samples, rows * cols * channels)
+        flat = rng.choice(rows * cols * channels, size=num, replace=False)
+        self._sample_rows, self._sample_cols, self._sample_chans = np.unravel_index(flat, self.shape)
+
+    def _tile(self, tile):
+        """Box sum, absolute deviation row profile, and flat-field ratio for one row tile."""
+        r0, r1, h0, h1, scratch = tile
+        cv2.boxFilter(self._img[h0:h1], cv2.CV_32F, (self.ksize, self.ksize), dst=scratch,
+                      normalize=False, borderType=cv2.BORDER_REFLECT_101)
+        inner = slice(r0 - h0, r0 - h0 + (r1 - r0))
+        box = self._box[r0:r1]
+        box[:] = scratch[inner]
+        # |img - box| summed along each row, reusing the scratch rows
+        dev = scratch[inner]
+        np.subtract(self._img[r0:r1], box, out=dev)
+        np.abs(dev, out=dev)
+        dev.sum(axis=1, out=self._profile[r0:r1])
+        np.divide(self._img[r0:r1], self._f_avg[r0:r1], out=self._rbar[r0:r1])
+
+    def correct(self, img: np.ndarray, f_avg: np.ndarray, with_std: bool = False) -> Tuple[np.ndarray, Optional[float]]:
+        """Corrects one demosaiced frame into a reused buffer. Returns (uint8 image, std_c or None)."""
+        if img.shape != self.shape:
+            raise ValueError(f"Frame shape {img.shape} does not match engine shape {self.shape}")
+        np.copyto(self._img, img, casting="unsafe")
+        if with_std is False:
+            np.divide(self._img, f_avg, out=self._rbar)
+            cv2.normalize(self._rbar, self._out, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+            return self._out, None
+        self._f_avg = f_avg
+
+        if self._pool is not None:
+            list(self._pool.map(self._tile, self._tiles))
+        else:
+            for tile in self._tiles:
+                self._tile(tile)
+
+        # filter the (rows, channels) profile, then sample the ratio to the local sum
+        profile = cv2.boxFilter(self._profile, cv2.CV_32F, (self.ksize, self.ksize),
+                                normalize=False, borderType=cv2.BORDER_REFLECT_101)
+        local = self._box[self._sample_rows, self._sample_cols, self._sample_chans]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = profile[self._sample_rows, self._sample_chans] / local
+        std_c = float(np.median(ratio))
+
+        cv2.normalize(self._rbar, self._out, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        return self._out, std_c
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def reference_correction(img: np.ndarray, f_avg: np.ndarray, ksize: int = 7) -> Tuple[np.ndarray, float]:
+    """Float64, full-frame evaluation of the same formula, used to validate the engine."""
+    img = img.astype(np.float64)
+    kernel = np.ones((ksize, ksize), np.float64)
+    exp_convolve = cv2.filter2D(src=img, ddepth=-1, kernel=kernel)
+    std_convolve = np.abs(img - exp_convolve).sum(axis=1)
+    profile = cv2.filter2D(src=std_convolve, ddepth=-1, kernel=kernel)
+    std_c = np.median(profile[:, None, :] / exp_convolve)
+    rbar = img / f_avg
+    return cv2.normalize(rbar * std_c, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U), float(std_c)
@@ -0,0 +1,217 @@
+"""Adaptive camera frame rate (and save decimation) for unattended acquisition."""
+
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Optional
+
+from loci.data_collection.frame_writer import FrameWriter
+
+
+class RateController:
+    """Adjusts a camera's frame rate (and the handler's save decimation) from its own thread."""
+
+    def __init__(self, handler, set_fps: Callable[[float], float], fps: float, min_fps: float, max_fps: float,
+                 interval: float = 30., sample_period: float = 1., high_backlog: float = 0.75,
+                 low_backlog: float = 0.25, max_incomplete: float = 0.01, reserve_gb: float = 5.,
+                 end_time: Optional[float] = None, step_down: float = 0.5, step_up: float = 1.25,
+                 settle: int = 3, max_settle: int = 48, max_decimation: int = 1, log_path: str = "",
+                 name: str = ""):
+        if not 0 < min_fps <= max_fps:
+            raise ValueError(f"Frame rate bounds must satisfy 0 < min_fps <= max_fps, got {min_fps} and {max_fps}")
+        self.handler = handler  # FrameHandler: writer, telemetry and decimation of one camera
+        self.set_fps = set_fps  # sets the camera frame rate, returns the rate the camera accepted
+        self.fps = fps
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.interval = interval
+        self.sample_period = sample_period
+        self.high_backlog = high_backlog
+        self.low_backlog = low_backlog
+        self.max_incomplete = max_incomplete
+        self.reserve_bytes = reserve_gb * 1e9
+        self.end_time = end_time  # time.time() the deployment should last until, if budgeting disk space
+        self.step_down = step_down
+        self.step_up = step_up
+        self.settle = settle
+        self.max_settle = max_settle
+        self.max_decimation = max_decimation
+        self.log_path = log_path
+        self.name = name
+        self.changes = 0
+
+        self._required = settle  # healthy intervals needed before the next step up
+        self._healthy = 0
+        self._probing = False  # last change was a step up
+        self._cooldown = False  # last change was a step down; ignore the next interval
+        self._depths = []
+        self._last = self._counts()
+        self._last_free = self._free_bytes()
+        self._bytes_per_frame = None  # smoothed disk use per saved frame, across every stream on the disk
+        if log_path != "":
+            directory = os.path.dirname(log_path)
+            if directory != "" and os.path.exists(directory) is False:
+                os.makedirs(directory)
+        if not min_fps <= fps <= max_fps:
+            self._apply(min(max(fps, min_fps), max_fps), handler.decimation, "start rate outside bounds")
+        if handler.telemetry is not None:
+            handler.telemetry.add_gauges("rate", lambda: dict(fps=self.fps, decimation=self.handler.decimation))
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rate-controller", daemon=True)
+        self._thread.start()
+
+    ##############
+    # Signals
+    ##############
+
+    def _disk_writer(self) -> FrameWriter:
+        writer = self.handler.writer
+        return getattr(writer, "writer", writer)  # a WriterStream's shared writer sees every camera's frames
+
+    def _counts(self) -> dict:
+        stats = self.handler.writer.stats()
+        counts = dict(written=stats["written"], dropped=stats["dropped"],
+                      disk_written=self._disk_writer().stats()["written"], frames=0, incomplete=0, missing=0)
+        telemetry = self.handler.telemetry
+        if telemetry is not None:
+            counts.update(frames=telemetry.count("frames"), missing=telemetry.count("frames_missing"),
+                          incomplete=telemetry.count("frames") - telemetry.count("frames", status="Complete"))
+        return counts
+
+    def _free_bytes(self) -> int:
+        return shutil.disk_usage(self.handler.file_target).free
+
+    def _queue_quota(self) -> int:
+        return self.handler.writer.queue_depth
+
+    def signals(self) -> dict:
+        """Backlog, losses, incomplete fraction and disk budget since the last call."""
+        counts = self._counts()
+        delta = {key: counts[key] - self._last[key] for key in counts}
+        self._last = counts
+        free = self._free_bytes()
+        used = self._last_free - free
+        self._last_free = free
+        if delta["disk_written"] > 0 and used > 0:
+            bpf = used / delta["disk_written"]
+            self._bytes_per_frame = bpf if self._bytes_per_frame is None else 0.8 * self._bytes_per_frame + 0.2 * bpf
+
+        depths = self._depths or [self.handler.writer.depth]
+        self._depths = []
+        signals = dict(backlog=sum(depths) / len(depths) / max(1, self._queue_quota()),
+                       lost=delta["dropped"] + delta["missing"],
+                       incomplete=delta["incomplete"] / delta["frames"] if delta["frames"] > 0 else 0.,
+                       free_gb=free / 1e9, budget_fps=None,
+                       frames=delta["frames"] if self.handler.telemetry is not None else None)
+        if self.end_time is not None and self._bytes_per_frame is not None:
+            # frames per second this camera can save and still fit on disk until the deployment ends
+            remaining = max(self.end_time - time.time(), 1.)
+            streams = max(1, len(self._disk_writer().streams))
+            signals["budget_fps"] = (free - self.reserve_bytes) / self._bytes_per_frame / remaining / streams
+        return signals
+
+    ##############
+    # Control
+    ##############
+
+    def _overload(self, s: dict) -> str:
+        """Reason the rate must come down, or "" if it need not."""
+        saved_fps = self.fps / self.handler.decimation
+        if s["free_gb"] * 1e9 < self.reserve_bytes:
+            return f"free space {s['free_gb']:.1f} GB below reserve"
+        if s["budget_fps"] is not None and s["budget_fps"] < saved_fps:
+            return f"disk budget {s['budget_fps']:.3g} fps below saved rate"
+        if s["lost"] > 0:
+            return f"{s['lost']} frames lost"
+        if s["incomplete"] > self.max_incomplete:
+            return f"{100 * s['incomplete']:.1f}% frames incomplete"
+        if s["backlog"] >= self.high_backlog:
+            return f"writer backlog {100 * s['backlog']:.0f}%"
+        return ""
+
+    def _has_headroom(self, s: dict) -> bool:
+        saved_fps = self.fps / self.handler.decimation
+        budget_ok = s["budget_fps"] is None or s["budget_fps"] > saved_fps * self.step_up
+        streaming = s["frames"] is None or s["frames"] > 0  # an interval without frames says nothing
+        return (streaming and budget_ok and s["backlog"] <= self.low_backlog
+                and s["incomplete"] <= self.max_incomplete / 2)
+
+    def update(self):
+        """One control decision from the signals since the previous one."""
+        s = self.signals()
+        if self._cooldown:
+            self._cooldown = False
+            return
+        reason = self._overload(s)
+        if reason != "":
+            self._healthy = 0
+            if self._probing:
+                self._required = min(2 * self._required, self.max_settle)  # the last step up was too far
+            self._probing = False
+            self._cooldown = True
+            if self.fps > self.min_fps:
+                self._apply(max(self.fps * self.step_down, self.min_fps), self.handler.decimation, reason, s)
+            elif self.handler.decimation < self.max_decimation:
+                self._apply(self.fps, min(2 * self.handler.decimation, self.max_decimation), reason, s)
+            return
+        if not self._has_headroom(s):
+            self._healthy = 0
+            return
+        self._healthy += 1
+        if self._healthy < self._required:
+            return
+        self._healthy = 0
+        if self.handler.decimation > 1:
+            self._probing = True
+            self._apply(self.fps, max(1, self.handler.decimation // 2), "headroom", s)
+        elif self.fps < self.max_fps:
+            self._probing = True
+            self._apply(min(self.fps * self.step_up, self.max_fps), 1, "headroom", s)
+        else:
+            self._probing = False
+
+    def _apply(self, fps: float, decimation: int, reason: str, s: Optional[dict] = None):
+        previous = (self.fps, self.handler.decimation)
+        try:
+            fps = self.set_fps(fps)
+        except Exception as e:
+            print(f"Could not set frame rate to {fps:g}: {e}", flush=True)
+            fps = self.fps
+        self.fps = fps
+        self.handler.decimation = decimation
+        if (fps, decimation) == previous:
+            return
+        self.changes += 1
+        s = s or {}
+        label = f"{self.name}: " if self.name != "" else ""
+        print(f"{label}frame rate {previous[0]:g} -> {fps:g} fps, saving every {decimation} "
+              f"({reason})", flush=True)
+        if self.log_path != "":
+            new_file = not os.path.exists(self.log_path)
+            with open(self.log_path, "a") as f:
+                if new_file:
+                    f.write("time_ns,fps,decimation,reason,backlog,lost,incomplete,free_gb,budget_fps\n")
+                f.write(f"{time.time_ns()},{fps:g},{decimation},\"{reason}\",{s.get('backlog', '')},"
+                        f"{s.get('lost', '')},{s.get('incomplete', '')},{s.get('free_gb', '')},"
+                        f"{s.get('budget_fps') if s.get('budget_fps') is not None else ''}\n")
+
+    def _run(self):
+        next_update = time.monotonic() + self.interval
+        while not self._stop.wait(self.sample_period):
+            self._depths.append(self.handler.writer.depth)
+            if time.monotonic() >= next_update:
+                next_update += self.interval
+                try:
+                    self.update()
+                except OSError as e:
+                    print(f"Frame rate control skipped: {e}", flush=True)
+
+    def stats(self) -> dict:
+        return dict(fps=self.fps, decimation=self.handler.decimation, changes=self.changes,
+                    settle_intervals=self._required)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
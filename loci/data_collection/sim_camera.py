@@ -0,0 +1,235 @@
+"""Simulated camera that feeds FrameHandler without Vimba or a Prosilica attached."""
+
+import collections
+import enum
+import threading
+import time
+import numpy as np
+from typing import Callable, List
+
+from loci.data_collection.ezo import DeadlineScheduler
+from loci.data_collection.frame_io import iter_frames
+
+try:
+    from vimba import FrameStatus
+except ImportError:  # no Vimba SDK; same members as vimba.FrameStatus
+    class FrameStatus(enum.IntEnum):
+        Complete = 0
+        Incomplete = -1
+        TooSmall = -2
+        Invalid = -3
+
+
+def synthetic_frames(shape=(1024, 1360), count: int = 8, seed: int = 0) -> List[np.ndarray]:
+    """Smooth 12-bit Bayer scenes with sensor noise, drifting slightly from frame to frame."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]].astype(np.float32)
+    frames = []
+    for i in range(count):
+        scene = 1800 + 900 * np.sin((xx + 7 * i) / 45) * np.cos((yy - 3 * i) / 70)
+        raw = (scene + rng.normal(0, 25, shape)).clip(0, 4095).astype(np.uint16)
+        frames.append(raw[..., None])
+    return frames
+
+
+def replay_frames(target_path: str, limit: int = 32) -> List[np.ndarray]:
+    """Up to limit recorded frames from a folder or container, to replay in a loop."""
+    frames = []
+    for _, frame in iter_frames(target_path):
+        frames.append(frame)
+        if len(frames) >= limit:
+            break
+    if len(frames) == 0:
+        raise ValueError(f"No frames found at {target_path}")
+    return frames
+
+
+class SimulatedFrame:
+    """One driver buffer, as handed to the streaming handler."""
+
+    def __init__(self, buffer: np.ndarray):
+        self._buffer = buffer
+        self._id = 0
+        self._timestamp = 0
+        self._status = FrameStatus.Complete
+        self.delivered_ns = 0  # perf_counter_ns when the frame was filled
+
+    def get_status(self) -> FrameStatus:
+        return self._status
+
+    def get_id(self) -> int:
+        return self._id
+
+    def get_timestamp(self) -> int:
+        return self._timestamp
+
+    def as_numpy_ndarray(self) -> np.ndarray:
+        return self._buffer  # no copy, like Vimba: only valid until the frame is re-queued
+
+    def __str__(self):
+        return f"SimulatedFrame(id={self._id}, status={self._status.name}, timestamp={self._timestamp})"
+
+
+class SimulatedFeature:
+    """Float camera feature with get / set / get_range, like a Vimba feature."""
+
+    def __init__(self, name: str, get: Callable, set: Callable, range: tuple):
+        self._name = name
+        self._get = get
+        self._set = set
+        self._range = range
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get(self) -> float:
+        return self._get()
+
+    def set(self, value: float):
+        if not self._range[0] <= value <= self._range[1]:
+            raise ValueError(f"{self._name} {value} outside of {self._range}")
+        self._set(value)
+
+    def get_range(self) -> tuple:
+        return self._range
+
+
+class SimulatedCamera:
+    """Camera stand-in streaming frames at fps from its own threads, with a clock_drift_ppm fast clock."""
+
+    def __init__(self, frames: List[np.ndarray], fps: float = 4., incomplete_rate: float = 0.,
+                 clock_drift_ppm: float = 0., name: str = "SimulatedCamera", seed: int = 0):
+        self.frames = frames
+        self.fps = fps
+        self.incomplete_rate = incomplete_rate  # fraction of frames delivered Incomplete
+        self.clock_drift_ppm = clock_drift_ppm
+        self.name = name
+        self._rng = np.random.default_rng(seed)
+        self._handler = None
+        self._free = collections.deque()
+        self._delivered = collections.deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._streaming = threading.Event()
+        self._threads = []
+        self._entered = 0
+        self.AcquisitionFrameRateAbs = SimulatedFeature("AcquisitionFrameRateAbs", lambda: self.fps,
+                                                        self._set_fps, (0.01, 1000.))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.exposures = 0  # frames the sensor produced
+        self.delivered = 0
+        self.starved = 0  # dropped because no buffer was queued
+        self.incomplete = 0
+        self.missed = 0  # producer deadlines missed entirely (host too busy)
+        self.queue_latency_ns = []  # fill to handler entry
+        self.requeue_latency_ns = []  # fill to queue_frame
+
+    def __enter__(self):
+        self._entered += 1  # nested contexts, as with Vimba cameras
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._entered -= 1
+        if self._entered == 0:
+            self.stop_streaming()
+
+    def get_name(self) -> str:
+        return self.name
+
+    def get_id(self) -> str:
+        return self.name
+
+    def get_feature_by_name(self, name: str) -> SimulatedFeature:
+        if name != "AcquisitionFrameRateAbs":
+            raise AttributeError(f"SimulatedCamera has no feature {name}")
+        return self.AcquisitionFrameRateAbs
+
+    def _set_fps(self, fps: float):
+        self.fps = fps  # the producer picks the new period up at its next exposure
+
+    def __str__(self):
+        return f"Camera(id={self.name})"
+
+    ##############
+    # Streaming
+    ##############
+
+    def start_streaming(self, handler: Callable, buffer_count: int = 5, **kwargs):
+        """Starts delivering frames to handler(cam, frame); extra Vimba arguments are ignored."""
+        self._handler = handler
+        self._free = collections.deque(SimulatedFrame(np.empty_like(self.frames[0])) for _ in range(buffer_count))
+        self._delivered.clear()
+        self._streaming.set()
+        self._threads = [threading.Thread(target=self._produce, name="sim-camera-produce", daemon=True),
+                         threading.Thread(target=self._dispatch, name="sim-camera-dispatch", daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def stop_streaming(self):
+        self._streaming.clear()
+        with self._lock:
+            self._ready.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def queue_frame(self, frame: SimulatedFrame):
+        """Hands a buffer back to the camera."""
+        with self._lock:
+            self.requeue_latency_ns.append(time.perf_counter_ns() - frame.delivered_ns)
+            self._free.append(frame)
+
+    def _produce(self):
+        scheduler = DeadlineScheduler(1. / self.fps)
+        missed = 0
+        start_ns = time.monotonic_ns()
+        scale = 1. + self.clock_drift_ppm * 1e-6
+        while self._streaming.is_set():
+            if scheduler.period != 1. / self.fps:
+                missed += scheduler.missed
+                scheduler = DeadlineScheduler(1. / self.fps)
+            scheduler.wait()
+            self.exposures += 1
+            with self._lock:
+                frame = self._free.popleft() if len(self._free) > 0 else None
+            if frame is None:
+                self.starved += 1
+                continue
+            np.copyto(frame._buffer, self.frames[self.exposures % len(self.frames)])
+            frame._id = self.exposures - 1
+            frame._timestamp = int((time.monotonic_ns() - start_ns) * scale)
+            frame._status = FrameStatus.Complete
+            if self.incomplete_rate > 0 and self._rng.random() < self.incomplete_rate:
+                frame._status = FrameStatus.Incomplete
+                self.incomplete += 1
+            frame.delivered_ns = time.perf_counter_ns()
+            with self._lock:
+                self._delivered.append(frame)
+                self._ready.notify()
+        self.missed = missed + scheduler.missed
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                while len(self._delivered) == 0 and self._streaming.is_set():
+                    self._ready.wait()
+                if len(self._delivered) == 0:
+                    return
+                frame = self._delivered.popleft()
+            self.queue_latency_ns.append(time.perf_counter_ns() - frame.delivered_ns)
+            self.delivered += 1
+            self._handler(self, frame)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requeue = np.array(self.requeue_latency_ns, dtype=np.float64) / 1e6
+        queue = np.array(self.queue_latency_ns, dtype=np.float64) / 1e6
+        report = dict(exposures=self.exposures, delivered=self.delivered, starved=self.starved,
+                      incomplete=self.incomplete, missed=self.missed)
+        for key, values in (("queue", queue), ("callback", requeue)):
+            if len(values) > 0:
+                p50, p99 = np.percentile(values, [50, 99])
+                report.update({f"{key}_p50_ms": float(p50), f"{key}_p99_ms": float(p99), f"{key}_max_ms": float(values.max())})
+        return report
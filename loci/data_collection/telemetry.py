@@ -0,0 +1,226 @@
+"""Low-overhead counters, gauges and latency histograms for the acquisition path, with periodic reporting."""
+
+import os
+import threading
+import time
+import numpy as np
+from typing import Callable, Dict, Tuple
+
+
+METRIC_FORMATS = ("csv", "prom")
+
+
+class LatencyHistogram:
+    """Log-linear histogram of non-negative integers (e.g. nanoseconds), within 2**-(sub_bits - 1) relative error."""
+
+    def __init__(self, sub_bits: int = 6):
+        self.sub_bits = sub_bits
+        self._half = 1 << (sub_bits - 1)
+        self.counts = [0] * ((64 - sub_bits + 2) * self._half)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def _index(self, value: int) -> int:
+        if value < 2 * self._half:
+            return value  # exact below 2**sub_bits
+        shift = value.bit_length() - self.sub_bits
+        return shift * self._half + (value >> shift)
+
+    def bucket_value(self, index: int) -> float:
+        """Midpoint of the values that fall into bucket index."""
+        if index < 2 * self._half:
+            return float(index)
+        shift = index // self._half - 1
+        m = index - shift * self._half
+        return ((m << shift) + ((m + 1) << shift) - 1) / 2.
+
+    def record(self, value: int):
+        value = max(int(value), 0)
+        i = self._index(value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self) -> Tuple[np.ndarray, int, int, int]:
+        """(bucket counts, count, sum, max) at this moment."""
+        with self._lock:
+            return np.array(self.counts, dtype=np.int64), self.count, self.total, self.max
+
+    def quantiles(self, counts: np.ndarray, qs) -> list:
+        """Values at quantiles qs of a (possibly differenced) bucket count array."""
+        n = int(counts.sum())
+        if n == 0:
+            return [float("nan")] * len(qs)
+        cdf = np.cumsum(counts)
+        return [self.bucket_value(int(np.searchsorted(cdf, max(q * n, 1)))) for q in qs]
+
+
+def _key_name(name: str, labels: tuple) -> str:
+    if len(labels) == 0:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Telemetry:
+    """Registry of counters, histograms and gauges."""
+
+    def __init__(self, sub_bits: int = 6):
+        self.sub_bits = sub_bits
+        self.started_ns = time.time_ns()
+        self._counters: Dict[Tuple[str, tuple], int] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._gauges: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, n: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram(self.sub_bits)
+            return self._histograms[name]
+
+    def observe(self, name: str, value: int):
+        self.histogram(name).record(value)
+
+    def add_gauges(self, prefix: str, fn: Callable[[], dict]):
+        """Polls fn (returning name -> number) at every snapshot, as prefix_name gauges."""
+        self._gauges[prefix] = fn
+
+    def count(self, name: str, **labels) -> int:
+        """Current value of counter name, summed over every label set that includes labels."""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(v for (key, key_labels), v in self._counters.items() if key == name and wanted <= set(key_labels))
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return {_key_name(name, labels): v for (name, labels), v in sorted(self._counters.items())}
+
+    def gauges(self) -> Dict[str, float]:
+        values = {}
+        for prefix, fn in self._gauges.items():
+            for name, v in fn().items():
+                values[f"{prefix}_{name}"] = v
+        return values
+
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        with self._lock:
+            return dict(sorted(self._histograms.items()))
+
+    def summary(self) -> dict:
+        """Counters, gauges and p50 / p99 / max (ms) of every histogram, for printing."""
+        report = dict(self.counters())
+        report.update(self.gauges())
+        for name, hist in self.histograms().items():
+            counts, n, _, peak = hist.snapshot()
+            p50, p99 = hist.quantiles(counts, [0.5, 0.99])
+            report[name] = f"n={n} p50={p50 / 1e6:.2f}ms p99={p99 / 1e6:.2f}ms max={peak / 1e6:.2f}ms"
+        return report
+
+
+##############
+# Snapshot files
+##############
+
+class MetricsReporter:
+    """Writes Telemetry snapshots to a metrics file every interval seconds, from its own thread."""
+
+    def __init__(self, telemetry: Telemetry, path: str, interval: float = 10., fmt: str = "csv",
+                 max_bytes: int = 10 * 2**20, backups: int = 5, prefix: str = "loci"):
+        if fmt not in METRIC_FORMATS:
+            raise ValueError(f"Unknown metrics format {fmt}, choose from {METRIC_FORMATS}")
+        self.telemetry = telemetry
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.prefix = prefix
+        self._previous = {}  # histogram counts at the last csv row
+        self._columns = None
+        self._stop = threading.Event()
+        directory = os.path.dirname(path)
+        if directory != "" and os.path.exists(directory) is False:
+            os.makedirs(directory)
+        self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            if self.fmt == "prom":
+                self._write_prom()
+            else:
+                self._write_csv()
+        except OSError as e:
+            print(f"Could not write metrics to {self.path}: {e}", flush=True)
+
+    def _write_prom(self):
+        p = self.prefix
+        lines = [f"{p}_uptime_seconds {(time.time_ns() - self.telemetry.started_ns) / 1e9:.3f}"]
+        for name, v in self.telemetry.counters().items():
+            lines.append(f"{p}_{name.replace('{', '_total{', 1) if '{' in name else name + '_total'} {v}")
+        for name, v in self.telemetry.gauges().items():
+            lines.append(f"{p}_{name} {v}")
+        for name, hist in self.telemetry.histograms().items():
+            counts, n, total, _ = hist.snapshot()
+            qs = (0.5, 0.9, 0.99, 0.999)
+            for q, v in zip(qs, hist.quantiles(counts, qs)):
+                lines.append(f'{p}_{name}_seconds{{quantile="{q}"}} {v / 1e9:.9f}')
+            lines.append(f"{p}_{name}_seconds_sum {total / 1e9:.9f}")
+            lines.append(f"{p}_{name}_seconds_count {n}")
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)  # scrapers never see a half-written file
+
+    def _write_csv(self):
+        row = {"time_ns": time.time_ns()}
+        row.update({name.replace("{", "[").replace("}", "]").replace('"', ""): v
+                    for name, v in self.telemetry.counters().items()})
+        row.update(self.telemetry.gauges())
+        for name, hist in self.telemetry.histograms().items():
+            counts, _, _, _ = hist.snapshot()
+            interval = counts - self._previous.get(name, 0)
+            self._previous[name] = counts
+            p50, p99, top = hist.quantiles(interval, [0.5, 0.99, 1.])
+            row.update({f"{name}_count": int(interval.sum()), f"{name}_p50_ms": f"{p50 / 1e6:.3f}",
+                        f"{name}_p99_ms": f"{p99 / 1e6:.3f}", f"{name}_max_ms": f"{top / 1e6:.3f}"})
+        columns = list(row)
+        if columns != self._columns or (os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes):
+            self._rotate()  # new metrics appeared, or the file is full: start a file with a new header
+            self._columns = columns
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a") as f:
+            if new_file:
+                f.write(",".join(f'"{c}"' if "," in c else c for c in columns) + "\n")
+            f.write(",".join(str(row[c]) for c in columns) + "\n")
+
+    def _rotate(self):
+        if not os.path.exists(self.path):
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        """Stops the thread and writes a final snapshot."""
+        self._stop.set()
+        self._thread.join()
+        self.write()
@@ -0,0 +1,306 @@
+"""Columnar, day-partitioned store for in situ sensor readings.
+
+A store directory holds store.json (sensor ids, days written out of order) and one
+folder per UTC day with time_ns.i8, value.f4 and sensor.u2 column files.
+
+usage (import existing text logs, then print a summary of the store):
+    timeseries_store.py -s <store_path> [-i <text_log> ...] [-n <sensor_name>] [--compact]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+import numpy as np
+from typing import Dict, List, NamedTuple, Optional
+
+
+STORE_FILE = "store.json"
+STORE_VERSION = 1
+COLUMNS = (("time_ns", "<i8"), ("value", "<f4"), ("sensor", "<u2"))
+DAY_NS = 86400 * 10**9
+
+
+class Series(NamedTuple):
+    time_ns: np.ndarray
+    value: np.ndarray
+    sensor: np.ndarray
+
+
+def is_store(path: str) -> bool:
+    """Whether path is a time series store directory."""
+    return os.path.isfile(os.path.join(path, STORE_FILE))
+
+
+def day_name(day: int) -> str:
+    """Partition directory name of a UTC day number (days since the epoch)."""
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))).isoformat()
+
+
+def day_number(name: str) -> int:
+    return (datetime.date.fromisoformat(name) - datetime.date(1970, 1, 1)).days
+
+
+def column_path(path: str, day: int, column: str) -> str:
+    dtype = dict(COLUMNS)[column]
+    return os.path.join(path, day_name(day), f"{column}.{dtype[1:]}")
+
+
+def _read_header(path: str) -> dict:
+    with open(os.path.join(path, STORE_FILE), "r") as f:
+        return json.load(f)
+
+
+def _write_header(path: str, header: dict):
+    tmp = os.path.join(path, STORE_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(header, f)
+    os.replace(tmp, os.path.join(path, STORE_FILE))
+
+
+class TimeSeriesWriter:
+    """Buffers readings and appends them to the store in time-sorted batches. One writer per store."""
+
+    def __init__(self, path: str, flush_interval: float = 5., batch_size: int = 10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._batch = []
+        self._last_flush = time.monotonic()
+        self._last_time = {}  # last written timestamp per day, for the order check
+
+        if os.path.exists(path) is False:
+            os.makedirs(path)
+        if is_store(path):
+            self.header = _read_header(path)
+        else:
+            self.header = {"version": STORE_VERSION, "sensors": {}, "unsorted": []}
+            _write_header(path, self.header)
+
+    def sensor_id(self, name: str) -> int:
+        """Id of a sensor name, registering it on first use."""
+        sensors = self.header["sensors"]
+        if name not in sensors:
+            sensors[name] = len(sensors)
+            _write_header(self.path, self.header)
+        return sensors[name]
+
+    def _day_last_time(self, day: int) -> Optional[int]:
+        if day not in self._last_time:
+            fpath = column_path(self.path, day, "time_ns")
+            n = os.path.getsize(fpath) // 8 if os.path.exists(fpath) else 0
+            self._last_time[day] = int(np.memmap(fpath, dtype="<i8", mode="r")[n - 1]) if n > 0 else None
+        return self._last_time[day]
+
+    def append(self, time_ns: np.ndarray, values: np.ndarray, sensor_ids: np.ndarray):
+        """Writes arrays of readings, split into their day partitions."""
+        time_ns = np.asarray(time_ns, dtype="<i8")
+        if len(time_ns) == 0:
+            return
+        order = np.argsort(time_ns, kind="stable")
+        columns = {"time_ns": time_ns[order],
+                   "value": np.asarray(values, dtype="<f4")[order],
+                   "sensor": np.asarray(sensor_ids, dtype="<u2")[order]}
+        days = columns["time_ns"] // DAY_NS
+        splits = np.flatnonzero(np.diff(days)) + 1
+        for lo, hi in zip(np.r_[0, splits], np.r_[splits, len(days)]):
+            day = int(days[lo])
+            last = self._day_last_time(day)
+            if last is not None and columns["time_ns"][lo] < last and day_name(day) not in self.header["unsorted"]:
+                # record before writing, so readers never trust an unsorted day
+                self.header["unsorted"].append(day_name(day))
+                _write_header(self.path, self.header)
+            if os.path.exists(os.path.join(self.path, day_name(day))) is False:
+                os.makedirs(os.path.join(self.path, day_name(day)))
+            for column, _ in COLUMNS:
+                with open(column_path(self.path, day, column), "ab") as f:
+                    f.write(columns[column][lo:hi].tobytes())
+            self._last_time[day] = max(int(columns["time_ns"][hi - 1]), last if last is not None else 0)
+
+    def add(self, time_ns: int, name: str, value: float):
+        """Buffers one reading; the batch is written when it is old or large enough."""
+        self._batch.append((time_ns, self.sensor_id(name), value))
+        if len(self._batch) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def add_reading(self, time_ns: int, name: str, reading: str):
+        """Buffers an EZO response string. Multi-value responses ("a,b,c") go to sensors name/0, name/1, ..."""
+        try:
+            values = [float(v) for v in reading.split(",")]
+        except ValueError:
+            return  # not numeric (e.g. an error string); the text log keeps it
+        if len(values) == 1:
+            self.add(time_ns, name, values[0])
+        else:
+            for k, v in enumerate(values):
+                self.add(time_ns, f"{name}/{k}", v)
+
+    def flush(self):
+        if len(self._batch) > 0:
+            time_ns, sensor_ids, values = zip(*self._batch)
+            self.append(np.asarray(time_ns), np.asarray(values), np.asarray(sensor_ids))
+            self._batch = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+
+class TimeSeriesStore:
+    """Read access to a store. Days are memory-mapped, so reads only touch the range asked for."""
+
+    def __init__(self, path: str):
+        if not is_store(path):
+            raise FileNotFoundError(f"{path} is not a time series store")
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        """Re-reads the header and the list of day partitions (e.g. while a logger is writing)."""
+        header = _read_header(self.path)
+        self.sensors = header["sensors"]
+        self.sensor_names = {v: k for k, v in self.sensors.items()}
+        self.unsorted = set(header["unsorted"])
+        self.days = sorted(day_number(d) for d in os.listdir(self.path)
+                           if os.path.isdir(os.path.join(self.path, d)))
+
+    def _day_columns(self, day: int) -> Dict[str, np.ndarray]:
+        columns = {}
+        for column, dtype in COLUMNS:
+            fpath = column_path(self.path, day, column)
+            size = os.path.getsize(fpath) // np.dtype(dtype).itemsize if os.path.exists(fpath) else 0
+            columns[column] = np.memmap(fpath, dtype=dtype, mode="r", shape=(size,)) if size > 0 else np.zeros(0, dtype)
+        # a batch interrupted mid-write leaves the columns at different lengths
+        n = min(len(c) for c in columns.values())
+        return {k: v[:n] for k, v in columns.items()}
+
+    def _read_day(self, day: int, start_ns: int, end_ns: int) -> Series:
+        columns = self._day_columns(day)
+        t = columns["time_ns"]
+        if day_name(day) in self.unsorted:
+            order = np.argsort(t, kind="stable")
+            columns = {k: v[order] for k, v in columns.items()}
+            t = columns["time_ns"]
+        lo, hi = np.searchsorted(t, [start_ns, end_ns], side="left")
+        return Series(*(np.array(columns[c][lo:hi]) for c, _ in COLUMNS))
+
+    def read(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+             sensors: Optional[List[str]] = None) -> Series:
+        """Readings with start_ns <= time_ns < end_ns (open ends when None), sorted by time."""
+        start_ns = np.iinfo(np.int64).min if start_ns is None else int(start_ns)
+        end_ns = np.iinfo(np.int64).max if end_ns is None else int(end_ns)
+        lo, hi = np.searchsorted(self.days, [start_ns // DAY_NS, end_ns // DAY_NS], side="left")
+        parts = [self._read_day(day, start_ns, end_ns) for day in self.days[lo:hi + 1]]
+        if len(parts) == 0:
+            return Series(*(np.zeros(0, dtype) for _, dtype in COLUMNS))
+        series = Series(*(np.concatenate(cols) for cols in zip(*parts)))
+        if sensors is not None:
+            ids = [self.sensors[name] for name in sensors if name in self.sensors]
+            keep = np.isin(series.sensor, ids)
+            series = Series(*(c[keep] for c in series))
+        return series
+
+    def time_range(self):
+        """(first, last) timestamp in the store, or None if it is empty."""
+        first = last = None
+        for day in self.days:
+            t = self._day_columns(day)["time_ns"]
+            if len(t) > 0:
+                first = int(t.min()) if first is None else min(first, int(t.min()))
+                last = int(t.max()) if last is None else max(last, int(t.max()))
+        return None if first is None else (first, last)
+
+
+def compact(path: str):
+    """Sorts the days recorded as out of order in place, so reads can binary search them directly."""
+    store = TimeSeriesStore(path)
+    header = _read_header(path)
+    for name in list(header["unsorted"]):
+        day = day_number(name)
+        columns = store._day_columns(day)
+        order = np.argsort(columns["time_ns"], kind="stable")
+        for column, _ in COLUMNS:
+            fpath = column_path(path, day, column)
+            np.ascontiguousarray(columns[column][order]).tofile(fpath + ".tmp")
+        for column, _ in COLUMNS:
+            fpath = column_path(path, day, column)
+            os.replace(fpath + ".tmp", fpath)
+        header["unsorted"].remove(name)
+        _write_header(path, header)
+
+
+def import_text_log(writer: TimeSeriesWriter, file_target: str, sensor: Optional[str] = None,
+                    chunk_lines: int = 1000000) -> int:
+    """Imports "<time_ns>,<reading>" or "<time_ns>,<name>,<reading>" log lines. Returns the readings imported."""
+    if sensor is None:
+        sensor = os.path.splitext(os.path.basename(file_target))[0]
+    count = 0
+    batch_t, batch_v, batch_s = [], [], []
+
+    def _flush():
+        writer.append(np.asarray(batch_t, dtype=np.int64), np.asarray(batch_v), np.asarray(batch_s))
+        batch_t.clear(), batch_v.clear(), batch_s.clear()
+
+    with open(file_target, "r") as f:
+        for line in f:
+            fields = line.strip().split(",")
+            if len(fields) < 2:
+                continue
+            try:
+                time_ns = int(fields[0])
+            except ValueError:
+                continue  # header or corrupt line
+            try:
+                float(fields[1])
+                name, values = sensor, fields[1:]
+            except ValueError:
+                name, values = fields[1], fields[2:]
+            try:
+                values = [float(v) for v in values]
+            except ValueError:
+                continue
+            names = [name] if len(values) == 1 else [f"{name}/{k}" for k in range(len(values))]
+            for n, v in zip(names, values):
+                batch_t.append(time_ns)
+                batch_v.append(v)
+                batch_s.append(writer.sensor_id(n))
+            count += len(values)
+            if len(batch_t) >= chunk_lines:
+                _flush()
+    _flush()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import sensor text logs into a columnar store and summarize it.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--store", type=str, required=True, action="store", help="Path to the store directory")
+    parser.add_argument("-i", "--import_logs", type=str, nargs="*", default=[], action="store", help="Text logs to import")
+    parser.add_argument("-n", "--sensor_name", type=str, default=None, action="store",
+                        help="Sensor name for <time_ns>,<reading> logs; defaults to each file's name")
+    parser.add_argument("--compact", action="store_true", help="Sort out-of-order days on disk")
+    args = parser.parse_args()
+
+    if len(args.import_logs) > 0:
+        writer = TimeSeriesWriter(args.store)
+        for log in args.import_logs:
+            start = time.perf_counter()
+            count = import_text_log(writer, log, args.sensor_name)
+            print(f"Imported {count} readings from {log} in {time.perf_counter() - start:.1f}s")
+        writer.close()
+    if args.compact is True:
+        compact(args.store)
+
+    store = TimeSeriesStore(args.store)
+    extent = store.time_range()
+    print(f"{len(store.days)} days, sensors {sorted(store.sensors)}, unsorted days {sorted(store.unsorted)}")
+    if extent is not None:
+        for name in sorted(store.sensors):
+            n = len(store.read(sensors=[name]).time_ns)
+            print(f"{name}: {n} readings")
+        print(f"time range {extent[0]} - {extent[1]}")
+
+
+if __name__ == "__main__":
+    main()
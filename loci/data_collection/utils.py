@@ -6,8 +6,23 @@ import os
 import cv2
 import time
 import numpy as np
-from typing import Optional
-from vimba import *
+from typing import List, Optional, Union
+
+try:
+    from vimba import *
+except ImportError:  # no Vimba SDK: FrameHandler can still be driven by sim_camera.SimulatedCamera
+    Vimba = None
+    from loci.data_collection.sim_camera import FrameStatus, SimulatedCamera as Camera, SimulatedFrame as Frame
+    VimbaFeatureError = AttributeError  # what a simulated camera raises for features it lacks
+
+from loci.data_collection.frame_writer import FrameWriter, FrameMeta, WriterStream, frame_basename, save_npy
+from loci.data_collection.frame_manifest import FrameManifest
+from loci.data_collection.clock_model import ClockModel
+from loci.data_collection.frame_dedup import TemporalDeduplicator
+from loci.data_collection.live_preview import LivePreview, PreviewStream, window_title
+from loci.data_collection.telemetry import Telemetry
+from loci.imaging.phash import dhash
+from loci.imaging.bayer import demosaic
 
 
 ##############
@@ -23,6 +38,8 @@ def abort(reason: str, return_code: int = 1):
 
 def get_camera(camera_id: Optional[str]) -> Camera:
     """Access the target camera."""
+    if Vimba is None:
+        abort('Vimba is not installed; use load_test.py for a simulated camera. Abort.')
     with Vimba.get_instance() as vimba:
         if camera_id:
             try:
@@ -39,6 +56,20 @@ def get_camera(camera_id: Optional[str]) -> Camera:
             return cams[0]
 
 
+def get_cameras(camera_ids: List[str]) -> List[Camera]:
+    """Access several cameras by id (e.g. for a stereo rig), in the order given."""
+    if Vimba is None:
+        abort('Vimba is not installed; use load_test.py for a simulated camera. Abort.')
+    cams = []
+    with Vimba.get_instance() as vimba:
+        for camera_id in camera_ids:
+            try:
+                cams.append(vimba.get_camera_by_id(camera_id))
+            except VimbaCameraError:
+                abort('Failed to access Camera \'{}\'. Abort.'.format(camera_id))
+    return cams
+
+
 def setup_camera(cam: Camera, fps: int=4, exposure_time: int=4000, gain_setting: int=20, settings_file: str=""):
     """Set consistent camera settings for image logging."""
     with cam:
@@ -105,22 +136,94 @@ def setup_camera(cam: Camera, fps: int=4, exposure_time: int=4000, gain_setting:
         cam.set_pixel_format(cam_formats[2])  # set to maximum bit depth image for GC1380C
 
 
+def set_frame_rate(cam: Camera, fps: float) -> float:
+    """Sets AcquisitionFrameRateAbs, clamped to the camera's range; returns the rate the camera reports."""
+    with cam:
+        feature = cam.get_feature_by_name("AcquisitionFrameRateAbs")
+        try:
+            low, high = feature.get_range()
+            fps = min(max(fps, low), high)
+        except (AttributeError, VimbaFeatureError):
+            pass
+        feature.set(fps)
+        return feature.get()
+
+
 class FrameHandler:
-    def __init__(self, verbose=False, file_target="./"):
-        self.shutdown_event = threading.Event()
-        self.verbose = verbose  # whether to print to terminal or render images
+    def __init__(self, verbose=False, file_target="./", writer: Union[FrameWriter, WriterStream, None] = None,
+                 manifest: Optional[FrameManifest] = None, clock: Optional[ClockModel] = None,
+                 dedup: Optional[TemporalDeduplicator] = None, preview_rate: float = 2., preview_width: int = 680,
+                 save_png: bool = False, telemetry: Optional[Telemetry] = None,
+                 shutdown_event: Optional[threading.Event] = None, name: str = "",
+                 preview: Union[LivePreview, PreviewStream, None] = None):
+        # several handlers (one per camera) can share one shutdown event
+        self.shutdown_event = shutdown_event if shutdown_event is not None else threading.Event()
+        self.name = name  # camera label for the preview window
+        self.verbose = verbose  # whether to print to terminal and show a live preview
         self.file_target = file_target  # where to write images to file
+        if writer is None:
+            writer = FrameWriter(save_npy(file_target))
+        self.writer = writer  # persists frames off of the streaming thread
+        self.manifest = manifest  # records every saved frame, if given
+        self.clock = clock  # estimates jitter-free capture times from the camera clock, if given
+        self.dedup = dedup  # drops near-duplicates of the last kept frame before they are written, if given
+        self.telemetry = telemetry  # counters and latency histograms of the acquisition path, if given
+        self.decimation = 1  # save only every n-th complete frame (set by rate_controller.py)
+        self._complete = 0
+        self._last_id = None
+        self._last_timestamp = None
+        if self.manifest is not None:
+            writer.save_fn = self.manifest.recorder(writer.save_fn)
+        if save_png is True:
+            writer.save_fn = self._with_png(writer.save_fn)
+        if self.telemetry is not None:
+            writer.save_fn = self._timed(writer.save_fn)
+            self.telemetry.add_gauges("writer", writer.stats)
+        self.preview = preview  # renders and handles keys on its own thread; several cameras share one
+        if self.preview is None and self.verbose is True and preview_rate > 0:
+            self.preview = LivePreview(self.shutdown_event, rate=preview_rate, width=preview_width,
+                                       window_name=window_title(name))
 
+    def _with_png(self, save_fn):
+        """Wraps a writer save function to also store a full-resolution rendered png."""
+        def _save(frame_data, meta):
+            name = save_fn(frame_data, meta)
+            frame_transport = demosaic(frame_data) # converts to an opencv color type that renders
+            png_path = os.path.join(self.file_target, f'{frame_basename(meta, "pngimage")}.png')
+            cv2.imwrite(png_path, np.left_shift(frame_transport, 4, out=frame_transport))
+            if self.manifest is not None:
+                self.manifest.add_product(name, "png", png_path)
+            return name
+        return _save
 
-    def __call__(self, cam: Camera, frame: Frame):
-        ENTER_KEY_CODE = 13
+    def _timed(self, save_fn):
+        """Wraps a writer save function to record how long each save (including manifest and png) takes."""
+        def _save(frame_data, meta):
+            start = time.perf_counter_ns()
+            name = save_fn(frame_data, meta)
+            self.telemetry.observe("save", time.perf_counter_ns() - start)
+            return name
+        return _save
+
+    def _observe_frame(self, frame: Frame, status):
+        """Status counts, frame id gaps (frames the camera dropped) and camera time between frames."""
+        self.telemetry.inc("frames", status=getattr(status, "name", status))
+        frame_id = frame.get_id()
+        timestamp = frame.get_timestamp()
+        if self._last_id is not None and frame_id > self._last_id + 1:
+            self.telemetry.inc("frames_missing", frame_id - self._last_id - 1)
+        if self._last_timestamp is not None and timestamp > self._last_timestamp:
+            self.telemetry.observe("frame_interval", timestamp - self._last_timestamp)
+        self._last_id = frame_id
+        self._last_timestamp = timestamp
 
-        key = cv2.waitKey(1)
-        if key == ENTER_KEY_CODE:
-            self.shutdown_event.set()
-            return
+    def __call__(self, cam: Camera, frame: Frame):
+        entry_ns = time.perf_counter_ns()
+        status = frame.get_status()
+        if self.telemetry is not None:
+            self._observe_frame(frame, status)
 
-        elif frame.get_status() == FrameStatus.Complete:
+        if status == FrameStatus.Complete:
             capture_time = time.time_ns()  # time since epoch in seconds
             frame_time = frame.get_timestamp()
 
@@ -130,14 +233,47 @@ class FrameHandler:
             if self.verbose is True:
                 print('{} acquired {} at {} with cam time {}'.format(cam, frame, capture_time, frame_time), flush=True)
 
+            corrected_time = self.clock.update(frame_time, capture_time) if self.clock is not None else 0
+
             frame_data = frame.as_numpy_ndarray() # replaces the original vimba.Frame object with a numpy.ndarray    
-            np.save(os.path.join(self.file_target, f'array_{frame.get_id()}_{capture_time}_{frame_time}'), frame_data)
+            if self.preview is not None:
+                self.preview.offer(frame_data)  # copies only when a preview frame is due
+
+            frame_hash = None
+            self._complete += 1
+            rejected = ""  # why the frame is not saved, if it is not
+            if self.decimation > 1 and self._complete % self.decimation != 0:
+                rejected = "frames_decimated"
+            elif self.dedup is not None:
+                frame_hash = dhash(frame_data)  # well under a millisecond on the binned mosaic
+                if not self.dedup.keep(frame_hash, capture_time):
+                    rejected = "frames_deduplicated"
+            if rejected == "":
+                # copy into the writer pool; disk work happens on the writer threads
+                submit_ns = time.perf_counter_ns()
+                self.writer.submit(frame_data, FrameMeta(frame.get_id(), capture_time, frame_time, corrected_time, frame_hash))
+                if self.telemetry is not None:
+                    self.telemetry.observe("submit", time.perf_counter_ns() - submit_ns)
+            elif self.telemetry is not None:
+                self.telemetry.inc(rejected)
 
-            if self.verbose is True:
-                frame_transport = cv2.cvtColor(frame_data, cv2.COLOR_BAYER_GR2RGB) # converts to an opencv color type that renders
-                # frame_transport = cv2.cvtColor(frame_data, cv2.COLOR_BAYER_RG2RGB) # converts to an opencv color type that renders
-                cv2.imwrite(os.path.join(self.file_target, f'pngimage_{frame.get_id()}_{capture_time}_{frame_time}.png'), frame_transport*16)
-                msg = 'Stream from \'{}\'. Press <Enter> to stop stream.'
-                cv2.imshow(msg.format(cam.get_name()), frame_transport*16)  # creates a nicely rendered image onscreen
-            
         cam.queue_frame(frame)
+        if self.telemetry is not None:
+            self.telemetry.observe("callback", time.perf_counter_ns() - entry_ns)
+
+    def close(self):
+        """Flush any frames still queued for writing."""
+        if self.preview is not None:
+            self.preview.close()
+            print(f"Live preview: {self.preview.stats()}", flush=True)
+        self.writer.close()
+        if self.manifest is not None:
+            self.manifest.close()
+        print(f"Frame writer: {self.writer.stats()}", flush=True)
+        if self.clock is not None:
+            self.clock.close()
+            print(f"Camera clock: {self.clock.stats()}", flush=True)
+        if self.dedup is not None:
+            print(f"Near-duplicate frames: {self.dedup.stats()}", flush=True)
+        if self.telemetry is not None:
+            print(f"Telemetry: {self.telemetry.summary()}", flush=True)
@@ -0,0 +1,81 @@
+"""Fast image products (binned, planar, full demosaic) computed directly from raw 12-bit GR Bayer frames."""
+
+import cv2
+import numpy as np
+from typing import NamedTuple, Optional
+
+
+FULL_SCALE = 4095  # 12-bit sensor
+DECODE_MODES = ("full", "fast")
+
+
+class BayerPlanes(NamedTuple):
+    """Colour planes of a Bayer frame, as strided views of the raw data; c0 and c2 become demosaic channels 0 and 2."""
+    c0: np.ndarray
+    g_even: np.ndarray
+    g_odd: np.ndarray
+    c2: np.ndarray
+
+
+def as_2d(raw: np.ndarray) -> np.ndarray:
+    """Drops the trailing singleton channel Vimba gives Bayer frames, without copying."""
+    return raw[..., 0] if raw.ndim == 3 else raw
+
+
+def even_crop(raw: np.ndarray) -> np.ndarray:
+    """2D view of raw cropped to whole 2x2 Bayer cells."""
+    raw = as_2d(raw)
+    return raw[:raw.shape[0] // 2 * 2, :raw.shape[1] // 2 * 2]
+
+
+def planes(raw: np.ndarray) -> BayerPlanes:
+    """The four half-resolution colour planes, as views of raw (nothing is copied)."""
+    raw = even_crop(raw)
+    return BayerPlanes(raw[1::2, 0::2], raw[0::2, 0::2], raw[1::2, 1::2], raw[0::2, 1::2])
+
+
+def demosaic(raw: np.ndarray) -> np.ndarray:
+    """Full-resolution colour image (bilinear demosaic), the scripts' original decoding."""
+    return cv2.cvtColor(raw, cv2.COLOR_BAYER_GR2RGB)
+
+
+def bin_gray(raw: np.ndarray) -> np.ndarray:
+    """Half-resolution luminance: the mean of each 2x2 Bayer cell, (R + 2G + B) / 4."""
+    raw = even_crop(raw)  # output pixel (u, v) is centred on full-resolution (2u + 0.5, 2v + 0.5)
+    return cv2.resize(raw, (raw.shape[1] // 2, raw.shape[0] // 2), interpolation=cv2.INTER_AREA)
+
+
+def bin_color(raw: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Half-resolution colour image, one pixel per 2x2 Bayer cell, in the channel order of demosaic()."""
+    p = planes(raw)
+    green = cv2.addWeighted(p.g_even, 0.5, p.g_odd, 0.5, 0)
+    return cv2.merge([p.c0, green, p.c2], out)
+
+
+def decode(raw: np.ndarray, mode: str = "full") -> np.ndarray:
+    """Colour image of a raw frame: full resolution ("full") or 2x2 superpixels ("fast")."""
+    if mode == "full":
+        return demosaic(raw)
+    if mode == "fast":
+        return bin_color(raw)
+    raise ValueError(f"Unknown decode mode {mode}, choose from {DECODE_MODES}")
+
+
+def decode_scale(mode: str) -> int:
+    """Full-resolution pixels per decoded pixel, along each axis."""
+    return 2 if mode == "fast" else 1
+
+
+def scale_to_uint8(img: np.ndarray, high: float = FULL_SCALE, low: float = 0,
+                   out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Maps [low, high] linearly onto [0, 255] and clips, in one pass, into out if given."""
+    if low != 0:
+        img = cv2.subtract(img, (low,) * 4)  # saturates at 0 for unsigned data
+        if not np.issubdtype(img.dtype, np.unsignedinteger):
+            img = cv2.max(img, 0)
+    return cv2.convertScaleAbs(img, out, alpha=255. / (high - low))
+
+
+def to_uint8(img: np.ndarray) -> np.ndarray:
+    """Min-max stretch to uint8, as the scripts do for display and detection."""
+    return cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
@@ -0,0 +1,112 @@
+"""Micro-benchmark of the Bayer decoding paths in bayer.py: ms and peak memory per frame, and agreement.
+
+usage:
+    benchmark_bayer.py [-f <image_folder_target>] [-sh <synthetic_shape>] [-n <repeats>]
+"""
+
+import argparse
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+from loci.data_collection.frame_io import iter_frames
+from loci.data_collection.sim_camera import synthetic_frames
+from loci.data_collection.image_npy_to_png import frame_to_png
+from loci.data_collection.live_preview import preview_image
+from loci.imaging.bayer import as_2d, bin_color, bin_gray, demosaic, planes, scale_to_uint8, to_uint8
+
+
+def legacy_png(raw: np.ndarray) -> np.ndarray:
+    """image_npy_to_png.frame_to_png as originally written."""
+    img = cv2.cvtColor(raw, cv2.COLOR_BAYER_GR2RGB)
+    img = img*16
+    return img[220:-210, 110:-60, :]
+
+
+def legacy_preview(raw: np.ndarray, width: int = 680) -> np.ndarray:
+    img = to_uint8(cv2.cvtColor(raw, cv2.COLOR_BAYER_GR2RGB))
+    return cv2.resize(img, (width, round(img.shape[0] * width / img.shape[1])), interpolation=cv2.INTER_AREA)
+
+
+def legacy_gray(raw: np.ndarray) -> np.ndarray:
+    """detection.frame_to_gray: demosaic, normalize, convert to gray."""
+    img = cv2.normalize(cv2.cvtColor(raw, cv2.COLOR_BAYER_GR2RGB), None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def channel_means_planes(raw: np.ndarray) -> np.ndarray:
+    p = planes(raw)
+    green = (cv2.mean(p.g_even)[0] + cv2.mean(p.g_odd)[0]) / 2
+    return np.array([cv2.mean(p.c0)[0], green, cv2.mean(p.c2)[0]])
+
+
+def measure(fn, frames: list, repeats: int):
+    """(ms per frame, peak MB allocated by one call)."""
+    tracemalloc.start()
+    fn(frames[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for raw in frames:
+            fn(raw)
+    return (time.perf_counter() - start) / (repeats * len(frames)) * 1e3, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Bayer decoding paths",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--file_target", type=str, default="", action="store", help="Optional path to image targets")
+    parser.add_argument("-sh", "--shape", type=str, default="1024x1360", action="store", help="Synthetic frame size, HxW")
+    parser.add_argument("-n", "--repeats", type=int, default=5, action="store", help="Timing repeats over the frames")
+    args = parser.parse_args()
+
+    if args.file_target != "":
+        frames = [raw for _, raw in zip(range(8), iter_frames(args.file_target))]
+    else:
+        frames = synthetic_frames(tuple(int(v) for v in args.shape.split("x")), count=4)
+    print(f"{len(frames)} frames of shape {frames[0].shape}, raw {frames[0].nbytes / 2**20:.1f} MB each")
+
+    out8 = np.empty(bin_color(frames[0]).shape, np.uint8)
+    tasks = {
+        "png": {"original (full, 16-bit)": legacy_png,
+                "full, 16-bit": lambda raw: frame_to_png(raw, "full"),
+                "full, 8-bit": lambda raw: frame_to_png(raw, "full", eight_bit=True),
+                "fast, 16-bit": lambda raw: frame_to_png(raw, "fast"),
+                "fast, 8-bit": lambda raw: frame_to_png(raw, "fast", eight_bit=True)},
+        "preview": {"original (demosaic)": legacy_preview,
+                    "bin_color + scale_to_uint8": preview_image},
+        "gray": {"original (demosaic)": legacy_gray,
+                 "bin_gray + to_uint8": lambda raw: to_uint8(bin_gray(raw))},
+        "statistics": {"original (demosaic)": lambda raw: np.array(cv2.mean(demosaic(raw))[:3]),
+                       "plane views": channel_means_planes},
+        "decode": {"demosaic": demosaic,
+                   "bin_color": bin_color,
+                   "bin_color into buffer + scale_to_uint8 in place": lambda raw: scale_to_uint8(bin_color(raw), out=out8),
+                   "bin_gray": bin_gray,
+                   "planes (views)": planes},
+    }
+    for task, paths in tasks.items():
+        print(f"{task}:")
+        base_ms = None
+        for name, fn in paths.items():
+            ms, mb = measure(fn, frames, args.repeats)
+            base_ms = ms if base_ms is None else base_ms
+            print(f"    {name:>48}: {ms:8.2f} ms/frame {base_ms / ms:7.1f}x  peak {mb:7.2f} MB")
+
+    # agreement of the fast paths with an area-downscaled full demosaic
+    raw = frames[0]
+    full = demosaic(raw).astype(np.float32)
+    h, w = as_2d(raw).shape[0] // 2, as_2d(raw).shape[1] // 2
+    reference = cv2.resize(full, (w, h), interpolation=cv2.INTER_AREA)
+    color_err = np.abs(bin_color(raw).astype(np.float32) - reference)[2:-2, 2:-2]
+    gray_err = np.abs(bin_gray(raw).astype(np.float32) - reference.mean(axis=2))[2:-2, 2:-2]
+    means = np.array(cv2.mean(demosaic(raw))[:3])
+    print(f"bin_color vs downscaled demosaic: mean {color_err.mean():.1f}, max {color_err.max():.0f} (of 4095)")
+    print(f"bin_gray vs downscaled demosaic gray: mean {gray_err.mean():.1f}, max {gray_err.max():.0f} (of 4095)")
+    print(f"channel means, demosaic {np.round(means, 1)} vs planes {np.round(channel_means_planes(raw), 1)}")
+
+
+if __name__ == "__main__":
+    main()
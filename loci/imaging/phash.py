@@ -0,0 +1,31 @@
+"""Perceptual difference hash (dHash) of raw Bayer frames."""
+
+import cv2
+import numpy as np
+
+from loci.imaging.bayer import bin_gray
+
+
+def dhash(raw: np.ndarray, size: int = 8) -> int:
+    """size * size bit difference hash of a raw frame, as a Python int."""
+    gray = bin_gray(raw)
+    h, w = gray.shape
+    if h >= 8 * size and w >= 8 * (size + 1):
+        gray = cv2.resize(gray, (w // 8, h // 8), interpolation=cv2.INTER_AREA)
+    tiny = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA).astype(np.int32)
+    bits = np.packbits(tiny[:, 1:] > tiny[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")  # int.bit_count needs Python 3.10
+
+
+def to_signed(h: int) -> int:
+    """64-bit hash as a signed integer (how SQLite stores it)."""
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def from_signed(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
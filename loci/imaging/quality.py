@@ -0,0 +1,65 @@
+"""Image-quality metrics computed on the 2x2 binned luminance of a raw Bayer frame."""
+
+import cv2
+import numpy as np
+from typing import NamedTuple, Optional
+
+from loci.imaging.bayer import bin_gray
+
+
+FULL_SCALE = 4095  # 12-bit sensor
+CLIP_FRACTION = 0.02
+
+
+class QualityScore(NamedTuple):
+    sharpness: float  # variance of the Laplacian
+    tenengrad: float  # mean squared Sobel gradient magnitude
+    clip_low: float  # fraction of pixels in the bottom 2% of the range
+    clip_high: float  # fraction of pixels in the top 2% of the range
+    contrast: float  # RMS contrast, std / mean
+    dynamic_range: float  # (99th - 1st percentile) / full scale
+    mean: float  # mean / full scale
+
+
+class QualityThresholds(NamedTuple):
+    """Limits a frame must meet to be used; None disables a limit."""
+    min_sharpness: Optional[float] = None
+    max_clip_low: Optional[float] = None
+    max_clip_high: Optional[float] = None
+    min_contrast: Optional[float] = None
+
+    def passes(self, score: QualityScore) -> bool:
+        return ((self.min_sharpness is None or score.sharpness >= self.min_sharpness) and
+                (self.max_clip_low is None or score.clip_low <= self.max_clip_low) and
+                (self.max_clip_high is None or score.clip_high <= self.max_clip_high) and
+                (self.min_contrast is None or score.contrast >= self.min_contrast))
+
+
+def score_luminance(gray: np.ndarray, full_scale: int = FULL_SCALE) -> QualityScore:
+    """Metrics of an integer luminance image with values in [0, full_scale]."""
+    lap = cv2.Laplacian(gray, cv2.CV_32F, ksize=3)
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    _, lap_std = cv2.meanStdDev(lap)
+    tenengrad = (cv2.norm(gx, cv2.NORM_L2SQR) + cv2.norm(gy, cv2.NORM_L2SQR)) / gray.size  # mean of gx^2 + gy^2
+
+    hist = np.bincount(np.minimum(gray.ravel(), full_scale), minlength=full_scale + 1)
+    n = gray.size
+    cdf = np.cumsum(hist)
+    edge = int(CLIP_FRACTION * full_scale)
+    levels = np.arange(full_scale + 1, dtype=np.float64)
+    mean = float(hist @ levels) / n
+    std = np.sqrt(max(float(hist @ levels ** 2) / n - mean ** 2, 0.))
+    p1, p99 = np.searchsorted(cdf, [0.01 * n, 0.99 * n])
+    return QualityScore(sharpness=float(lap_std[0, 0]) ** 2,
+                        tenengrad=tenengrad,
+                        clip_low=float(cdf[edge]) / n,
+                        clip_high=float(n - cdf[full_scale - edge - 1]) / n,
+                        contrast=std / mean if mean > 0 else 0.,
+                        dynamic_range=float(p99 - p1) / full_scale,
+                        mean=mean / full_scale)
+
+
+def score_raw(raw: np.ndarray) -> QualityScore:
+    """Metrics of a raw 12-bit Bayer frame, from its binned luminance."""
+    return score_luminance(bin_gray(raw))
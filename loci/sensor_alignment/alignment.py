@@ -0,0 +1,151 @@
+"""Aligns frame timestamps against a time-ordered sensor or pose log streamed in chunks."""
+
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Optional, Tuple
+
+
+METHODS = ("nearest", "linear")
+
+
+def sum_sorted(t: np.ndarray, sums: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Collapses repeated timestamps of a sorted series of (sum, count) samples by adding them up."""
+    if len(t) < 2:
+        return t, sums, counts
+    keep = np.r_[True, np.diff(t) > 0]
+    if keep.all():
+        return t, sums, counts
+    starts = np.flatnonzero(keep)
+    return t[starts], np.add.reduceat(sums, starts), np.add.reduceat(counts, starts)
+
+
+def dedup_sorted(t: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Collapses repeated timestamps of a sorted series into one sample with the mean value."""
+    t, sums, counts = sum_sorted(t, values, np.ones(len(t)))
+    return t, sums / counts
+
+
+def align_nearest(query_t: np.ndarray, ref_t: np.ndarray, ref_v: np.ndarray,
+                  max_gap: Optional[float] = None) -> np.ndarray:
+    """Value of the nearest reference sample (earlier one on ties) for each query time."""
+    n = len(ref_t)
+    idx = np.searchsorted(ref_t, query_t)
+    left = np.clip(idx - 1, 0, n - 1)
+    right = np.clip(idx, 0, n - 1)
+    pick = np.where(ref_t[right] - query_t < query_t - ref_t[left], right, left)
+    out = ref_v[pick].astype(np.float64)
+    if max_gap is not None:
+        out[np.abs(ref_t[pick] - query_t) > max_gap] = np.nan
+    return out
+
+
+def align_linear(query_t: np.ndarray, ref_t: np.ndarray, ref_v: np.ndarray,
+                 max_gap: Optional[float] = None) -> np.ndarray:
+    """Linear interpolation of the reference samples at each query time; NaN outside their span."""
+    out = np.interp(query_t, ref_t, ref_v, left=np.nan, right=np.nan)
+    if max_gap is not None and len(ref_t) > 1:
+        idx = np.clip(np.searchsorted(ref_t, query_t, side="right"), 1, len(ref_t) - 1)
+        exact = (ref_t[idx - 1] == query_t) | (ref_t[idx] == query_t)  # a sample at the query time needs no bracket
+        out[(ref_t[idx] - ref_t[idx - 1] > max_gap) & ~exact] = np.nan
+    return out
+
+
+class StreamingAligner:
+    """Resolves sorted query times against a log fed in time-ordered chunks with feed(); finish() returns the result."""
+
+    def __init__(self, query_t: np.ndarray, num_columns: int, method: str = "linear", max_gap: Optional[float] = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown alignment method {method}, choose one of {METHODS}")
+        query_t = np.asarray(query_t, dtype=np.float64)
+        self.order = np.argsort(query_t, kind="stable")
+        self.q = query_t[self.order]
+        self.method = method
+        self.max_gap = max_gap
+        self.out = np.full((len(self.q), num_columns), np.nan)
+        self.done = np.zeros(num_columns, dtype=int)  # queries resolved so far, per column
+        self.carry = [None] * num_columns  # last final (t, value) per column
+        # (t, sum, count) of the last timestamp per column, which the next chunk may repeat
+        self.pending = [None] * num_columns
+        self.last_t = -np.inf
+
+    def _align(self, query_t, ref_t, ref_v):
+        if self.method == "nearest":
+            return align_nearest(query_t, ref_t, ref_v, self.max_gap)
+        return align_linear(query_t, ref_t, ref_v, self.max_gap)
+
+    def feed(self, t: np.ndarray, values: np.ndarray):
+        """Adds one chunk of the log: times (n,) and values (n, num_columns)."""
+        t = np.asarray(t, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(t), -1)
+        if len(t) == 0:
+            return
+        if np.any(np.diff(t) < 0):
+            order = np.argsort(t, kind="stable")
+            t, values = t[order], values[order]
+        if t[0] < self.last_t:
+            raise ValueError("Log chunks must be in time order")
+        self.last_t = t[-1]
+
+        for c in range(values.shape[1]):
+            valid = ~np.isnan(values[:, c])
+            tc, sums, counts = t[valid], values[valid, c], np.ones(np.count_nonzero(valid))
+            if self.pending[c] is not None:
+                pt, psum, pcount = self.pending[c]
+                tc, sums, counts = np.r_[pt, tc], np.r_[psum, sums], np.r_[pcount, counts]
+            if len(tc) == 0:
+                continue
+            tc, sums, counts = sum_sorted(tc, sums, counts)
+            # the last timestamp stays pending: the next chunk may repeat it
+            self.pending[c] = (tc[-1], sums[-1], counts[-1])
+            tc, vc = tc[:-1], sums[:-1] / counts[:-1]
+            if self.carry[c] is not None:
+                tc, vc = np.r_[self.carry[c][0], tc], np.r_[self.carry[c][1], vc]
+            if len(tc) == 0:
+                continue
+            # queries up to the last final sample are final: their neighbours are all in this block
+            lo, hi = self.done[c], np.searchsorted(self.q, tc[-1], side="right")
+            if hi > lo:
+                self.out[lo:hi, c] = self._align(self.q[lo:hi], tc, vc)
+            self.done[c] = max(lo, hi)
+            self.carry[c] = (tc[-1], vc[-1])
+
+    def finish(self) -> np.ndarray:
+        """Resolves queries after the end of the log; returns the aligned values in the input order."""
+        for c, (carry, pending) in enumerate(zip(self.carry, self.pending)):
+            lo = self.done[c]
+            samples = ([carry] if carry is not None else []) + ([(pending[0], pending[1] / pending[2])] if pending is not None else [])
+            if len(samples) > 0 and lo < len(self.q):
+                ref_t, ref_v = (np.array(v, dtype=np.float64) for v in zip(*samples))
+                self.out[lo:, c] = self._align(self.q[lo:], ref_t, ref_v)
+            self.done[c] = len(self.q)
+            self.pending[c] = None
+        out = np.empty_like(self.out)
+        out[self.order] = self.out
+        return out
+
+
+def iter_log_chunks(log_file: str, time_column: str = "timestamp",
+                    chunk_rows: int = 1000000) -> Iterator[Tuple[np.ndarray, np.ndarray, List[str]]]:
+    """Streams (times, values, value column names) from a csv log with a header row."""
+    for chunk in pd.read_csv(log_file, header=0, dtype=float, chunksize=chunk_rows):
+        columns = [c for c in chunk.columns if c != time_column]
+        yield chunk[time_column].to_numpy(), chunk[columns].to_numpy(), columns
+
+
+def align_to_log(file_names: List[str], file_times: np.ndarray, log_file: str, method: str = "linear",
+                 max_gap: Optional[float] = None, time_column: str = "timestamp",
+                 chunk_rows: int = 1000000) -> pd.DataFrame:
+    """Log values at every frame time, indexed by file_time (sorted) with a file_name column."""
+    file_times = np.asarray(file_times, dtype=np.float64)
+    aligner, columns = None, None
+    for t, values, chunk_columns in iter_log_chunks(log_file, time_column, chunk_rows):
+        if aligner is None:
+            columns = chunk_columns
+            aligner = StreamingAligner(file_times, len(columns), method=method, max_gap=max_gap)
+        aligner.feed(t, values)
+    if aligner is None:
+        raise ValueError(f"{log_file} has no rows")
+    df = pd.DataFrame(aligner.finish(), columns=columns)
+    df.insert(0, "file_name", list(file_names))
+    df.index = pd.Index(file_times, name="file_time")
+    return df.sort_index(axis=0, kind="stable")
@@ -0,0 +1,86 @@
+"""Compares the streaming alignment engine with the original concat + interpolate approach on a synthetic log.
+
+usage:
+    benchmark_alignment.py [-r <pose_rows>] [-n <frames>] [-c <chunk_rows>] [--skip_legacy]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from loci.sensor_alignment.alignment import align_to_log
+
+
+def synthetic_log(fpath: str, rows: int, rate: float = 10., seed: int = 0):
+    """Writes a pymavlink-style csv: timestamp, Lat, Lng, Alt at rate Hz with jitter, duplicates and a dropout."""
+    rng = np.random.default_rng(seed)
+    t = 1.7e9 + np.arange(rows) / rate + rng.uniform(0, 0.2 / rate, rows)
+    dup = rng.random(rows) < 0.01
+    t[1:][dup[1:]] = t[:-1][dup[1:]]  # ~1% repeated timestamps
+    drop = slice(rows // 2, rows // 2 + int(60 * rate))  # one minute without fixes
+    keep = np.ones(rows, dtype=bool)
+    keep[drop] = False
+    phase = 2 * np.pi * t / 600.
+    df = pd.DataFrame(dict(timestamp=t, Lat=18.3 + 1e-3 * np.sin(phase), Lng=-64.7 + 1e-3 * np.cos(phase),
+                           Alt=-5. + 0.5 * np.sin(3 * phase)))
+    df[keep].to_csv(fpath, index=False, float_format="%.9f")
+    return t[0], t[-1]
+
+
+def legacy_align(file_names, file_times, log_file, method):
+    """The original match_timestamps.py merge, with repeated pose timestamps dropped so it can run."""
+    df = pd.DataFrame(dict(file_name=file_names, file_time=file_times))
+    df.set_index("file_time", inplace=True)
+    df.sort_index(axis=0, inplace=True)
+    pos_df = pd.read_csv(log_file, header=0, dtype=float)
+    pos_df.set_index("timestamp", inplace=True)
+    pos_df.sort_index(axis=0, inplace=True)
+    # the original fails on repeated timestamps ("Reindexing only valid with uniquely valued Index")
+    pos_df = pos_df[~pos_df.index.duplicated(keep="first")]
+    ind = df.index
+    merged = pd.concat([df, pos_df], axis=1).sort_index(axis=0)
+    merged = merged[pos_df.columns]  # newer pandas refuses to interpolate the file_name strings
+    if method == "nearest":
+        interpolated = merged.interpolate(method="nearest")
+    else:
+        interpolated = merged.interpolate(method="index")
+    return interpolated.loc[ind]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark timestamp alignment", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-r", "--rows", type=int, default=2000000, action="store", help="Pose log rows")
+    parser.add_argument("-n", "--frames", type=int, default=300000, action="store", help="Frames to align")
+    parser.add_argument("-c", "--chunk_rows", type=int, default=1000000, action="store", help="Pose rows per chunk")
+    parser.add_argument("--skip_legacy", action="store_true", help="Only time the streaming engine")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, "poses.csv")
+        start = time.perf_counter()
+        t0, t1 = synthetic_log(log_file, args.rows)
+        print(f"wrote {args.rows} pose rows in {time.perf_counter() - start:.1f}s")
+        file_times = np.sort(np.random.default_rng(1).uniform(t0, t1, args.frames))
+        file_names = [f"png_array_{i}_{int(ft * 1e9)}_0.png" for i, ft in enumerate(file_times)]
+
+        for method in ("nearest", "linear"):
+            start = time.perf_counter()
+            aligned = align_to_log(file_names, file_times, log_file, method=method, chunk_rows=args.chunk_rows)
+            engine_s = time.perf_counter() - start
+            print(f"{method:8s} streaming engine: {engine_s:6.2f}s")
+            if args.skip_legacy is True:
+                continue
+            start = time.perf_counter()
+            legacy = legacy_align(file_names, file_times, log_file, method)
+            legacy_s = time.perf_counter() - start
+            print(f"{method:8s} concat + interpolate: {legacy_s:6.2f}s ({legacy_s / engine_s:.1f}x slower)")
+            both = np.isfinite(aligned.Lat.values) & np.isfinite(legacy.Lat.values)
+            diff = np.abs(aligned.Lat.values[both] - legacy.Lat.values[both])
+            print(f"{method:8s} median / 99th percentile |Lat| difference: {np.median(diff):.2e} / {np.percentile(diff, 99):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,127 @@
-"""Creates a file that can be ingested by metashape system for camera pose data."""
+"""Creates a file that can be ingested by metashape system for camera pose data.
+
+Reads the aligned csv from match_timestamps.py, thins the images spatially, and writes a
+Metashape reference csv (label, longitude, latitude, altitude[, yaw]) for the chosen images.
+    grid     -- keeps one image per --spacing metre cell (and heading sector)
+    baseline -- keeps no two images closer than --spacing metres
+
+usage:
+    create_pose_format.py -f <aligned_csv> -w <reference_csv> [-m <grid|baseline>] [-s <spacing_m>]
+    [-hb <heading_bins>] [-sc <score_column>] [-l <image_list_txt>]
+"""
 
 import os
+import argparse
+import numpy as np
 import pandas
+from scipy.spatial import cKDTree
+from typing import Optional
+
+
+EARTH_RADIUS = 6371008.8  # metres
+HEADING_COLUMNS = ("Yaw", "yaw", "Heading", "heading", "Hdg", "GCrs")
+
+
+def project_local(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """(N, 2) east/north metres about the mean position (equirectangular)."""
+    lat0 = np.radians(np.nanmean(lat))
+    lng0 = np.nanmean(lng)
+    x = np.radians(lng - lng0) * np.cos(lat0) * EARTH_RADIUS
+    y = np.radians(lat - np.nanmean(lat)) * EARTH_RADIUS
+    return np.column_stack([x, y])
+
+
+def thin_grid(xy: np.ndarray, spacing: float, heading: Optional[np.ndarray] = None, heading_bins: int = 1,
+              score: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of one image per occupied grid (and heading) cell, in input order."""
+    cells = np.floor(xy / spacing).astype(np.int64)
+    keys = [cells[:, 0], cells[:, 1]]
+    if heading is not None and heading_bins > 1:
+        keys.append(np.floor((np.mod(heading, 360.) / 360.) * heading_bins).astype(np.int64))
+    if score is not None:
+        rank = -np.nan_to_num(score, nan=-np.inf)  # best score first
+    else:
+        rank = np.sum((xy - (cells + 0.5) * spacing) ** 2, axis=1)  # nearest the cell centre first
+    # sort by cell, then rank; the first image of each cell is its best
+    order = np.lexsort([rank] + keys[::-1])
+    sorted_keys = np.column_stack(keys)[order]
+    first = np.r_[True, np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)]
+    return np.sort(order[first])
+
+
+def thin_baseline(xy: np.ndarray, spacing: float, heading: Optional[np.ndarray] = None, heading_tolerance: float = 45.,
+                  score: Optional[np.ndarray] = None) -> np.ndarray:
+    """Greedy minimum-baseline selection. Indices of the kept images, in input order."""
+    order = np.argsort(-np.nan_to_num(score, nan=-np.inf), kind="stable") if score is not None else np.arange(len(xy))
+    tree = cKDTree(xy)
+    suppressed = np.zeros(len(xy), dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        neighbours = np.asarray(tree.query_ball_point(xy[i], spacing), dtype=np.int64)
+        if heading is not None and len(neighbours) > 0:
+            diff = np.abs((heading[neighbours] - heading[i] + 180.) % 360. - 180.)
+            neighbours = neighbours[diff <= heading_tolerance]
+        suppressed[neighbours] = True
+    return np.sort(np.asarray(keep, dtype=np.int64))
+
+
+def find_heading_column(df: pandas.DataFrame) -> Optional[str]:
+    for column in HEADING_COLUMNS:
+        if column in df.columns:
+            return column
+    return None
+
+
+def write_reference(df: pandas.DataFrame, file_target: str, heading_column: Optional[str] = None):
+    """Writes a Metashape reference csv (label, longitude, latitude, altitude[, yaw])."""
+    columns = {"file_name": "label", "Lng": "longitude", "Lat": "latitude", "Alt": "altitude"}
+    if heading_column is not None:
+        columns[heading_column] = "yaw"
+    out = df[list(columns)].rename(columns=columns)
+    with open(file_target, "w") as f:
+        f.write("# " + ",".join(out.columns) + "\n")
+        out.to_csv(f, header=False, index=False, float_format="%.8f")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thin aligned images spatially and write a Metashape reference file.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-f", "--pose_file", type=str, action="store", default="./output/save_pose_reference.csv", help="Aligned image/GPS csv from match_timestamps.py")
+    parser.add_argument("-w", "--write_file", type=str, action="store", default="./output/metashape_reference.csv", help="Path for the Metashape reference csv")
+    parser.add_argument("-m", "--method", type=str, action="store", default="grid", choices=("grid", "baseline", "none"), help="Spatial thinning method")
+    parser.add_argument("-s", "--spacing", type=float, action="store", default=0.5, help="Grid cell size or minimum baseline, metres")
+    parser.add_argument("-hb", "--heading_bins", type=int, action="store", default=1, help="Heading sectors per grid cell (grid method)")
+    parser.add_argument("-ht", "--heading_tolerance", type=float, action="store", default=45., help="Images with headings further apart than this, degrees, never suppress each other (baseline method)")
+    parser.add_argument("-sc", "--score_column", type=str, action="store", default="", help="Column to prefer images by (higher is better)")
+    parser.add_argument("-l", "--image_list", type=str, action="store", default="", help="Also write the chosen image names, one per line")
+    args = parser.parse_args()
+
     # Specify the set of chosen images
     # Extract GPS data from interpolated file
+    df = pandas.read_csv(args.pose_file, header=0)
+    df = df[np.isfinite(df.Lat.values) & np.isfinite(df.Lng.values)].reset_index(drop=True)
+    heading_column = find_heading_column(df)
+    heading = df[heading_column].to_numpy(dtype=float) if heading_column is not None else None
+    score = df[args.score_column].to_numpy(dtype=float) if args.score_column != "" else None
+    xy = project_local(df.Lat.to_numpy(dtype=float), df.Lng.to_numpy(dtype=float))
+
+    if args.method == "grid":
+        keep = thin_grid(xy, args.spacing, heading=heading, heading_bins=args.heading_bins, score=score)
+    elif args.method == "baseline":
+        keep = thin_baseline(xy, args.spacing, heading=heading, heading_tolerance=args.heading_tolerance, score=score)
+    else:
+        keep = np.arange(len(df))
+    chosen = df.iloc[keep]
+    print(f"Kept {len(chosen)} of {len(df)} positioned images ({args.method}, {args.spacing} m).")
+
     # Create and save metashape appropriate pose formats
-    pass
+    write_path = os.path.dirname(args.write_file)
+    if write_path != "" and os.path.exists(write_path) is False:
+        os.makedirs(write_path)
+    write_reference(chosen, args.write_file, heading_column)
+    if args.image_list != "":
+        with open(args.image_list, "w") as f:
+            f.write("\n".join(chosen.file_name.astype(str)) + "\n")
@@ -1,20 +1,37 @@
-"""Aligns GPS data with corresponding image pointers."""
+"""Aligns GPS data with corresponding image pointers.
+
+usage:
+    match_timestamps.py -f <image_folder> -p <pose_csv> [-w <write_file>] [-m <closest|interpolate_gps>]
+    [-g <max_gap_seconds>] [-c <chunk_rows>] [-t <host|corrected>]
+"""
 
 import os
-import pandas as pd
+import sys
 import argparse
+import numpy as np
 import matplotlib.pyplot as plt
 
+from loci.sensor_alignment.alignment import align_to_log
+from loci.data_collection.frame_manifest import open_manifest, parse_frame_name
+from loci.data_collection.clock_model import correct_times
+
+
+INTERP_METHODS = {"closest": "nearest", "interpolate_gps": "linear"}
 
 
 if __name__ == "__main__":
     # Parse command line info
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--image_files", type=str, action="store", default="./", help="Path to file containing images you would like to assign coordinates.")
-    parser.add_argument("-w", "--write_file", type=str, action="store", defaul="./output/save_pose_reference.csv", help="Path for saving the CSV reference of image name and GPS coordinate.")
+    parser.add_argument("-w", "--write_file", type=str, action="store", default="./output/save_pose_reference.csv", help="Path for saving the CSV reference of image name and GPS coordinate.")
     parser.add_argument("-p", "--poses", type=str, action="store", default=None, help="File which contains GPS data and times.")
-    parser.add_argument("-m", "--interp_method", type=str, action="store", default="interpolate_gps",
+    parser.add_argument("-m", "--interp_method", type=str, action="store", default="interpolate_gps", choices=tuple(INTERP_METHODS),
                          help="Set method for inteprolating; choose closest (assigns nearest GPS pose in time to camera image) or interpolate_gps (guesses GPS coordinate)")
+    parser.add_argument("-g", "--max_gap", type=float, action="store", default=None,
+                        help="Leave images empty when the nearest GPS fix (closest) or the bracketing fixes (interpolate_gps) are further apart than this, seconds")
+    parser.add_argument("-t", "--time_source", type=str, action="store", default="host", choices=("host", "corrected"),
+                        help="Image times: host callback time, or camera time corrected onto the host clock")
+    parser.add_argument("-c", "--chunk_rows", type=int, action="store", default=1000000, help="GPS rows read per chunk")
 
     args = parser.parse_args()
 
@@ -23,42 +40,34 @@ if __name__ == "__main__":
     pose_target_file = args.poses
     interp_method = args.interp_method
 
-    # Grab the image name
-    fname_labels = []
-    for fname in os.listdir(image_target_path):
-        if "png" in fname:
-            # Make sure that any copies are ignored, for simplicity
-            fname_labels.append(fname)
-
-    # Get image times
-    image_times = [float(fn.split("_")[3])/1e9 for fn in fname_labels]
-
-    # Create a pandas dataframe of the file names and times
-    df = pd.DataFrame(dict(file_name=fname_labels, file_time=image_times))
-    # df.loc[:, "human_readable_timestamp"] = pd.to_datetime(df.file_time, unit="s", utc=True)
-    df.set_index("file_time", inplace=True)
-    df.sort_index(axis=0, inplace=True)
-    print(df)
+    # Grab the image names and times
+    manifest = open_manifest(image_target_path)
+    if manifest is not None:
+        rows = manifest.frames(formats=["png"])
+        manifest.close()
+    else:
+        rows = []
+        with os.scandir(image_target_path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".png") and parse_frame_name(entry.name) is not None:
+                    rows.append((entry.name, *parse_frame_name(entry.name), None))
+        rows.sort(key=lambda row: row[2])
+    if len(rows) == 0:
+        print(f"No png frames found at {image_target_path}.")
+        sys.exit(1)
+    fname_labels = [row[0] for row in rows]
+    capture_ns = np.array([row[2] for row in rows], dtype=np.int64)
+    if args.time_source == "corrected":
+        if len(rows) > 0 and all(row[4] is not None for row in rows):
+            capture_ns = np.array([row[4] for row in rows], dtype=np.int64)
+        else:
+            capture_ns = correct_times(np.array([row[3] for row in rows], dtype=np.int64), capture_ns)
+    image_times = capture_ns/1e9
 
-    # Create a pandas dataframe of the GPS data
+    # Align the images with the GPS data
     ## ASSUMES CREATED USING PYMAVLINKDUMP
-    pos_df = pd.read_csv(pose_target_file, header=0, dtype=float)
-    pos_df["timestamp"] = pos_df.timestamp.values.astype(float)
-    # pos_df.loc[:, "human_readable_timestamp"] = pd.to_datetime(pos_df.timestamp, unit="s", utc=True)
-    pos_df.set_index("timestamp", inplace=True)
-    pos_df.sort_index(axis=0, inplace=True)
-    print(pos_df)
-
-    # Merge the datasets 
-    ind = df.index
-    merged = pd.concat([df, pos_df], axis=1)
-    print(merged)
-    merged = merged.sort_index(axis=0)
-    if interp_method == "closest":
-        interpolated = merged.interpolate(method="nearest")
-    else:
-        interpolated = merged.interpolate(method="index")
-    all_df = interpolated.loc[ind]
+    all_df = align_to_log(fname_labels, image_times, pose_target_file, method=INTERP_METHODS[interp_method],
+                          max_gap=args.max_gap, chunk_rows=args.chunk_rows)
     print(all_df)
 
     # Save
@@ -18,7 +18,7 @@ setup(
     ],
     package_dir={"": "loci"},
     packages=find_packages(where="loci"),
-    install_requires=['numpy',
+    install_requires=['numpy>=1.17',
                       'matplotlib',
                       'scipy',
                       ],
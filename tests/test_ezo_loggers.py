@@ -0,0 +1,63 @@
+"""Both EZO loggers against a ProbeSimulator with a realistic response time."""
+
+import asyncio
+import serial
+
+from loci.data_collection.ezo import EZOReader, BufferedSink, ProbeSimulator
+from loci.data_collection.atlas_temp_acquisition import log_probe
+from loci.data_collection.insitu_logger import ProbeConfig, run_logger
+
+
+def logged_readings(path, column: int):
+    with open(path, "r") as f:
+        return [float(line.strip().split(",")[column]) for line in f if line.strip() != ""]
+
+
+def run_atlas(tmp_path, latency: float, timeout: float, duration: float = 3.5):
+    simulator = ProbeSimulator(value=0., noise=0., latency=latency, step=1.)
+    ser = serial.Serial(simulator.port, 9600, timeout=0.05)
+    sink = BufferedSink(str(tmp_path / "temp.txt"))
+    try:
+        log_probe(EZOReader(ser), sink, rate=1., stats_interval=60., duration=duration, timeout=timeout)
+    finally:
+        sink.close()
+        ser.close()
+        simulator.close()
+    return logged_readings(tmp_path / "temp.txt", 1), simulator.readings
+
+
+def run_insitu(tmp_path, latency: float, timeout: float, duration: float = 4.5):
+    simulator = ProbeSimulator(value=0., noise=0., latency=latency, step=1.)
+    config = ProbeConfig(name="temp", port=simulator.port, rate=1., timeout=timeout)
+    try:
+        asyncio.run(run_logger([config], str(tmp_path / "insitu.txt"), flush_interval=0.5, duration=duration))
+    finally:
+        simulator.close()
+    return logged_readings(tmp_path / "insitu.txt", 2), simulator.readings
+
+
+def test_atlas_logs_each_answer_once_in_order(tmp_path):
+    readings, served = run_atlas(tmp_path, latency=0.3, timeout=1.)
+    assert len(readings) >= 2
+    assert readings == [float(i) for i in range(len(readings))]  # no reading skipped, repeated or stale
+    assert served - len(readings) <= 1  # at most the query cut off by the end of the run
+
+
+def test_atlas_drops_answers_later_than_the_timeout(tmp_path):
+    # the probe answers after the query timed out; the late answer must not pass for the next query's
+    readings, served = run_atlas(tmp_path, latency=0.8, timeout=0.6)
+    assert served >= 2
+    assert readings == []
+
+
+def test_insitu_logs_each_answer_once_in_order(tmp_path):
+    readings, served = run_insitu(tmp_path, latency=0.3, timeout=1.)
+    assert len(readings) >= 2
+    assert readings == [float(i) for i in range(len(readings))]
+    assert served - len(readings) <= 1
+
+
+def test_insitu_drops_answers_later_than_the_timeout(tmp_path):
+    readings, served = run_insitu(tmp_path, latency=0.8, timeout=0.6)
+    assert served >= 2
+    assert readings == []